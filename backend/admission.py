@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import math
+import time
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict
+
+
+class Overloaded(Exception):
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"{key} is at capacity")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class _Upstream:
+    __slots__ = ("limit", "in_use", "waiters", "decreased_at", "duration")
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_use = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.decreased_at = 0.0
+        # Moving average of how long a request holds its slot
+        self.duration: float | None = None
+
+
+class Permit:
+    def __init__(self, limiter: "AdmissionControl", key: str):
+        self._limiter = limiter
+        self._released = False
+        self.key = key
+        self.admitted_at = time.monotonic()
+        self.ttft: float | None = None
+
+    def first_chunk(self):
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.admitted_at
+
+    def release(self, failed: bool = False):
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(self, failed)
+
+
+class AdmissionControl:
+    """
+    Concurrency limit per upstream that adapts to how the upstream copes
+    (AIMD). Every request that reaches its first chunk within `target_ttft`
+    raises the limit by 1/limit, so about one slot per window of requests;
+    a slow first chunk or a failure multiplies it by `backoff`, at most once
+    per `target_ttft`. Requests over the limit wait in a FIFO of `max_queue`
+    for up to `queue_timeout` seconds. Beyond that they are shed with
+    Overloaded, which carries an estimate of when to retry.
+
+    Keys may carry client-supplied URLs, so beyond `max_upstreams` the least
+    recently used upstreams with nothing running or queued are forgotten.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+        target_ttft: float = 5.0,
+        backoff: float = 0.7,
+        enabled: bool = True,
+        max_upstreams: int = 256,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.initial_limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_ttft = target_ttft
+        self.backoff = backoff
+        self.enabled = enabled
+        self.max_upstreams = max_upstreams
+        self._upstreams: OrderedDict[str, _Upstream] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._upstreams)
+
+    def _get(self, key: str) -> _Upstream:
+        upstream = self._upstreams.get(key)
+        if upstream is None:
+            upstream = self._upstreams[key] = _Upstream(float(self.initial_limit))
+            self._evict()
+        else:
+            self._upstreams.move_to_end(key)
+        return upstream
+
+    def _evict(self):
+        overflow = len(self._upstreams) - max(1, self.max_upstreams)
+        if overflow <= 0:
+            return
+        # The newest entry is the one being added, so it is never a candidate
+        idle = [
+            key for key, upstream in list(self._upstreams.items())[:-1]
+            if upstream.in_use == 0 and not upstream.waiters
+        ]
+        for key in idle[:overflow]:
+            del self._upstreams[key]
+
+    def retry_after(self, key: str) -> float:
+        upstream = self._get(key)
+        per_slot = upstream.duration if upstream.duration is not None else self.target_ttft
+        return max(1.0, per_slot * (len(upstream.waiters) + 1) / max(1, int(upstream.limit)))
+
+    async def acquire(self, key: str) -> Permit:
+        if not self.enabled:
+            return Permit(self, key)
+
+        upstream = self._get(key)
+        if upstream.in_use < int(upstream.limit) and not upstream.waiters:
+            upstream.in_use += 1
+            return Permit(self, key)
+
+        if len(upstream.waiters) >= self.max_queue:
+            raise Overloaded(key, self.retry_after(key))
+
+        waiter = asyncio.get_running_loop().create_future()
+        upstream.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(upstream, waiter)
+            raise Overloaded(key, self.retry_after(key))
+        except BaseException:
+            self._abandon(upstream, waiter)
+            raise
+        return Permit(self, key)
+
+    def _abandon(self, upstream: _Upstream, waiter: asyncio.Future):
+        if waiter in upstream.waiters:
+            upstream.waiters.remove(waiter)
+            waiter.cancel()
+        elif waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as the wait ended; pass it on
+            upstream.in_use -= 1
+            self._wake(upstream)
+
+    def _release(self, permit: Permit, failed: bool):
+        if not self.enabled:
+            return
+        upstream = self._get(permit.key)
+        upstream.in_use -= 1
+
+        now = time.monotonic()
+        held = now - permit.admitted_at
+        upstream.duration = held if upstream.duration is None else 0.8 * upstream.duration + 0.2 * held
+
+        slow = permit.ttft is not None and permit.ttft > self.target_ttft
+        if failed or slow:
+            if now - upstream.decreased_at >= self.target_ttft:
+                upstream.decreased_at = now
+                limit = max(self.min_limit, upstream.limit * self.backoff)
+                if int(limit) < int(upstream.limit):
+                    logging.warning(f"Lowering concurrency for {permit.key} to {int(limit)}")
+                upstream.limit = limit
+        elif permit.ttft is not None:
+            upstream.limit = min(self.max_limit, upstream.limit + 1 / upstream.limit)
+
+        self._wake(upstream)
+
+    def _wake(self, upstream: _Upstream):
+        while upstream.waiters and upstream.in_use < int(upstream.limit):
+            waiter = upstream.waiters.popleft()
+            if waiter.done():
+                continue
+            upstream.in_use += 1
+            waiter.set_result(None)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            key: {
+                "limit": int(upstream.limit),
+                "in_use": upstream.in_use,
+                "queued": len(upstream.waiters),
+            }
+            for key, upstream in self._upstreams.items()
+        }
+
+    def clear(self):
+        self._upstreams.clear()
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
@@ -1,26 +1,54 @@
+import asyncio
+import codecs
+import hashlib
+import json
 import logging
+import time
 from backend.generators import anthtropic_stream
 import backend.utils as utils
 import backend.config as config
-import ollama
+import backend.content as content
+import backend.prompt_cache as prompt_cache
+import backend.metrics as metrics
 
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from functools import lru_cache
-from typing import Annotated, Any, AsyncGenerator, Callable, Dict, List, Union
+from typing import TYPE_CHECKING, Annotated, Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Tuple, Union
 from typing import Optional
-from fastapi import Depends, FastAPI, HTTPException, Header, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 from backend.dependencies import get_llama_streamer, get_ollama_streamer
-from backend.database import init_db, save_alignment, get_all_alignments
-
-from google import genai
-from google.genai.errors import APIError
-from openai import OpenAI, APIError
-from anthropic import Anthropic 
+import backend.database as database
+from backend.database import init_db, queue_alignment, get_all_alignments
+from backend.cache import ERROR_MARKERS, is_error_chunk, make_cache_key
+from backend.chunking import split_code
+from backend.batch import multiplex
+from backend.shared_state import LIMITS_SCHEME, StateStore, shutdown_state_executor
+from backend.streaming import CacheSink, PersistenceSink, close_stream, resume_stream
+from backend.admission import Overloaded, Permit, retry_after_header
+from backend.http_pool import HTTPClientPool, base_url
+from backend.local_pool import BackendLease
+from backend.ollama_scheduler import warm_up
+from backend.services import Services
+
+# Provider SDKs are slow to import; each handler imports its own on first use
+if TYPE_CHECKING:
+    import ollama
 
 from fastapi.middleware.cors import CORSMiddleware
-from backend.constants import SYSTEM_PROMPT, SYSTEM_PROMPT_FOR_SNIPPETS
+from backend.constants import (
+    CLOUD_MODELS,
+    LOCAL_PROVIDERS,
+    MAP_REDUCE_EXCERPT_CONTEXT,
+    MAP_REDUCE_MERGE_INSTRUCTIONS,
+    MODEL_NAME,
+    MODEL_NAME_FOR_SNIPPETS,
+    SYSTEM_PROMPT,
+    SYSTEM_PROMPT_FOR_SNIPPETS,
+)
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -31,33 +59,88 @@ def get_settings():
     return config.Settings()
 
 client = None
-settings = get_settings()
 
-# Initialize DB
-init_db()
+def get_services(request: Request) -> Services:
+    return request.app.state.services
 
-# Initialize Limiter
-limiter = Limiter(key_func=get_remote_address)
+# slowapi binds one limiter to the routes when they are decorated, so every
+# app in the process shares it; it reads the limit and keeps its counters in
+# the services of the app serving the request
+current_services: ContextVar[Services] = ContextVar("current_services")
 
-async def init_ollama_client(url: str):
-    try:
-        client = ollama.AsyncClient(host=url)
-        await client.list()
-        return client
-    except Exception as e:
-        logging.error(f"Failed to initialize Ollama client: {e}")
-        client = None
-        return client
+class ServicesContext:
+    """ASGI middleware that makes an app's services the current ones while it serves a request."""
+
+    def __init__(self, app, services: Services):
+        self.app = app
+        self.services = services
+
+    async def __call__(self, scope, receive, send):
+        token = current_services.set(self.services)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_services.reset(token)
+
+def limits_store() -> StateStore:
+    return current_services.get().shared_state
+
+def rate_limit() -> str:
+    return current_services.get().settings.RATE_LIMIT
 
-app = FastAPI(
-    title="Ollama Code Analysis API",
-    description="An API endpoint to analyze code snippets using the Ollama LLM.",
-    version="1.0.0",
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=f"{LIMITS_SCHEME}://",
+    storage_options={"store": limits_store},
 )
 
-# Register Limiter
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# The crypto and database thread pools, the alignment writer and the state
+# store thread belong to the process; the last app to stop shuts them down
+_running_apps = 0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _running_apps
+    services: Services = app.state.services
+    settings = services.settings
+    if _running_apps == 0:
+        utils.dek_cache.max_entries = settings.DEK_CACHE_SIZE
+    _running_apps += 1
+    await asyncio.to_thread(init_db)
+    await asyncio.to_thread(services.shared_state.open)
+    if settings.RSA_PRIVATE_KEY:
+        try:
+            utils.load_private_key(settings.RSA_PRIVATE_KEY)
+        except Exception as e:
+            logging.error(f"Failed to load RSA private key: {e}")
+    app.state.http_pool = HTTPClientPool(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        http2=settings.UPSTREAM_HTTP2,
+        max_clients=settings.UPSTREAM_MAX_CLIENTS,
+    )
+    services.local_backends.start()
+    warmup = None
+    if settings.OLLAMA_HOST and settings.OLLAMA_WARMUP_MODELS:
+        # In the background, so the API serves cloud providers while models load
+        warmup = asyncio.create_task(
+            warm_up(services.ollama_registry, settings.OLLAMA_HOST, settings.OLLAMA_WARMUP_MODELS, services.ollama_keep_alive)
+        )
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+        await app.state.http_pool.aclose()
+        app.state.http_pool = None
+        await services.aclose()
+        _running_apps -= 1
+        if _running_apps == 0:
+            utils.shutdown_crypto_executor()
+            await asyncio.to_thread(database.shutdown)
+            await asyncio.to_thread(shutdown_state_executor)
 
 origins = [
     "http://localhost:5500",
@@ -70,13 +153,7 @@ origins = [
     "http://showcode.parthajeet.xyz",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,  
-    allow_credentials=True,  
-    allow_methods=["*"],  
-    allow_headers=["*"],  
-)
+router = APIRouter()
 
 
 class CodeAnalysisRequest(BaseModel):
@@ -93,6 +170,19 @@ class APIKey(BaseModel):
 class APIKeyPayload(BaseModel):
     data: Dict[str, List[APIKey]]
 
+def record_openai_usage(provider: str, chunk):
+    # With include_usage the last chunk carries usage and no choices; OpenAI
+    # and xAI cache long shared prefixes automatically
+    usage = getattr(chunk, "usage", None)
+    if usage is None or chunk.choices:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_cache.stats.record(
+        provider,
+        prompt_cache.as_count(getattr(details, "cached_tokens", None)) or 0,
+        prompt_cache.as_count(getattr(usage, "prompt_tokens", None)),
+    )
+
 async def analyze_codesnippet_endpoint_llama_server(
     request_data: CodeAnalysisRequest,
     x_local_url: str | None,
@@ -103,19 +193,27 @@ async def analyze_codesnippet_endpoint_llama_server(
         [str, dict[Any, Any]],  
         AsyncGenerator[str, None]
     ],
+    services: Services = None,
 ):
 
-    if not (x_local_snippet_model and x_use_snippet_model and x_local_alignment_model and x_local_url):
+    if not (x_local_snippet_model and x_use_snippet_model != None and x_local_alignment_model and x_local_url):
         raise HTTPException(status_code=400, detail="Incomplete headers")
 
+    targetModel = x_local_snippet_model if x_use_snippet_model else x_local_alignment_model
+    systemPrompt = SYSTEM_PROMPT_FOR_SNIPPETS if x_use_snippet_model else SYSTEM_PROMPT
+
     payload = {
-        "model": x_local_snippet_model,
+        "model": targetModel,
         "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT_FOR_SNIPPETS},
+            {"role": "system", "content": systemPrompt},
             {"role": "user", "content": request_data.code},
         ],
         "stream": True,
         "temperature": 0.5,
+        # Reuse the KV cache of the shared system prompt across requests. No
+        # id_slot: llama-server picks the idle slot whose cached prompt is
+        # most similar, and pinning would queue every request on one slot
+        "cache_prompt": True,
     }
 
     async def generate_stream() -> AsyncGenerator[str, None]:
@@ -132,25 +230,20 @@ async def analyze_codesnippet_endpoint_ollama(
     x_local_snippet_model: str | None,
     x_local_alignment_model: str | None,
     ollama_streamer: Callable[
-        [ollama.AsyncClient | None, str, str, bool],  
+        ["ollama.AsyncClient | None", str, str, bool],  
         AsyncGenerator[str, None]
     ],
+    services: Services,
 ):
 
-    print(x_local_url, x_use_snippet_model, x_local_alignment_model, x_local_snippet_model)
     if not (x_local_url and x_use_snippet_model != None and x_local_alignment_model and x_local_snippet_model):
         raise HTTPException(
             status_code=400,
             detail="One or more invalid headers!"
         )
 
-    try:
-        client = await init_ollama_client(x_local_url)
-    except Exception as e:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Ollama client error: {e}"
-        )
+    ollama_registry = services.ollama_registry
+    client = await ollama_registry.get_client(x_local_url)
 
     model = x_local_snippet_model
 
@@ -166,12 +259,15 @@ async def analyze_codesnippet_endpoint_ollama(
             detail="Ollama client is not initialized. Ensure Ollama is running and accessible.",
         )
 
-    model_dict = await client.list()
-    model_list = model_dict["models"]
-
-    model_list = [ m["model"] for m in model_list ]
+    try:
+        model_available = await ollama_registry.has_model(x_local_url, model)
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Ollama client error: {e}"
+        )
 
-    if model not in model_list:
+    if not model_available:
         raise HTTPException(
             status_code=404,
             detail="Unavailable model"
@@ -179,32 +275,47 @@ async def analyze_codesnippet_endpoint_ollama(
 
     full_prompt = f"{request_data.code}"
 
-    print("x-snippet-model", x_local_snippet_model)
-    print("x-alignment-model", x_local_alignment_model)
-    print("x-use-snippet", x_use_snippet_model)
-    print("if: ", x_local_snippet_model if x_use_snippet_model else x_local_alignment_model)
-    
+    targetModel = x_local_snippet_model if x_use_snippet_model else x_local_alignment_model
+    logging.debug(f"Ollama request for {targetModel} at {x_local_url} (snippet: {x_use_snippet_model})")
+
     async def generate_stream() -> AsyncGenerator[str, None]:
-         async for chunk in ollama_streamer(client, full_prompt, x_local_snippet_model if x_use_snippet_model else x_local_alignment_model, x_use_snippet_model):
-            yield chunk
+        async with services.ollama_scheduler.slot(x_local_url, targetModel):
+            async for chunk in ollama_streamer(
+                client,
+                full_prompt,
+                targetModel,
+                x_use_snippet_model,
+                on_model_missing=lambda _: ollama_registry.invalidate(x_local_url),
+                keep_alive=services.ollama_keep_alive.for_model(targetModel),
+            ):
+                yield chunk
 
     return StreamingResponse(
         generate_stream(), media_type="text/plain" 
     )
 
+def cloud_model(provider: str, x_use_snippet_model: Any) -> str:
+    # Handlers registered without an entry are labelled with no model
+    alignmentModel, snippetModel = CLOUD_MODELS.get(provider, ("", ""))
+    return snippetModel if x_use_snippet_model == 'true' else alignmentModel
+
 async def analyze_codesnippet_endpoint_gemini(
     request_data: CodeAnalysisRequest, 
     x_use_snippet_model: bool | None,
     x_cloud_api_key: str | None,
     x_cloud_encrypted_key: str | None,
     x_cloud_iv: str | None,
+    services: Services,
 ):
 
+    from google import genai
+    from google.genai.errors import APIError
+
     api_key = ""
-    settings = get_settings()
+    settings = services.settings
 
     if x_cloud_api_key and x_cloud_encrypted_key and x_cloud_iv and x_use_snippet_model != None: 
-        api_key = utils.decrypt_envelope(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
+        api_key = await utils.decrypt_envelope_async(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
     elif settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY:
         api_key = settings.SERVER_SIDE_API_KEY
     else:
@@ -214,7 +325,8 @@ async def analyze_codesnippet_endpoint_gemini(
         )
 
     try:
-        gclient = genai.Client(api_key=api_key)
+        lease = services.provider_clients.acquire("gemini", api_key, lambda: genai.Client(api_key=api_key))
+        gclient = lease.client
     except Exception as e:
         logging.error(f"Failed to initialize Gemini client: {e}")
         gclient = None
@@ -239,17 +351,27 @@ async def analyze_codesnippet_endpoint_gemini(
 
     async def generate_stream() -> AsyncGenerator[str, None]:
         try:
-            stream = gclient.models.generate_content_stream(
-                model="gemini-2.5-flash",
+            stream = await gclient.aio.models.generate_content_stream(
+                model=cloud_model("gemini", x_use_snippet_model),
                 contents=[user_content],  
                 config=genai.types.GenerateContentConfig(
                     system_instruction=systemPrompt, response_mime_type="text/plain"
                 ),
             )
 
-            for chunk in stream:
+            usage = None
+            async for chunk in stream:
                 if chunk.text:
                     yield chunk.text
+                usage = getattr(chunk, "usage_metadata", None) or usage
+
+            # Gemini caches repeated prefixes implicitly; it only reports the result
+            if usage is not None:
+                prompt_cache.stats.record(
+                    "gemini",
+                    prompt_cache.as_count(getattr(usage, "cached_content_token_count", None)) or 0,
+                    prompt_cache.as_count(getattr(usage, "prompt_token_count", None)),
+                )
 
         except APIError as e:
             logging.error(f"Gemini API Error: {e}")
@@ -257,6 +379,8 @@ async def analyze_codesnippet_endpoint_gemini(
         except Exception as e:
             logging.error(f"An unexpected server error occurred: {e}")
             yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
+        finally:
+            lease.release()
 
     return StreamingResponse(generate_stream(), media_type="text/plain")
 
@@ -266,18 +390,22 @@ async def analyze_codesnippet_endpoint_chatgpt(
     x_cloud_api_key: str | None,
     x_cloud_encrypted_key: str | None,
     x_cloud_iv: str | None,
+    services: Services,
 ):
+    from openai import APIError, AsyncOpenAI
 
     api_key = ""
+    settings = services.settings
     if x_cloud_api_key and x_cloud_encrypted_key and x_cloud_iv:
-        api_key = utils.decrypt_envelope(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
+        api_key = await utils.decrypt_envelope_async(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
     elif settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY:
         api_key = settings.SERVER_SIDE_API_KEY
 
     client = None
     try:
         # Initialize OpenAI Client
-        client = OpenAI(api_key=api_key)
+        lease = services.provider_clients.acquire("openai", api_key, lambda: AsyncOpenAI(api_key=api_key))
+        client = lease.client
     except Exception as e:
         logging.error(f"Failed to initialize OpenAI client: {e}")
         client = None
@@ -286,7 +414,7 @@ async def analyze_codesnippet_endpoint_chatgpt(
     systemPrompt = SYSTEM_PROMPT_FOR_SNIPPETS if isSnippet else SYSTEM_PROMPT
     
     # Select appropriate model (e.g., gpt-4o or gpt-4o-mini)
-    model_name = "gpt-4o-mini" if isSnippet else "gpt-4o"
+    model_name = cloud_model("openai", x_use_snippet_model)
 
     if client is None:
         raise HTTPException(
@@ -301,18 +429,20 @@ async def analyze_codesnippet_endpoint_chatgpt(
     async def generate_stream() -> AsyncGenerator[str, None]:
         try:
             # OpenAI Streaming Logic
-            stream = client.chat.completions.create(
+            stream = await client.chat.completions.create(
                 model=model_name,
                 messages=[
                     {"role": "system", "content": systemPrompt},
                     {"role": "user", "content": user_content}
                 ],
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True},
             )
 
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                record_openai_usage("openai", chunk)
 
         except APIError as e:
             logging.error(f"OpenAI API Error: {e}")
@@ -320,6 +450,8 @@ async def analyze_codesnippet_endpoint_chatgpt(
         except Exception as e:
             logging.error(f"An unexpected server error occurred: {e}")
             yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
+        finally:
+            lease.release()
 
     return StreamingResponse(generate_stream(), media_type="text/plain")
 
@@ -330,21 +462,30 @@ async def analyze_codesnippet_endpoint_grok(
     x_cloud_api_key: str | None,
     x_cloud_encrypted_key: str | None,
     x_cloud_iv: str | None,
+    services: Services,
 ):
+    from openai import APIError, AsyncOpenAI
 
     api_key = ""
+    settings = services.settings
     if x_cloud_api_key and x_cloud_encrypted_key and x_cloud_iv:
-        api_key = utils.decrypt_envelope(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
+        api_key = await utils.decrypt_envelope_async(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
     elif settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY:
         api_key = settings.SERVER_SIDE_API_KEY
 
     client = None
     try:
         # Initialize xAI Client (using OpenAI SDK)
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.x.ai/v1"
+        lease = services.provider_clients.acquire(
+            "grok",
+            api_key,
+            lambda: AsyncOpenAI(
+                api_key=api_key,
+                base_url="https://api.x.ai/v1"
+            ),
+            base_url="https://api.x.ai/v1",
         )
+        client = lease.client
     except Exception as e:
         logging.error(f"Failed to initialize Grok client: {e}")
         client = None
@@ -353,7 +494,7 @@ async def analyze_codesnippet_endpoint_grok(
     systemPrompt = SYSTEM_PROMPT_FOR_SNIPPETS if isSnippet else SYSTEM_PROMPT
     
     # Current Grok beta model
-    model_name = "grok-beta" 
+    model_name = cloud_model("grok", x_use_snippet_model)
 
     if client is None:
         raise HTTPException(
@@ -367,18 +508,20 @@ async def analyze_codesnippet_endpoint_grok(
 
     async def generate_stream() -> AsyncGenerator[str, None]:
         try:
-            stream = client.chat.completions.create(
+            stream = await client.chat.completions.create(
                 model=model_name,
                 messages=[
                     {"role": "system", "content": systemPrompt},
                     {"role": "user", "content": user_content}
                 ],
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True},
             )
 
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                record_openai_usage("grok", chunk)
 
         except APIError as e:
             logging.error(f"Grok API Error: {e}")
@@ -386,6 +529,8 @@ async def analyze_codesnippet_endpoint_grok(
         except Exception as e:
             logging.error(f"An unexpected server error occurred: {e}")
             yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
+        finally:
+            lease.release()
 
     return StreamingResponse(generate_stream(), media_type="text/plain")
 
@@ -396,17 +541,21 @@ async def analyze_codesnippet_endpoint_claude(
     x_cloud_api_key: str | None,
     x_cloud_encrypted_key: str | None,
     x_cloud_iv: str | None,
+    services: Services,
 ):
+    from anthropic import AsyncAnthropic
 
     api_key = ""
+    settings = services.settings
     if x_cloud_api_key and x_cloud_encrypted_key and x_cloud_iv:
-        api_key = utils.decrypt_envelope(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
+        api_key = await utils.decrypt_envelope_async(x_cloud_encrypted_key, x_cloud_iv, x_cloud_api_key, settings.RSA_PRIVATE_KEY)
     elif settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY:
         api_key = settings.SERVER_SIDE_API_KEY
 
     client = None
     try:
-        client = Anthropic(api_key=api_key)
+        lease = services.provider_clients.acquire("claude", api_key, lambda: AsyncAnthropic(api_key=api_key))
+        client = lease.client
     except Exception as e:
         logging.error(f"Failed to initialize Claude client: {e}")
         client = None
@@ -414,7 +563,7 @@ async def analyze_codesnippet_endpoint_claude(
     isSnippet = True if x_use_snippet_model == 'true' else False
     systemPrompt = SYSTEM_PROMPT_FOR_SNIPPETS if isSnippet else SYSTEM_PROMPT
     
-    model_name = "claude-3-haiku-20240307" if isSnippet else "claude-3-5-sonnet-20240620"
+    model_name = cloud_model("claude", x_use_snippet_model)
 
     if client is None:
         raise HTTPException(
@@ -427,29 +576,96 @@ async def analyze_codesnippet_endpoint_claude(
         user_content += f"\nADDITIONAL CONTEXT:\n---\n{request_data.context}\n---"
 
     async def generate_stream() -> AsyncGenerator[str, None]:
-         async for chunk in anthtropic_stream(client, systemPrompt, user_content, model_name):
-            yield chunk
+        try:
+            async for chunk in anthtropic_stream(client, systemPrompt, user_content, model_name):
+                yield chunk
+        finally:
+            lease.release()
 
     return StreamingResponse(generate_stream(), media_type="text/plain")
 
 REQUEST_MAP = {
-    "analyze_codesnippet_srvllama": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_llama_server(a,b,c,d,e,f),
-    "analyze_codesnippet_ollama": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_ollama(a,b,c,d,e,f),
-    "analyze_codesnippet_gemini": lambda a,b,c,d,e : analyze_codesnippet_endpoint_gemini(a, b, c, d, e),
-    "analyze_codesnippet_grok": lambda a,b,c,d,e : analyze_codesnippet_endpoint_grok(a,b,c,d,e),
-    "analyze_codesnippet_claude": lambda a,b,c,d,e : analyze_codesnippet_endpoint_claude(a,b,c,d,e),
-    "analyze_codesnippet_openai": lambda a,b,c,d,e : analyze_codesnippet_endpoint_chatgpt(a,b,c,d,e),
+    "analyze_codesnippet_srvllama": lambda a,b,c,d,e,f,g : analyze_codesnippet_endpoint_llama_server(a,b,c,d,e,f,g),
+    "analyze_codesnippet_ollama": lambda a,b,c,d,e,f,g : analyze_codesnippet_endpoint_ollama(a,b,c,d,e,f,g),
+    "analyze_codesnippet_gemini": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_gemini(a, b, c, d, e, f),
+    "analyze_codesnippet_grok": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_grok(a,b,c,d,e,f),
+    "analyze_codesnippet_claude": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_claude(a,b,c,d,e,f),
+    "analyze_codesnippet_openai": lambda a,b,c,d,e,f : analyze_codesnippet_endpoint_chatgpt(a,b,c,d,e,f),
 }
 
-@app.get("/alignments", tags=["Alignments"])
-async def get_alignments_endpoint():
-    return get_all_alignments()
+def alignments_etag(count: int, latest: str | None, *params) -> str:
+    material = json.dumps([count, latest, *params], separators=(",", ":"))
+    return '"' + hashlib.sha256(material.encode("utf-8")).hexdigest()[:32] + '"'
 
-@app.post("/analyze", tags=["Proxy Route"])
-@limiter.limit(settings.RATE_LIMIT)
-async def analyze(
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+@router.get("/alignments", tags=["Alignments"])
+async def get_alignments_endpoint(
     request: Request,
-    request_data: CodeAnalysisRequest,
+    prefix: Optional[str] = Query(None, description="Only signatures starting with this prefix."),
+    project: Optional[str] = Query(None, description="Only snippets of this content.json project."),
+    since: Optional[str] = Query(None, description="Only rows written at or after this timestamp (see X-Alignments-Timestamp)."),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    signatures = None
+    if project is not None:
+        projectData = content.get_project(project)
+        if projectData is None:
+            raise HTTPException(status_code=404, detail="Unknown project")
+        signatures = content.project_signatures(projectData)
+
+    count, latest = await database.run_read(database.get_alignments_version, prefix, signatures, since)
+    etag = alignments_etag(count, latest, prefix, project, since, limit, offset)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Total-Count": str(count),
+        "X-Alignments-Timestamp": latest or "",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if signatures is None and not (prefix or since or limit or offset):
+        alignments = await database.run_read(get_all_alignments)
+    else:
+        alignments = await database.run_read(database.query_alignments, prefix, signatures, since, limit, offset)
+
+    return JSONResponse(alignments, headers=headers)
+
+class ProviderRoute(BaseModel):
+    use_local_provider: Optional[bool] = None
+    use_snippet_model: Optional[bool] = None
+    default_local_provider: Optional[str] = None
+    default_cloud_provider: Optional[str] = None
+    local_url: Optional[str] = None
+    local_snippet_model: Optional[str] = None
+    local_alignment_model: Optional[str] = None
+    cloud_api_key: Optional[str] = None
+    cloud_encrypted_key: Optional[str] = None
+    cloud_iv: Optional[str] = None
+    hedge_provider: Optional[str] = None
+    hedge_api_key: Optional[str] = None
+    hedge_encrypted_key: Optional[str] = None
+    hedge_iv: Optional[str] = None
+
+    @property
+    def provider(self) -> str | None:
+        return self.default_local_provider if self.use_local_provider else self.default_cloud_provider
+
+    @property
+    def model(self) -> str | None:
+        if not self.use_local_provider:
+            return None
+        return self.local_snippet_model if self.use_snippet_model else self.local_alignment_model
+
+def provider_route(
+    services: Annotated[Services, Depends(get_services)],
     x_use_local_provider: Annotated[Union[str, None], Header()] = None,
     x_use_snippet_model: Annotated[Union[str, None], Header()] = None,
     x_default_local_provider: Annotated[Union[str, None], Header()] = None,
@@ -460,14 +676,18 @@ async def analyze(
     x_cloud_api_key: Annotated[Union[str, None], Header()] = None,
     x_cloud_encrypted_key: Annotated[Union[str, None], Header()] = None,
     x_cloud_iv: Annotated[Union[str, None], Header()] = None,
-    x_snippet_signature: Annotated[Union[str, None], Header()] = None,
-):
-    
+    x_hedge_provider: Annotated[Union[str, None], Header()] = None,
+    x_hedge_api_key: Annotated[Union[str, None], Header()] = None,
+    x_hedge_encrypted_key: Annotated[Union[str, None], Header()] = None,
+    x_hedge_iv: Annotated[Union[str, None], Header()] = None,
+) -> ProviderRoute:
+
     # Check incomplete headers logic:
     # If DEMO_MODE is on and user didn't provide keys, we allow it IF server key exists.
     # But if they provided some keys but not others, standard validation applies.
     # To simplify: we check if keys are missing. If so, and demo mode is on, we proceed.
     
+    settings = services.settings
     has_client_keys = x_cloud_api_key and x_cloud_encrypted_key and x_cloud_iv
     
     if not has_client_keys:
@@ -478,68 +698,846 @@ async def analyze(
     useLocalProvider = True if x_use_local_provider == 'true' else False if x_use_local_provider == 'false' else None
     useSnippetModel = True if x_use_snippet_model == 'true' else False if x_use_snippet_model == 'false' else None
 
-    defaultLocalProvider = x_default_local_provider
-    defaultCloudProvider = x_default_cloud_provider
+    return ProviderRoute(
+        use_local_provider=useLocalProvider,
+        use_snippet_model=useSnippetModel,
+        default_local_provider=x_default_local_provider,
+        default_cloud_provider=x_default_cloud_provider,
+        local_url=x_local_url,
+        local_snippet_model=x_local_snippet_model,
+        local_alignment_model=x_local_alignment_model,
+        cloud_api_key=x_cloud_api_key or None,
+        cloud_encrypted_key=x_cloud_encrypted_key or None,
+        cloud_iv=x_cloud_iv or None,
+        hedge_provider=x_hedge_provider or None,
+        hedge_api_key=x_hedge_api_key or None,
+        hedge_encrypted_key=x_hedge_encrypted_key or None,
+        hedge_iv=x_hedge_iv or None,
+    )
+
+async def track_backend(body: AsyncIterator, lease: BackendLease) -> AsyncGenerator[str | bytes, None]:
+    """Holds a local backend for as long as its stream runs and reports how it ended."""
+    failed = False
+    try:
+        async for chunk in body:
+            if not failed:
+                text = chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else chunk
+                failed = is_error_chunk(text)
+            yield chunk
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        lease.release(failed=failed)
+
+def hedge_provider(services: Services, route: ProviderRoute) -> str | None:
+    if not (services.settings.HEDGE_ENABLED and route.hedge_provider) or route.use_local_provider:
+        return None
+    if f"analyze_codesnippet_{route.hedge_provider}" not in REQUEST_MAP:
+        logging.warning(f"Ignoring unknown hedge provider {route.hedge_provider}")
+        return None
+    if route.hedge_provider == route.default_cloud_provider:
+        # Hedging to the primary would only double the load on one upstream
+        logging.warning(f"Ignoring hedge provider {route.hedge_provider}: it is also the cloud provider")
+        return None
+    if not route.hedge_api_key:
+        # A hedge is extra spend the client opts into; never on the server-side key
+        logging.warning(f"Ignoring hedge provider {route.hedge_provider} without its own key")
+        return None
+    return route.hedge_provider
+
+def metric_labels(services: Services, provider: str | None, model: str | None) -> Dict[str, str]:
+    """
+    Provider and model labels for metrics. Both can come from request headers,
+    so values this server does not know are reported as metrics.OTHER.
+    """
+    if f"analyze_codesnippet_{provider}" not in REQUEST_MAP:
+        return {"provider": metrics.OTHER, "model": metrics.OTHER}
+    knownModels = {m for models in CLOUD_MODELS.values() for m in models}
+    settings = services.settings
+    knownModels.update((MODEL_NAME, MODEL_NAME_FOR_SNIPPETS), settings.OLLAMA_WARMUP_MODELS, settings.OLLAMA_KEEP_ALIVE_POLICIES)
+    return {"provider": provider, "model": metrics.bounded(model, knownModels) if model else ""}
+
+def upstream_label(services: Services, route: ProviderRoute) -> str:
+    """`circuit_key(services, route)` for metrics, with local hosts the server was not configured with folded together."""
+    if f"analyze_codesnippet_{route.provider}" not in REQUEST_MAP:
+        return metrics.OTHER
+    key = circuit_key(services, route)
+    if key == route.provider:
+        return key
+    settings = services.settings
+    configuredHosts = {base_url(url) for url in (settings.OLLAMA_HOST, settings.LLAMA_SERVER_URL) if url}
+    if base_url(route.local_url or "") in configuredHosts:
+        return key
+    return f"{route.provider}@{metrics.OTHER}"
+
+async def dispatch(services: Services, provider: str, model: str | None, *args) -> Response:
+    """Calls the REQUEST_MAP handler for `provider` and measures the stream it returns."""
+    started = time.monotonic()
+    labels = metric_labels(services, provider, model)
+    try:
+        response = await REQUEST_MAP[f"analyze_codesnippet_{provider}"](*args, services)
+    except HTTPException as e:
+        if e.status_code >= 500:
+            metrics.upstream_errors.inc(type=f"http_{e.status_code}", **labels)
+        raise
+    except Exception as e:
+        metrics.upstream_errors.inc(type=type(e).__name__, **labels)
+        raise
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = metrics.observe_stream(labels["provider"], labels["model"], response.body_iterator, started)
+    return response
+
+async def open_cloud_body(
+    services: Services,
+    provider: str,
+    request_data: CodeAnalysisRequest,
+    use_snippet: bool | None,
+    apiKey: str | None,
+    encKey: str | None,
+    iv: str | None,
+) -> AsyncIterator:
+    response = await dispatch(services, provider, cloud_model(provider, use_snippet), request_data, use_snippet, apiKey, encKey, iv)
+    if not isinstance(response, StreamingResponse):
+        raise HTTPException(status_code=502, detail=f"{provider} did not return a stream")
+    return response.body_iterator
+
+async def open_provider_stream(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+    extraHeaders: Dict[str, str],
+) -> Tuple[Response, ProviderRoute]:
+    """
+    Calls the handler for `route`, through the local backend pool or hedging
+    when they apply. Also returns the route that produced the response, which
+    differs from `route` when a hedge won.
+    """
+    if route.use_local_provider:
+        streamer = ollama_streamer if route.default_local_provider == "ollama" else llama_streamer
+        localUrl = route.local_url
+        backendLease = None
+        if services.local_backends.has(route.default_local_provider):
+            try:
+                backendLease = services.local_backends.acquire(route.default_local_provider)
+            except LookupError:
+                raise HTTPException(status_code=503, detail="No healthy local backend available")
+            localUrl = backendLease.url
+
+        try:
+            response = await dispatch(
+                    services,
+                    route.default_local_provider,
+                    route.model,
+                    request_data, 
+                    localUrl, 
+                    route.use_snippet_model, 
+                    route.local_snippet_model, 
+                    route.local_alignment_model,
+                    streamer
+                )
+        except HTTPException as e:
+            if backendLease is not None:
+                backendLease.release(failed=e.status_code >= 500)
+            raise
+        except Exception:
+            if backendLease is not None:
+                backendLease.release(failed=True)
+            raise
+
+        if backendLease is not None:
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = track_backend(response.body_iterator, backendLease)
+            else:
+                backendLease.release()
+        return response, route
+
+    if hedge_provider(services, route) is not None:
+        result = await services.hedger.run(
+            route.default_cloud_provider,
+            lambda: open_cloud_body(services, route.default_cloud_provider, request_data, route.use_snippet_model,
+                                    route.cloud_api_key, route.cloud_encrypted_key, route.cloud_iv),
+            route.hedge_provider,
+            lambda: open_cloud_body(services, route.hedge_provider, request_data, route.use_snippet_model,
+                                    route.hedge_api_key, route.hedge_encrypted_key, route.hedge_iv),
+        )
+        extraHeaders["X-Hedge-Winner"] = result.winner
+        servingRoute = route
+        if result.winner != route.default_cloud_provider:
+            servingRoute = route.model_copy(update={
+                "default_cloud_provider": result.winner,
+                "cloud_api_key": route.hedge_api_key,
+                "cloud_encrypted_key": route.hedge_encrypted_key,
+                "cloud_iv": route.hedge_iv,
+            })
+        return StreamingResponse(result.body, media_type="text/plain"), servingRoute
+
+    started = time.monotonic()
+    response = await dispatch(
+            services,
+            route.default_cloud_provider,
+            cloud_model(route.default_cloud_provider, route.use_snippet_model),
+            request_data,
+            route.use_snippet_model, 
+            route.cloud_api_key, 
+            route.cloud_encrypted_key,
+            route.cloud_iv
+        )
+    if services.settings.HEDGE_ENABLED and isinstance(response, StreamingResponse):
+        response.body_iterator = services.hedger.timed(route.default_cloud_provider, response.body_iterator, started)
+    return response, route
+
+def circuit_key(services: Services, route: ProviderRoute) -> str:
+    if route.use_local_provider and not services.local_backends.has(route.default_local_provider):
+        return f"{route.default_local_provider}@{base_url(route.local_url or '')}"
+    # Pooled local backends are tracked per node by the pool itself
+    return route.provider or ""
+
+def fallback_route(services: Services, route: ProviderRoute, provider: str) -> ProviderRoute | None:
+    """`route` redirected to `provider`, or None when the request carries no way to reach it."""
+    if provider in LOCAL_PROVIDERS:
+        if route.use_local_provider and provider == route.default_local_provider:
+            return None
+        localUrl = route.local_url if provider == route.default_local_provider else None
+        if localUrl is None and not services.local_backends.has(provider):
+            return None
+        return route.model_copy(update={
+            "use_local_provider": True,
+            "default_local_provider": provider,
+            "local_url": localUrl,
+        })
+
+    if f"analyze_codesnippet_{provider}" not in REQUEST_MAP:
+        logging.warning(f"Ignoring unknown fallback provider {provider}")
+        return None
+    if not route.use_local_provider and provider == route.default_cloud_provider:
+        return None
+
+    if provider == route.hedge_provider and route.hedge_api_key:
+        keys = (route.hedge_api_key, route.hedge_encrypted_key, route.hedge_iv)
+    elif provider == route.default_cloud_provider and route.cloud_api_key:
+        keys = (route.cloud_api_key, route.cloud_encrypted_key, route.cloud_iv)
+    elif services.settings.DEMO_MODE and services.settings.SERVER_SIDE_API_KEY:
+        keys = (None, None, None)
+    else:
+        return None
+    return route.model_copy(update={
+        "use_local_provider": False,
+        "default_cloud_provider": provider,
+        "cloud_api_key": keys[0],
+        "cloud_encrypted_key": keys[1],
+        "cloud_iv": keys[2],
+    })
+
+def failover_routes(services: Services, route: ProviderRoute) -> List[ProviderRoute]:
+    routes = [route]
+    for provider in services.settings.PROVIDER_FALLBACKS.get(route.provider or "", []):
+        candidate = fallback_route(services, route, provider)
+        if candidate is not None:
+            routes.append(candidate)
+    return routes
+
+async def watch_upstream(services: Services, body: AsyncIterator, key: str, permit: Permit) -> AsyncGenerator[str | bytes, None]:
+    """Holds the upstream's admission slot while streaming; a later error counts against its circuit."""
+    failed = False
+    try:
+        async for chunk in body:
+            if not failed:
+                text = chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else chunk
+                if is_error_chunk(text):
+                    failed = True
+                    services.circuits.record(key, ok=False)
+            yield chunk
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        permit.release(failed=failed)
+        await close_stream(body)
+
+async def open_with_failover(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+    extraHeaders: Dict[str, str],
+) -> Tuple[Response, ProviderRoute]:
+    """
+    Tries the requested provider, then its PROVIDER_FALLBACKS, skipping any
+    whose circuit is open or whose admission queue is full. A provider has
+    failed when its handler raises a 5xx or its first chunk is an error
+    marker; the next one is tried before anything reaches the client. When
+    all fail the last failure is returned as it would have been without
+    failover. Also returns the route that produced the response.
+    """
+    circuits, admission = services.circuits, services.admission
+    failure = None
+    failedStream = None
+    refused = []
+    overloaded = []
+    try:
+        for candidate in failover_routes(services, route):
+            key = circuit_key(services, candidate)
+            if not circuits.allow(key):
+                metrics.upstream_rejections.inc(upstream=upstream_label(services, candidate), reason="circuit_open")
+                refused.append(key)
+                continue
+
+            try:
+                permit = await admission.acquire(key)
+            except Overloaded as e:
+                metrics.upstream_rejections.inc(upstream=upstream_label(services, candidate), reason="overloaded")
+                circuits.release(key)
+                overloaded.append(e)
+                continue
+
+            try:
+                response, servingRoute = await open_provider_stream(services, request_data, candidate, llama_streamer, ollama_streamer, extraHeaders)
+            except HTTPException as e:
+                permit.release(failed=e.status_code >= 500)
+                if e.status_code < 500:
+                    circuits.release(key)
+                    raise
+                circuits.record(key, ok=False)
+                failure = e
+                continue
+            except Exception as e:
+                permit.release(failed=True)
+                circuits.record(key, ok=False)
+                failure = e
+                continue
+
+            if not isinstance(response, StreamingResponse):
+                ok = getattr(response, "status_code", 200) < 500
+                permit.release(failed=not ok)
+                circuits.record(key, ok=ok)
+                return response, servingRoute
+
+            body = response.body_iterator
+            try:
+                first = await body.__anext__()
+            except StopAsyncIteration:
+                first = ""
+            except Exception as e:
+                permit.release(failed=True)
+                circuits.record(key, ok=False)
+                failure = e
+                continue
+            permit.first_chunk()
+
+            text = first.decode("utf-8", errors="ignore") if isinstance(first, bytes) else first
+            if is_error_chunk(text):
+                logging.error(f"{key} failed before streaming: {text.strip()}")
+                permit.release(failed=True)
+                circuits.record(key, ok=False)
+                if failedStream is not None:
+                    await close_stream(failedStream[2])
+                failure = None
+                failedStream = (response, first, body, servingRoute)
+                continue
+
+            circuits.record(key, ok=True)
+            response.body_iterator = watch_upstream(services, resume_stream(first, body), key, permit)
+            if candidate is not route:
+                extraHeaders["X-Failover"] = candidate.provider
+            return response, servingRoute
+    except BaseException:
+        if failedStream is not None:
+            await close_stream(failedStream[2])
+        raise
+
+    if failedStream is not None and failure is None:
+        response, first, body, servingRoute = failedStream
+        response.body_iterator = resume_stream(first, body)
+        return response, servingRoute
+    if failedStream is not None:
+        await close_stream(failedStream[2])
+    if failure is not None:
+        raise failure
+
+    if overloaded:
+        raise HTTPException(
+            status_code=429,
+            detail=f"{route.provider} is busy, try again later",
+            headers=retry_after_header(min(e.retry_after for e in overloaded)),
+        )
+    raise HTTPException(
+        status_code=503,
+        detail=f"{route.provider} is unavailable, try again later",
+        headers=retry_after_header(min(circuits.retry_after(key) for key in refused)),
+    )
 
-    localUrl = x_local_url
-    localSnippetModel = x_local_snippet_model
-    localAlignmentModel = x_local_alignment_model
+async def open_single_stream(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    signature: str | None,
+    bypass_cache: bool,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+) -> Response:
+    """
+    Serves one analysis from the response cache, an identical in-flight
+    generation, or a fresh call to the provider handler, in that order.
+    Returns the handler's own response when it is not a stream.
+    """
+    def routeCacheKey(keyRoute: ProviderRoute) -> str:
+        return make_cache_key(keyRoute.provider, keyRoute.model, keyRoute.use_snippet_model, request_data.code, request_data.context)
+
+    cacheKey = routeCacheKey(route)
+    response_cache, inflight = services.response_cache, services.inflight
+
+    cached = None if bypass_cache else await response_cache.fetch(cacheKey)
+    flight = None
+    if cached is None:
+        flight = await inflight.join(cacheKey, shared=not bypass_cache)
+        # A flight that finished while this request waited is cached by now
+        if flight is None and not bypass_cache:
+            cached = await response_cache.fetch(cacheKey)
+
+    if cached is not None:
+        if signature:
+            queue_alignment(signature, cached.text())
+        return StreamingResponse(cached.replay(), media_type="text/plain", headers={"X-Cache": "HIT"})
+
+    cacheStatus = "COALESCED"
+    extraHeaders = {}
+
+    if flight is None:
+        async with inflight.opening(cacheKey):
+            response, servingRoute = await open_with_failover(services, request_data, route, llama_streamer, ollama_streamer, extraHeaders)
+            if not (response and isinstance(response, StreamingResponse)):
+                return response
+            flight = inflight.start(cacheKey, response.body_iterator)
+            # A fallback's or hedge's answer is cached as that provider's, never as the one requested
+            servedKey = cacheKey if servingRoute is route else routeCacheKey(servingRoute)
+            flight.add_sink(CacheSink(response_cache, servedKey))
+            cacheStatus = "MISS"
+
+    if signature:
+        flight.add_sink(PersistenceSink(signature, queue_alignment))
 
-    cloudAPIKey = x_cloud_api_key if x_cloud_api_key else None
-    cloudEncrpytedKey = x_cloud_encrypted_key if x_cloud_encrypted_key else None
-    cloudIV = x_cloud_iv if x_cloud_iv else None
+    return StreamingResponse(
+        flight.subscribe(),
+        media_type="text/plain",
+        headers={"X-Cache": cacheStatus, **extraHeaders},
+    )
 
-    streamer = get_ollama_streamer() if defaultLocalProvider == "ollama" else get_llama_streamer()
+class AnalysisError(Exception):
+    pass
 
-    response = None
-    if useLocalProvider:
-        response = await REQUEST_MAP[f"analyze_codesnippet_{defaultLocalProvider}"](
-                request_data, 
-                localUrl, 
-                useSnippetModel, 
-                localSnippetModel, 
-                localAlignmentModel,
-                streamer
+async def collect_analysis(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    bypass_cache: bool,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+) -> str:
+    response = await open_single_stream(services, request_data, route, None, bypass_cache, llama_streamer, ollama_streamer)
+    if not isinstance(response, StreamingResponse):
+        raise AnalysisError(f"Provider returned status {getattr(response, 'status_code', '?')}")
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+    async for chunk in response.body_iterator:
+        parts.append(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+    text = "".join(parts)
+
+    if not text.strip() or any(marker in text for marker in ERROR_MARKERS):
+        raise AnalysisError(text.strip() or "Empty response")
+    return text
+
+def excerpt_input(text: str) -> str:
+    return f"{MAP_REDUCE_EXCERPT_CONTEXT}\n{text}"
+
+def merge_input(sections: List[Tuple[int, int, str]]) -> str:
+    body = "\n\n".join(f"### Lines {start}-{end}\n{text.strip()}" for start, end, text in sections)
+    return f"{MAP_REDUCE_MERGE_INSTRUCTIONS}\n{body}\n"
+
+def group_sections(sections: List[Tuple[int, int, str]], max_chars: int) -> List[List[Tuple[int, int, str]]]:
+    groups, size = [[]], 0
+    for section in sections:
+        if groups[-1] and size + len(section[2]) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(section)
+        size += len(section[2])
+    return groups
+
+async def open_map_reduce_stream(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    signature: str | None,
+    bypass_cache: bool,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+) -> Response:
+    """
+    Analyzes an input too large for one model call. The code is split at
+    syntactic boundaries, the excerpts are audited in parallel, and the
+    partial audits are merged (folding in rounds while they are still too
+    long) into one streamed audit. Every excerpt and merge goes through the
+    response cache, so after an edit only the excerpts that changed and the
+    merges above them run again.
+    """
+    settings = services.settings
+    chunks = split_code(request_data.code, settings.MAP_REDUCE_CHUNK_CHARS)
+    if len(chunks) > settings.MAP_REDUCE_MAX_CHUNKS:
+        raise HTTPException(status_code=413, detail="Code is too large to analyze")
+
+    semaphore = asyncio.Semaphore(settings.MAP_REDUCE_CONCURRENCY)
+
+    async def analyze_part(code: str, context: str | None) -> str:
+        async with semaphore:
+            return await collect_analysis(
+                services,
+                CodeAnalysisRequest(code=code, context=context),
+                route,
+                bypass_cache,
+                llama_streamer,
+                ollama_streamer,
             )
-    else:
-        response = await REQUEST_MAP[f"analyze_codesnippet_{defaultCloudProvider}"](
-                request_data,
-                useSnippetModel, 
-                cloudAPIKey, 
-                cloudEncrpytedKey,
-                cloudIV
+
+    async def generate_stream() -> AsyncGenerator[str | bytes, None]:
+        try:
+            partials = await asyncio.gather(*(analyze_part(excerpt_input(c.text), request_data.context) for c in chunks))
+            sections = [(c.line_start, c.line_end, text) for c, text in zip(chunks, partials)]
+
+            while len(sections) > 1 and sum(len(s[2]) for s in sections) > settings.MAP_REDUCE_CHUNK_CHARS:
+                groups = group_sections(sections, settings.MAP_REDUCE_CHUNK_CHARS)
+                if len(groups) == len(sections):
+                    break
+                merged = await asyncio.gather(*(analyze_part(merge_input(g), request_data.context) for g in groups))
+                sections = [(g[0][0], g[-1][1], text) for g, text in zip(groups, merged)]
+
+            response = await open_single_stream(
+                services,
+                CodeAnalysisRequest(code=merge_input(sections), context=request_data.context),
+                route,
+                signature,
+                bypass_cache,
+                llama_streamer,
+                ollama_streamer,
             )
+            if not isinstance(response, StreamingResponse):
+                raise AnalysisError(f"Provider returned status {getattr(response, 'status_code', '?')}")
+            async for chunk in response.body_iterator:
+                yield chunk
+
+        except HTTPException as e:
+            yield f"\n[API_ERROR] {e.detail}"
+        except AnalysisError as e:
+            yield f"\n[API_ERROR] A part of the file could not be analyzed: {e}"
+        except Exception as e:
+            logging.error(f"An unexpected server error occurred: {e}")
+            yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/plain",
+        headers={"X-Analysis-Mode": "map-reduce"},
+    )
 
-    if x_snippet_signature and response and isinstance(response, StreamingResponse):
-        original_iterator = response.body_iterator
-        
-        async def saving_iterator():
-            full_text = ""
+def map_reduce_threshold(services: Services, route: ProviderRoute) -> int:
+    """Code length above which `route` is analyzed in parts; 0 never splits."""
+    settings = services.settings
+    threshold = settings.MAP_REDUCE_PROVIDER_THRESHOLDS.get(route.provider or "")
+    if threshold is not None:
+        return threshold
+    # Cloud models take far more than a local model's context in one prompt
+    return settings.MAP_REDUCE_THRESHOLD if route.use_local_provider else 0
+
+async def open_analysis_stream(
+    services: Services,
+    request_data: CodeAnalysisRequest,
+    route: ProviderRoute,
+    signature: str | None,
+    bypass_cache: bool,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+) -> Response:
+    threshold = map_reduce_threshold(services, route)
+    if threshold > 0 and len(request_data.code) > threshold:
+        return await open_map_reduce_stream(
+            services, request_data, route, signature, bypass_cache, llama_streamer, ollama_streamer
+        )
+    return await open_single_stream(
+        services, request_data, route, signature, bypass_cache, llama_streamer, ollama_streamer
+    )
+
+def wants_fresh(request: Request) -> bool:
+    return "no-cache" in request.headers.get("cache-control", "").lower()
+
+def snippet_etag(source, line_start: int | None, line_end: int | None) -> str:
+    material = f"{source.digest}|{line_start or ''}|{line_end or ''}"
+    return '"' + hashlib.sha256(material.encode("utf-8")).hexdigest()[:32] + '"'
+
+async def load_snippet_source(services: Services, signature: str):
+    try:
+        repoUrl, lineStart, lineEnd = content.parse_signature(signature)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed snippet signature")
+
+    # Only URLs content.json references are fetched, so this is not an open proxy
+    if repoUrl not in content.source_urls():
+        raise HTTPException(status_code=404, detail="Unknown snippet")
+
+    try:
+        source = await services.source_cache.get(repoUrl)
+    except Exception as e:
+        logging.error(f"Failed to fetch snippet source {repoUrl}: {e}")
+        raise HTTPException(status_code=502, detail="Failed to fetch snippet source")
+    return source, lineStart, lineEnd
+
+@router.get("/snippets/source", tags=["Snippets"])
+async def get_snippet_source(
+    request: Request,
+    services: Annotated[Services, Depends(get_services)],
+    signature: str = Query(..., description="Snippet signature: repoUrl|lineStart|lineEnd"),
+):
+    source, lineStart, lineEnd = await load_snippet_source(services, signature)
+    etag = snippet_etag(source, lineStart, lineEnd)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        source.lines(lineStart, lineEnd),
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+@router.get("/snippets/sources", tags=["Snippets"])
+async def get_project_sources(
+    services: Annotated[Services, Depends(get_services)],
+    project: str = Query(..., description="content.json project whose snippets are prefetched."),
+):
+    projectData = content.get_project(project)
+    if projectData is None:
+        raise HTTPException(status_code=404, detail="Unknown project")
+
+    semaphore = asyncio.Semaphore(services.settings.SOURCE_PREFETCH_CONCURRENCY)
+    sources: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    async def fetch(signature: str):
+        async with semaphore:
             try:
-                async for chunk in original_iterator:
-                    yield chunk
-                    text_chunk = chunk
-                    if isinstance(chunk, bytes):
-                        text_chunk = chunk.decode("utf-8", errors="ignore")
-                    full_text += text_chunk
-            finally:
-                if full_text and not full_text.startswith("\n[SERVER_ERROR]") and not full_text.startswith("\n[API_ERROR]"):
-                     save_alignment(x_snippet_signature, full_text)
-
-        return StreamingResponse(
-            saving_iterator(),
-            status_code=response.status_code,
-            media_type=response.media_type,
-            background=response.background
+                source, lineStart, lineEnd = await load_snippet_source(services, signature)
+                sources[signature] = source.lines(lineStart, lineEnd)
+            except HTTPException as e:
+                errors[signature] = e.detail
+
+    await asyncio.gather(*(fetch(sig) for sig in content.project_signatures(projectData)))
+    return {"sources": sources, "errors": errors}
+
+@router.post("/analyze", tags=["Proxy Route"])
+@limiter.limit(rate_limit)
+async def analyze(
+    request: Request,
+    request_data: CodeAnalysisRequest,
+    route: Annotated[ProviderRoute, Depends(provider_route)],
+    services: Annotated[Services, Depends(get_services)],
+    x_snippet_signature: Annotated[Union[str, None], Header()] = None,
+    llama_streamer: Annotated[Callable, Depends(get_llama_streamer)] = None,
+    ollama_streamer: Annotated[Callable, Depends(get_ollama_streamer)] = None,
+):
+    return await open_analysis_stream(
+        services,
+        request_data,
+        route,
+        x_snippet_signature,
+        wants_fresh(request),
+        llama_streamer,
+        ollama_streamer,
+    )
+
+class BatchAnalysisItem(CodeAnalysisRequest):
+    id: str = Field(..., description="Caller-chosen id echoed on every output line for this item.")
+    signature: Optional[str] = Field(
+        None, description="Optional snippet signature the finished analysis is saved under."
+    )
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[BatchAnalysisItem] = Field(..., min_length=1)
+
+def charge_batch(
+    request: Request,
+    batch_data: BatchAnalysisRequest,
+    route: Annotated[ProviderRoute, Depends(provider_route)],
+    services: Annotated[Services, Depends(get_services)],
+) -> None:
+    # A batch the server-side key pays for costs one rate-limit hit per item,
+    # the same as sending each item to /analyze
+    settings = services.settings
+    if not route.use_local_provider and not route.cloud_api_key and settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY:
+        request.state.batch_cost = len(batch_data.items)
+
+def batch_cost(request: Request) -> int:
+    return getattr(request.state, "batch_cost", 1)
+
+async def run_batch_item(
+    services: Services,
+    item: BatchAnalysisItem,
+    route: ProviderRoute,
+    bypass_cache: bool,
+    llama_streamer: Callable,
+    ollama_streamer: Callable,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    request_data = CodeAnalysisRequest(code=item.code, context=item.context)
+    try:
+        response = await open_analysis_stream(
+            services, request_data, route, item.signature, bypass_cache, llama_streamer, ollama_streamer
         )
-    
-    return response
+    except HTTPException as e:
+        yield {"id": item.id, "event": "error", "status": e.status_code, "detail": e.detail}
+        return
+
+    if not isinstance(response, StreamingResponse):
+        status = getattr(response, "status_code", 500)
+        body = getattr(response, "body", b"")
+        yield {"id": item.id, "event": "error", "status": status, "detail": body.decode("utf-8", errors="ignore")}
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    failed = False
+    async for chunk in response.body_iterator:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if not text:
+            continue
+        failed = failed or is_error_chunk(text)
+        yield {"id": item.id, "event": "chunk", "text": text}
+
+    yield {"id": item.id, "event": "done", "cache": response.headers.get("x-cache"), "failed": failed}
+
+@router.post("/analyze/batch", tags=["Proxy Route"], dependencies=[Depends(charge_batch)])
+@limiter.limit(rate_limit, cost=batch_cost)
+async def analyze_batch(
+    request: Request,
+    batch_data: BatchAnalysisRequest,
+    route: Annotated[ProviderRoute, Depends(provider_route)],
+    services: Annotated[Services, Depends(get_services)],
+    llama_streamer: Annotated[Callable, Depends(get_llama_streamer)] = None,
+    ollama_streamer: Annotated[Callable, Depends(get_ollama_streamer)] = None,
+):
+    """
+    Analyzes many snippets with one request. Items run through the same
+    cache, coalescing and provider handlers as /analyze, at most
+    BATCH_CONCURRENCY (or the provider's BATCH_PROVIDER_CONCURRENCY entry)
+    at a time per provider. The response is NDJSON: `chunk` lines carry
+    streamed text, and each item ends with one `done` or `error` line, all
+    tagged with the item's id.
+    """
+    settings = services.settings
+    if len(batch_data.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch may hold at most {settings.BATCH_MAX_ITEMS} items")
+
+    ids = [item.id for item in batch_data.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Batch item ids must be unique")
+
+    bypassCache = wants_fresh(request)
+
+    return StreamingResponse(
+        multiplex(
+            batch_data.items,
+            lambda item: run_batch_item(services, item, route, bypassCache, llama_streamer, ollama_streamer),
+            services.batch_limits.get(route.provider),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/backends", tags=["Local backends"])
+async def get_local_backends(services: Annotated[Services, Depends(get_services)]):
+    return services.local_backends.snapshot()
+
+@router.get("/circuits", tags=["Circuit breakers"])
+async def get_circuits(services: Annotated[Services, Depends(get_services)]):
+    return services.circuits.snapshot()
+
+@router.get("/admission", tags=["Admission control"])
+async def get_admission(services: Annotated[Services, Depends(get_services)]):
+    return services.admission.snapshot()
 
+@router.get("/hedging/stats", tags=["Hedging"])
+async def get_hedging_stats(services: Annotated[Services, Depends(get_services)]):
+    return services.hedger.snapshot()
 
-@app.get("/.well-known/rsa-key", tags=["RSA public key"])
+@router.get("/cache/stats", tags=["Cache"])
+async def get_cache_stats(services: Annotated[Services, Depends(get_services)]):
+    response_cache = services.response_cache
+    return {
+        "prompt_cache": prompt_cache.stats.snapshot(),
+        "response_cache": {"entries": len(response_cache), "bytes": response_cache.size},
+    }
+
+@router.get("/metrics", tags=["Metrics"])
+async def get_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/.well-known/rsa-key", tags=["RSA public key"])
 async def get_rsa_public_key():
     return FileResponse(
         path="./rsa_public.pem",
         status_code=200,
         filename="rsa_public.pem"
     )
+
+
+def rate_limit_exceeded(request: Request, exc: RateLimitExceeded) -> Response:
+    metrics.rate_limited_requests.inc(path=request.url.path)
+    return _rate_limit_exceeded_handler(request, exc)
+
+
+def create_app(settings: config.Settings | None = None) -> FastAPI:
+    """
+    Builds the application and the services it serves requests with, kept
+    on `app.state`. Importing this module loads no provider SDK and touches
+    no file or socket; the settings are read here unless given, and the
+    lifespan opens the database, connection pools and key material when a
+    worker starts and closes them on shutdown.
+    """
+    settings = settings or get_settings()
+    services = Services(settings)
+    app = FastAPI(
+        title="Ollama Code Analysis API",
+        description="An API endpoint to analyze code snippets using the Ollama LLM.",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+
+    app.state.settings = settings
+    app.state.services = services
+
+    # Register Limiter
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,  
+        allow_credentials=True,  
+        allow_methods=["*"],  
+        allow_headers=["*"],  
+        expose_headers=["ETag", "X-Total-Count", "X-Alignments-Timestamp", "X-Cache", "X-Analysis-Mode", "X-Hedge-Winner", "X-Failover", "Retry-After"],
+    )
+
+    app.add_middleware(ServicesContext, services=services)
+
+    app.include_router(router)
+    return app
+
+
+def __getattr__(name: str):
+    # `uvicorn backend.api:app` and `from backend.api import app` create the app on first use
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Iterable
+
+
+def ndjson_line(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class ProviderConcurrency:
+    """
+    One semaphore per provider, shared by every batch in the process, so a
+    burst of batch jobs never has more than the configured number of
+    generations open against the same upstream.
+    """
+
+    def __init__(self, default: int, overrides: Dict[str, int] | None = None):
+        self.default = default
+        self.overrides = dict(overrides or {})
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def limit(self, provider: str | None) -> int:
+        return max(1, self.overrides.get(provider or "", self.default))
+
+    def get(self, provider: str | None) -> asyncio.Semaphore:
+        key = provider or ""
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit(provider))
+            self._semaphores[key] = semaphore
+        return semaphore
+
+    def clear(self):
+        self._semaphores.clear()
+
+
+async def multiplex(
+    items: Iterable[Any],
+    run_item: Callable[[Any], AsyncIterator[Dict[str, Any]]],
+    semaphore: asyncio.Semaphore,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Runs `run_item` for every item under `semaphore` and interleaves their
+    events into one NDJSON stream in the order they are produced. Items still
+    running when the consumer goes away are cancelled.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def worker(item):
+        try:
+            async with semaphore:
+                async for event in run_item(item):
+                    queue.put_nowait(ndjson_line(event))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Batch item {getattr(item, 'id', '?')} failed: {e}")
+            queue.put_nowait(ndjson_line({
+                "id": getattr(item, "id", None),
+                "event": "error",
+                "status": 500,
+                "detail": f"An unexpected error occurred: {e}",
+            }))
+
+    tasks = [asyncio.create_task(worker(item)) for item in items]
+    remaining = len(tasks)
+    for task in tasks:
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while remaining:
+            line = await queue.get()
+            if line is None:
+                remaining -= 1
+                continue
+            yield line
+    finally:
+        for task in tasks:
+            task.cancel()
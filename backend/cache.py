@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from typing import AsyncGenerator, Iterable, Optional
+
+from backend.constants import SYSTEM_PROMPT_VERSION
+from backend.shared_state import StateStore
+
+# Key prefix of responses in the shared state store
+SHARED_PREFIX = "response:"
+
+ERROR_MARKERS = ("\n[SERVER_ERROR]", "\n[API_ERROR]")
+
+
+def is_error_chunk(chunk: str) -> bool:
+    return chunk.startswith(ERROR_MARKERS)
+
+
+def _normalize_code(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def make_cache_key(
+    provider: str | None,
+    model: str | None,
+    use_snippet: bool | None,
+    code: str,
+    context: Optional[str],
+) -> str:
+    """
+    Digest of everything that determines the generated text. Line endings and
+    surrounding whitespace are normalized so the same snippet fetched on
+    different platforms maps to the same entry.
+    """
+    material = json.dumps(
+        [
+            SYSTEM_PROMPT_VERSION,
+            provider or "",
+            model or "",
+            bool(use_snippet),
+            _normalize_code(code),
+            _normalize_code(context),
+        ],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CachedStream:
+    """
+    A finished stream stored as one UTF-8 buffer plus the byte offsets where
+    each original chunk ended, so replay preserves chunk boundaries without
+    keeping one Python object per chunk.
+    """
+
+    __slots__ = ("data", "offsets", "expires_at")
+
+    def __init__(self, chunks: Iterable[str | bytes], expires_at: float):
+        encoded = [c.encode("utf-8") if isinstance(c, str) else c for c in chunks]
+        self.data = b"".join(encoded)
+        self.offsets = array("I")
+        end = 0
+        for c in encoded:
+            end += len(c)
+            self.offsets.append(end)
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+    def text(self) -> str:
+        return self.data.decode("utf-8")
+
+    def chunks(self) -> Iterable[bytes]:
+        view = memoryview(self.data)
+        start = 0
+        for end in self.offsets:
+            yield bytes(view[start:end])
+            start = end
+
+    async def replay(self) -> AsyncGenerator[bytes, None]:
+        for chunk in self.chunks():
+            yield chunk
+
+    def to_bytes(self) -> bytes:
+        return len(self.offsets).to_bytes(4, "little") + self.offsets.tobytes() + self.data
+
+    @classmethod
+    def from_bytes(cls, blob: bytes, expires_at: float) -> "CachedStream":
+        count = int.from_bytes(blob[:4], "little")
+        entry = cls.__new__(cls)
+        entry.offsets = array("I")
+        end = 4 + count * entry.offsets.itemsize
+        entry.offsets.frombytes(blob[4:end])
+        entry.data = blob[end:]
+        entry.expires_at = expires_at
+        return entry
+
+
+class ResponseCache:
+    """
+    LRU cache of completed provider streams with a per-entry TTL, bounded by
+    both entry count and total stored bytes. With a `shared` store, entries
+    are also written there and local misses are looked up there, so workers
+    reuse each other's responses.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, shared: StateStore | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: OrderedDict[str, CachedStream] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: str) -> CachedStream | None:
+        """The entry in this process's cache; `fetch` also looks in the shared store."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    async def fetch(self, key: str) -> CachedStream | None:
+        entry = self.get(key)
+        if entry is not None or self.shared is None or not self.enabled:
+            return entry
+        return await self.shared.run(self._get_shared, key)
+
+    def _get_shared(self, key: str) -> CachedStream | None:
+        try:
+            blob = self.shared.get(SHARED_PREFIX + key)
+            remaining = self.shared.ttl(SHARED_PREFIX + key) if blob else 0
+        except Exception as e:
+            logging.error(f"Shared response cache read failed: {e}")
+            return None
+        if not blob or remaining <= 0:
+            return None
+
+        entry = CachedStream.from_bytes(blob, time.monotonic() + remaining)
+        self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, chunks: Iterable[str | bytes]) -> CachedStream | None:
+        if not self.enabled:
+            return None
+
+        entry = CachedStream(chunks, time.monotonic() + self.ttl)
+        if entry.size > self.max_bytes:
+            return None
+
+        self._insert(key, entry)
+        if self.shared is not None:
+            # Called from a stream's pump, so the shared write is not awaited
+            self.shared.submit(self._put_shared, key, entry)
+        return entry
+
+    def _put_shared(self, key: str, entry: CachedStream):
+        try:
+            self.shared.set(SHARED_PREFIX + key, entry.to_bytes(), self.ttl)
+        except Exception as e:
+            logging.error(f"Shared response cache write failed: {e}")
+
+    def _insert(self, key: str, entry: CachedStream):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            self._remove(key)
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
@@ -0,0 +1,94 @@
+import re
+
+from typing import Callable, List, NamedTuple
+
+# Lines that usually open a new top-level construct across the languages
+# content.json points at (Python, JS/TS, Go, Rust, C-likes, HTML)
+_DEFINITION = re.compile(
+    r"^(?:(?:async\s+)?(?:def|function)|class|export|const|let|var|public|private|"
+    r"protected|internal|static|func|fn|pub|impl|struct|enum|interface|type|module|"
+    r"package|import|from)\b|^(?:#include|#define|<[A-Za-z!])"
+)
+
+
+class Chunk(NamedTuple):
+    text: str
+    line_start: int
+    line_end: int
+
+
+def _top_level(lines: List[str], i: int) -> bool:
+    line = lines[i]
+    if not line.strip() or line[0].isspace() or line.startswith(("}", ")", "]")):
+        return False
+    previous = lines[i - 1]
+    # Keep decorators and attributes glued to what they decorate
+    if previous.startswith(("@", "#[")):
+        return False
+    return bool(_DEFINITION.match(line)) or not previous.strip()
+
+
+def _after_blank(lines: List[str], i: int) -> bool:
+    return bool(lines[i].strip()) and not lines[i - 1].strip()
+
+
+def _every_line(lines: List[str], i: int) -> bool:
+    return True
+
+
+_LEVELS: List[Callable[[List[str], int], bool]] = [_top_level, _after_blank, _every_line]
+
+
+def split_code(code: str, max_chars: int) -> List[Chunk]:
+    """
+    Splits `code` into chunks of at most `max_chars`, cutting between
+    top-level definitions where possible, then at blank lines, then between
+    any two lines. Only a single line longer than `max_chars` is cut mid-line.
+    Line numbers are 1-based and inclusive.
+    """
+    lines = code.splitlines(keepends=True)
+    if len(code) <= max_chars:
+        return [Chunk(code, 1, max(len(lines), 1))]
+
+    chunks: List[Chunk] = []
+    _split(lines, 0, len(lines), 0, max_chars, chunks)
+    return chunks
+
+
+def _split(lines: List[str], start: int, end: int, level: int, max_chars: int, out: List[Chunk]):
+    if level >= len(_LEVELS):
+        # One line on its own is still too long
+        text = "".join(lines[start:end])
+        for offset in range(0, len(text), max_chars):
+            out.append(Chunk(text[offset:offset + max_chars], start + 1, end))
+        return
+
+    is_boundary = _LEVELS[level]
+    units = []
+    unit_start = start
+    for i in range(start + 1, end):
+        if is_boundary(lines, i):
+            units.append((unit_start, i))
+            unit_start = i
+    units.append((unit_start, end))
+
+    pending_start, pending_size = None, 0
+    for a, b in units:
+        size = sum(len(line) for line in lines[a:b])
+        if size > max_chars:
+            if pending_start is not None:
+                out.append(Chunk("".join(lines[pending_start:a]), pending_start + 1, a))
+                pending_start, pending_size = None, 0
+            _split(lines, a, b, level + 1, max_chars, out)
+            continue
+
+        if pending_start is not None and pending_size + size > max_chars:
+            out.append(Chunk("".join(lines[pending_start:a]), pending_start + 1, a))
+            pending_start, pending_size = None, 0
+
+        if pending_start is None:
+            pending_start = a
+        pending_size += size
+
+    if pending_start is not None:
+        out.append(Chunk("".join(lines[pending_start:end]), pending_start + 1, end))
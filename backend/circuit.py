@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class _Circuit:
+    __slots__ = ("state", "failures", "opened_at", "probing_since")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing_since: float | None = None
+
+
+class CircuitBreakers:
+    """
+    One circuit per upstream (a cloud provider, or a local provider at a
+    given URL). `failure_threshold` consecutive failures open it, and for
+    `reset_timeout` seconds requests to it are refused without being sent.
+    After that one request is let through as a probe: success closes the
+    circuit, failure opens it again. A probe that never reports back is
+    given up on after another `reset_timeout`.
+
+    Keys may carry client-supplied URLs, so at most `max_upstreams` circuits
+    are kept; the least recently recorded one is forgotten first.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_upstreams: int = 256):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_upstreams = max_upstreams
+        self._lock = threading.Lock()
+        self._circuits: OrderedDict[str, _Circuit] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._circuits)
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def allow(self, key: str) -> bool:
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN:
+                if now - circuit.opened_at < self.reset_timeout:
+                    return False
+                circuit.state = HALF_OPEN
+                circuit.probing_since = None
+            if circuit.probing_since is not None and now - circuit.probing_since < self.reset_timeout:
+                return False
+            circuit.probing_since = now
+            return True
+
+    def retry_after(self, key: str) -> float:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.state == CLOSED:
+                return 0.0
+            since = circuit.opened_at if circuit.state == OPEN else circuit.probing_since or 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - since))
+
+    def record(self, key: str, ok: bool):
+        if not self.enabled:
+            return
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                circuit = self._circuits[key] = _Circuit()
+                while len(self._circuits) > max(1, self.max_upstreams):
+                    self._circuits.popitem(last=False)
+            else:
+                self._circuits.move_to_end(key)
+            if ok:
+                if circuit.state != CLOSED:
+                    logging.info(f"Circuit for {key} closed")
+                circuit.state = CLOSED
+                circuit.failures = 0
+                circuit.probing_since = None
+                return
+
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or circuit.failures >= self.failure_threshold:
+                if circuit.state != OPEN:
+                    logging.error(f"Circuit for {key} opened after {circuit.failures} failures")
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+                circuit.probing_since = None
+
+    def release(self, key: str):
+        """Ends a probe that said nothing about the upstream, e.g. a rejected request."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None:
+                circuit.probing_since = None
+
+    def state(self, key: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit.state if circuit else CLOSED
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = {key: (c.state, c.failures) for key, c in self._circuits.items()}
+        return {
+            key: {"state": state, "failures": failures, "retry_after": round(self.retry_after(key), 1)}
+            for key, (state, failures) in keys.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._circuits.clear()
@@ -0,0 +1,52 @@
+import zlib
+
+from collections import Counter
+from typing import Iterable
+
+# zlib can only reference the last 32 KiB of a preset dictionary
+MAX_DICT_SIZE = 32 * 1024
+LEVEL = 9
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICT_SIZE) -> bytes:
+    """
+    Builds a zlib preset dictionary from sample alignments.
+
+    Audits produced under the same system prompt share headings, bullet
+    scaffolding and stock phrases, so lines that recur across samples are
+    ranked by how many bytes they would save. zlib encodes matches closer to
+    the end of the dictionary more cheaply, so the most valuable lines are
+    placed last.
+    """
+    counts: Counter[str] = Counter()
+    for sample in samples:
+        for line in set(sample.splitlines(keepends=True)):
+            if line.strip():
+                counts[line] += 1
+
+    recurring = [(line, n) for line, n in counts.items() if n > 1]
+    if not recurring:
+        # Too few samples to see repetition; fall back to every distinct line
+        recurring = list(counts.items())
+
+    recurring.sort(key=lambda item: item[1] * len(item[0].encode("utf-8")), reverse=True)
+
+    picked, used = [], 0
+    for line, _ in recurring:
+        encoded = line.encode("utf-8")
+        if used + len(encoded) > size:
+            continue
+        picked.append(encoded)
+        used += len(encoded)
+
+    return b"".join(reversed(picked))
+
+
+def compress(text: str, zdict: bytes | None) -> bytes:
+    compressor = zlib.compressobj(LEVEL, zdict=zdict) if zdict else zlib.compressobj(LEVEL)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress(blob: bytes, zdict: bytes | None) -> str:
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
@@ -1,6 +1,9 @@
+from typing import Dict, List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 
+from backend.constants import MODEL_NAME, MODEL_NAME_FOR_SNIPPETS
+
 class Settings(BaseSettings):
     OLLAMA_HOST: str = ""
     LLAMA_SERVER_URL: str = ""
@@ -8,6 +11,62 @@ class Settings(BaseSettings):
     DEMO_MODE: bool = False
     SERVER_SIDE_API_KEY: str = ""
     RATE_LIMIT: str = "5/minute"
+    RESPONSE_CACHE_MAX_ENTRIES: int = 512
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RESPONSE_CACHE_TTL: float = 3600.0
+    STREAM_TEE_MAX_BYTES: int = 4 * 1024 * 1024
+    STATE_BACKEND: str = "memory://"
+    SHARED_INFLIGHT_TTL: float = 300.0
+    SHARED_INFLIGHT_WAIT: float = 120.0
+    UPSTREAM_MAX_CONNECTIONS: int = 20
+    UPSTREAM_MAX_KEEPALIVE: int = 10
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 60.0
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_MAX_CLIENTS: int = 32
+    OLLAMA_MODELS_TTL: float = 60.0
+    OLLAMA_MAX_HOSTS: int = 32
+    LOCAL_BACKEND_URLS: Dict[str, List[str]] = {}
+    LOCAL_BACKEND_EJECT_AFTER: int = 2
+    LOCAL_BACKEND_PROBE_INTERVAL: float = 10.0
+    LOCAL_BACKEND_PROBE_TIMEOUT: float = 2.0
+    LOCAL_BACKEND_COOLDOWN: float = 30.0
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    OLLAMA_KEEP_ALIVE_POLICIES: Dict[str, str] = {}
+    OLLAMA_WARMUP_MODELS: List[str] = [MODEL_NAME_FOR_SNIPPETS, MODEL_NAME]
+    OLLAMA_SCHEDULE_MODELS: bool = True
+    OLLAMA_SWITCH_MAX_WAIT: float = 10.0
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_DEFAULT_DELAY: float = 2.0
+    HEDGE_MIN_DELAY: float = 0.25
+    HEDGE_MIN_SAMPLES: int = 20
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_TIMEOUT: float = 30.0
+    CIRCUIT_MAX_UPSTREAMS: int = 256
+    PROVIDER_FALLBACKS: Dict[str, List[str]] = {}
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_INITIAL_LIMIT: int = 4
+    ADMISSION_MIN_LIMIT: int = 1
+    ADMISSION_MAX_LIMIT: int = 64
+    ADMISSION_MAX_QUEUE: int = 32
+    ADMISSION_QUEUE_TIMEOUT: float = 30.0
+    ADMISSION_TARGET_TTFT: float = 5.0
+    ADMISSION_MAX_UPSTREAMS: int = 256
+    PROVIDER_CLIENT_CACHE_SIZE: int = 32
+    PROVIDER_CLIENT_IDLE_TTL: float = 300.0
+    BATCH_MAX_ITEMS: int = 100
+    BATCH_CONCURRENCY: int = 2
+    BATCH_PROVIDER_CONCURRENCY: Dict[str, int] = {}
+    MAP_REDUCE_THRESHOLD: int = 16000
+    MAP_REDUCE_PROVIDER_THRESHOLDS: Dict[str, int] = {}
+    MAP_REDUCE_CHUNK_CHARS: int = 8000
+    MAP_REDUCE_MAX_CHUNKS: int = 32
+    MAP_REDUCE_CONCURRENCY: int = 4
+    SOURCE_CACHE_MAX_ENTRIES: int = 128
+    SOURCE_CACHE_REVALIDATE_AFTER: float = 300.0
+    SOURCE_PREFETCH_CONCURRENCY: int = 8
+    DEK_CACHE_SIZE: int = 256
+    CRYPTO_WORKERS: int = 2
 
     model_config = SettingsConfigDict(
         env_file=[
@@ -1,3 +1,5 @@
+import hashlib
+
 LLAMA_SERVER_URL = "http://localhost:8080/v1/chat/completions"
 MODEL_NAME = "qwen2.5-coder:14b"
 MODEL_NAME_FOR_SNIPPETS = "qwen2.5-coder:3b"
@@ -89,3 +91,33 @@ You act as a **gatekeeper**: code that cannot survive scale, maintenance, or sec
 ## Justification
 <Clear explanation of why this score was assigned, why it was not higher, and why it was not lower>
 """
+
+# Prepended to each excerpt when a large input is analyzed in parts; it goes in
+# the code field because local providers never send the context field
+MAP_REDUCE_EXCERPT_CONTEXT = """
+This code is one excerpt of a larger file. Audit only what is shown and do not penalize references to code outside the excerpt.
+"""
+
+# Prepended to the partial audits for the merge pass, in the code field for the
+# same reason
+MAP_REDUCE_MERGE_INSTRUCTIONS = """
+The text below is not code. It is a set of audits, each covering consecutive lines of one larger file.
+Merge them into a single audit of the whole file in the required output format: drop duplicate findings, keep the strongest evidence for each, and give one overall score for the whole file.
+"""
+
+# Bumps automatically whenever either prompt changes, so cached responses
+# produced under an older prompt are never replayed.
+SYSTEM_PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT_FOR_SNIPPETS + SYSTEM_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+LOCAL_PROVIDERS = ("srvllama", "ollama")
+CLOUD_PROVIDERS = ("gemini", "openai", "grok", "claude")
+
+# Model each cloud provider is called with, as (alignment, snippet)
+CLOUD_MODELS = {
+    "gemini": ("gemini-2.5-flash", "gemini-2.5-flash"),
+    "openai": ("gpt-4o", "gpt-4o-mini"),
+    "grok": ("grok-beta", "grok-beta"),
+    "claude": ("claude-3-5-sonnet-20240620", "claude-3-haiku-20240307"),
+}
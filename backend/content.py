@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import re
+
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+CONTENT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "content.json")
+
+_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def snippet_signature(snippet: Dict[str, Any]) -> str:
+    """
+    Same key js/alignment.js builds: `${repoUrl}|${lineStart || ''}|${lineEnd || ''}`.
+    """
+    line_start = snippet.get("lineStart") or ""
+    line_end = snippet.get("lineEnd") or ""
+    return f"{snippet['repoUrl']}|{line_start}|{line_end}"
+
+
+def parse_signature(signature: str) -> Tuple[str, int | None, int | None]:
+    """Inverse of snippet_signature."""
+    repo_url, sep, rest = signature.partition("|")
+    line_start, sep2, line_end = rest.partition("|")
+    if not (sep and sep2) or "|" in line_end:
+        raise ValueError(f"Malformed snippet signature: {signature!r}")
+    return (
+        repo_url,
+        int(line_start) if line_start else None,
+        int(line_end) if line_end else None,
+    )
+
+
+def trim_lines(code: str, line_start: int | None, line_end: int | None) -> str:
+    """Same slice js/alignment.js takes before sending a snippet for analysis."""
+    if not (line_start and line_end):
+        return code
+    return "\n".join(re.split(r"\r?\n", code)[int(line_start) - 1:int(line_end)])
+
+
+def load_content(path: str | None = None) -> Dict[str, Any]:
+    """Parsed content.json, re-read only when the file changes on disk."""
+    path = path or CONTENT_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError as e:
+        logging.error(f"Failed to stat content file {path}: {e}")
+        return {"collection": []}
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, encoding="utf-8") as f:
+        content = json.load(f)
+    _cache[path] = (mtime, content)
+    return content
+
+
+def get_project(name: str, path: str | None = None) -> Dict[str, Any] | None:
+    for project in load_content(path).get("collection", []):
+        if project.get("project") == name:
+            return project
+    return None
+
+
+def iter_snippets(project: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for section in project.get("data", []):
+        for snippet in section.get("snippets", []):
+            if snippet.get("repoUrl"):
+                yield snippet
+
+
+def source_urls(path: str | None = None) -> Set[str]:
+    """Every repoUrl content.json references; the only URLs the backend will fetch."""
+    return {
+        snippet["repoUrl"]
+        for project in load_content(path).get("collection", [])
+        for snippet in iter_snippets(project)
+    }
+
+
+def project_signatures(project: Dict[str, Any]) -> List[str]:
+    return list(dict.fromkeys(snippet_signature(s) for s in iter_snippets(project)))
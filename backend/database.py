@@ -1,45 +1,453 @@
+import asyncio
+import queue
 import sqlite3
 import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from backend import compression
+from backend.metrics import db_seconds
+from backend.constants import SYSTEM_PROMPT
 
 DB_NAME = ".alignments.db"
 
+# Statements are module constants so each long-lived connection compiles them
+# once and serves later calls from sqlite3's per-connection statement cache.
+#
+# alignment_text holds rows written before compression was introduced; new
+# rows leave it NULL and store zlib output in alignment_blob, compressed
+# against the preset dictionary referenced by dict_id.
+CREATE_ALIGNMENTS_SQL = """
+    CREATE TABLE IF NOT EXISTS alignments (
+        signature TEXT PRIMARY KEY,
+        alignment_text TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        alignment_blob BLOB,
+        dict_id INTEGER
+    )
+"""
+CREATE_DICTIONARIES_SQL = """
+    CREATE TABLE IF NOT EXISTS compression_dicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data BLOB NOT NULL,
+        created DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+# Millisecond timestamps keep `since` deltas and ETags precise; they still
+# sort correctly against rows written with second-precision CURRENT_TIMESTAMP
+UPSERT_ALIGNMENT_SQL = """
+    INSERT OR REPLACE INTO alignments (signature, alignment_text, alignment_blob, dict_id, timestamp)
+    VALUES (?, NULL, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+"""
+SELECT_ALIGNMENTS_SQL = "SELECT signature, alignment_text, alignment_blob, dict_id FROM alignments"
+SELECT_DICTIONARY_SQL = "SELECT data FROM compression_dicts WHERE id = ?"
+SELECT_LATEST_DICTIONARY_SQL = "SELECT id, data FROM compression_dicts ORDER BY id DESC LIMIT 1"
+INSERT_DICTIONARY_SQL = "INSERT INTO compression_dicts (data) VALUES (?)"
+CREATE_TIMESTAMP_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_alignments_timestamp ON alignments (timestamp)"
+
+# Highest code point, used as the exclusive upper bound of a prefix range
+_PREFIX_END = "\U0010ffff"
+
+
+class ConnectionManager:
+    """
+    Long-lived SQLite connections in WAL mode. Each database has a single
+    writer connection serialized by a lock, and each thread gets its own
+    reader connection, so reads proceed while a write is in progress.
+    """
+
+    def __init__(self, cached_statements: int = 64):
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._writers: Dict[str, sqlite3.Connection] = {}
+        self._write_locks: Dict[str, threading.Lock] = {}
+        self._readers: List[sqlite3.Connection] = []
+        self._local = threading.local()
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        # Each connection is only used by one thread at a time, but
+        # close_all() must be able to close them from whichever thread
+        # shuts the app down.
+        conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def writer(self, path: str | None = None) -> Iterator[sqlite3.Connection]:
+        path = path or DB_NAME
+        with self._lock:
+            conn = self._writers.get(path)
+            if conn is None:
+                conn = self._connect(path)
+                self._writers[path] = conn
+                self._write_locks[path] = threading.Lock()
+            write_lock = self._write_locks[path]
+
+        with write_lock:
+            # Commits on success, rolls back if the block raises
+            with conn:
+                yield conn
+
+    def reader(self, path: str | None = None) -> sqlite3.Connection:
+        path = path or DB_NAME
+        readers = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = self._local.readers = {}
+
+        conn = readers.get(path)
+        if conn is None:
+            conn = self._connect(path)
+            readers[path] = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._writers.values()) + self._readers
+            self._writers.clear()
+            self._write_locks.clear()
+            self._readers.clear()
+            # A fresh thread-local makes every thread open a new reader
+            self._local = threading.local()
+
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception as e:
+                logging.error(f"Failed to close database connection: {e}")
+
+
+class AlignmentWriter:
+    """
+    Write-behind queue for alignments. Callers enqueue and return
+    immediately; a background thread drains the queue and commits
+    everything pending in one transaction per batch.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int = 256, linger: float = 0.05):
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, signature: str, text: str):
+        self._ensure_started()
+        # The path is resolved now so a write lands in the database that was
+        # current when the stream finished
+        self._queue.put((DB_NAME, signature, text))
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="alignment-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.linger))
+                    if batch[-1] is self._STOP:
+                        break
+            except queue.Empty:
+                pass
+
+            stop = batch[-1] is self._STOP
+            items = batch[:-1] if stop else batch
+            try:
+                self._write(items)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items: List[Tuple[str, str, str]]):
+        by_path: Dict[str, Dict[str, str]] = {}
+        for path, signature, text in items:
+            # Later saves of the same signature supersede earlier ones
+            by_path.setdefault(path, {})[signature] = text
+
+        for path, rows in by_path.items():
+            save_alignments(rows.items(), path)
+
+    def flush(self):
+        """Blocks until everything enqueued so far has been committed."""
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join()
+
+
+connections = ConnectionManager()
+alignment_writer = AlignmentWriter()
+
+_read_executor: ThreadPoolExecutor | None = None
+
+async def run_read(fn: Callable[..., Any], *args) -> Any:
+    """Runs a blocking database read on the dedicated reader pool."""
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-read")
+    return await asyncio.get_running_loop().run_in_executor(_read_executor, fn, *args)
+
+def shutdown():
+    """Flushes pending writes, then closes the reader pool and connections."""
+    global _read_executor
+    alignment_writer.close()
+    if _read_executor is not None:
+        _read_executor.shutdown(wait=True)
+        _read_executor = None
+    connections.close_all()
+
+
+# Dictionaries are immutable once written, so they are cached per database
+_dictionaries: Dict[Tuple[str, int], bytes] = {}
+_current_dictionary: Dict[str, Tuple[int, bytes]] = {}
+
+def _upgrade_schema(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(alignments)")}
+    if "alignment_blob" not in columns:
+        conn.execute("ALTER TABLE alignments ADD COLUMN alignment_blob BLOB")
+    if "dict_id" not in columns:
+        conn.execute("ALTER TABLE alignments ADD COLUMN dict_id INTEGER")
+
+def _store_dictionary(conn: sqlite3.Connection, path: str, data: bytes) -> int:
+    dict_id = conn.execute(INSERT_DICTIONARY_SQL, (data,)).lastrowid
+    _dictionaries[(path, dict_id)] = data
+    _current_dictionary[path] = (dict_id, data)
+    return dict_id
+
+def _writer_dictionary(conn: sqlite3.Connection, path: str) -> Tuple[int, bytes]:
+    current = _current_dictionary.get(path)
+    if current is not None:
+        return current
+
+    row = conn.execute(SELECT_LATEST_DICTIONARY_SQL).fetchone()
+    if row is not None:
+        _dictionaries[(path, row[0])] = row[1]
+        _current_dictionary[path] = (row[0], row[1])
+        return row[0], row[1]
+
+    # Nothing trained yet: the audits mirror the prompt's output format, so
+    # the prompt plus whatever rows exist is a reasonable seed
+    samples = [r[0] for r in conn.execute("SELECT alignment_text FROM alignments WHERE alignment_text IS NOT NULL LIMIT 500")]
+    data = compression.train_dictionary(samples + [SYSTEM_PROMPT])
+    dict_id = _store_dictionary(conn, path, data)
+    return dict_id, data
+
+def _dictionary(path: str, dict_id: int) -> bytes:
+    data = _dictionaries.get((path, dict_id))
+    if data is None:
+        row = connections.reader(path).execute(SELECT_DICTIONARY_SQL, (dict_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"Compression dictionary {dict_id} is missing")
+        data = _dictionaries[(path, dict_id)] = row[0]
+    return data
+
+def _decode(path: str, text: str | None, blob: bytes | None, dict_id: int | None) -> str | None:
+    if blob is None:
+        return text
+    zdict = _dictionary(path, dict_id) if dict_id is not None else None
+    return compression.decompress(blob, zdict)
+
+def _decode_rows(path: str, rows: Iterable[tuple]) -> Dict[str, str]:
+    """Decodes (signature, text, blob, dict_id) rows, leaving out any that cannot be decoded."""
+    alignments = {}
+    for signature, *stored in rows:
+        try:
+            alignments[signature] = _decode(path, *stored)
+        except Exception as e:
+            logging.error(f"Failed to decode alignment {signature}: {e}")
+    return alignments
+
+def init_db_at(path: str):
+    with connections.writer(path) as conn:
+        conn.execute(CREATE_ALIGNMENTS_SQL)
+        conn.execute(CREATE_DICTIONARIES_SQL)
+        _upgrade_schema(conn)
+        conn.execute(CREATE_TIMESTAMP_INDEX_SQL)
+
 def init_db():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS alignments (
-                signature TEXT PRIMARY KEY,
-                alignment_text TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        conn.close()
+        init_db_at(DB_NAME)
     except Exception as e:
         logging.error(f"Failed to initialize database: {e}")
 
 def save_alignment(signature: str, text: str):
+    save_alignments([(signature, text)])
+
+def save_alignments(rows: Iterable[Tuple[str, str]], path: str | None = None):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO alignments (signature, alignment_text, timestamp)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        """, (signature, text))
-        conn.commit()
-        conn.close()
+        write_alignments(rows, path)
     except Exception as e:
-        logging.error(f"Failed to save alignment for {signature}: {e}")
+        logging.error(f"Failed to save alignments: {e}")
+
+def write_alignments(rows: Iterable[Tuple[str, str]], path: str | None = None):
+    """Like save_alignments, but raises when the write fails."""
+    path = path or DB_NAME
+    with db_seconds.time(operation="write"), connections.writer(path) as conn:
+        dict_id, zdict = _writer_dictionary(conn, path)
+        conn.executemany(
+            UPSERT_ALIGNMENT_SQL,
+            ((signature, compression.compress(text, zdict), dict_id) for signature, text in rows),
+        )
+
+def _decode_with(conn: sqlite3.Connection, path: str, text: str | None, blob: bytes | None, dict_id: int | None) -> str | None:
+    # Decoding inside the writer transaction must not go through a reader
+    if blob is not None and dict_id is not None and (path, dict_id) not in _dictionaries:
+        row = conn.execute(SELECT_DICTIONARY_SQL, (dict_id,)).fetchone()
+        _dictionaries[(path, dict_id)] = row[0]
+    return _decode(path, text, blob, dict_id)
+
+def compress_existing(path: str | None = None, sample_limit: int = 2000) -> Dict[str, int]:
+    """
+    In-place migration: trains a fresh dictionary on the stored alignments,
+    re-encodes every row with it (plain-text rows included) and vacuums the
+    file. Older dictionaries are kept: a running worker keeps compressing
+    against the one it cached until it restarts.
+    Timestamps are left untouched so /alignments ETags and deltas stay valid.
+    """
+    path = path or DB_NAME
+    init_db_at(path)
+    stats = {"rows": 0, "bytes_before": 0, "bytes_after": 0}
+
+    with connections.writer(path) as conn:
+        rows = conn.execute("SELECT signature, alignment_text, alignment_blob, dict_id FROM alignments").fetchall()
+        texts = [(row[0], _decode_with(conn, path, *row[1:])) for row in rows]
+
+        data = compression.train_dictionary([t for _, t in texts[:sample_limit] if t])
+        dict_id = _store_dictionary(conn, path, data)
+
+        for (signature, text), row in zip(texts, rows):
+            if text is None:
+                continue
+            blob = compression.compress(text, data)
+            stats["rows"] += 1
+            stats["bytes_before"] += len(row[2]) if row[2] is not None else len(row[1].encode("utf-8"))
+            stats["bytes_after"] += len(blob)
+            conn.execute(
+                "UPDATE alignments SET alignment_text = NULL, alignment_blob = ?, dict_id = ? WHERE signature = ?",
+                (blob, dict_id, signature),
+            )
+
+    with connections.writer(path) as conn:
+        conn.execute("VACUUM")
+
+    return stats
+
+def queue_alignment(signature: str, text: str):
+    alignment_writer.enqueue(signature, text)
 
 def get_all_alignments():
+    path = DB_NAME
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT signature, alignment_text FROM alignments")
-        rows = cursor.fetchall()
-        conn.close()
-        return {row[0]: row[1] for row in rows}
+        with db_seconds.time(operation="read"):
+            rows = connections.reader(path).execute(SELECT_ALIGNMENTS_SQL).fetchall()
+            return _decode_rows(path, rows)
     except Exception as e:
         logging.error(f"Failed to fetch alignments: {e}")
         return {}
+
+def _alignment_filters(
+    prefix: str | None = None,
+    signatures: List[str] | None = None,
+    since: str | None = None,
+) -> Tuple[str, list]:
+    clauses, params = [], []
+    if prefix:
+        # A range on the primary key instead of LIKE, which would need escaping
+        # and cannot use the index
+        clauses.append("signature >= ? AND signature < ?")
+        params += [prefix, prefix + _PREFIX_END]
+    if signatures is not None:
+        clauses.append(f"signature IN ({','.join('?' * len(signatures))})")
+        params += signatures
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def get_alignments_version(
+    prefix: str | None = None,
+    signatures: List[str] | None = None,
+    since: str | None = None,
+) -> Tuple[int, str | None]:
+    """Row count and newest timestamp of a filtered view, without reading any text."""
+    if signatures is not None and not signatures:
+        return 0, None
+    where, params = _alignment_filters(prefix, signatures, since)
+    try:
+        with db_seconds.time(operation="read"):
+            row = connections.reader().execute(
+                f"SELECT COUNT(*), MAX(timestamp) FROM alignments{where}", params
+            ).fetchone()
+        return row[0], row[1]
+    except Exception as e:
+        logging.error(f"Failed to fetch alignments version: {e}")
+        return 0, None
+
+def query_alignments(
+    prefix: str | None = None,
+    signatures: List[str] | None = None,
+    since: str | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+) -> Dict[str, str]:
+    if signatures is not None and not signatures:
+        return {}
+    path = DB_NAME
+    where, params = _alignment_filters(prefix, signatures, since)
+    sql = f"{SELECT_ALIGNMENTS_SQL}{where} ORDER BY signature"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    elif offset:
+        sql += " LIMIT -1 OFFSET ?"
+        params.append(offset)
+    try:
+        # Rows are only decompressed here, after filtering and pagination
+        with db_seconds.time(operation="read"):
+            rows = connections.reader(path).execute(sql, params).fetchall()
+            return _decode_rows(path, rows)
+    except Exception as e:
+        logging.error(f"Failed to fetch alignments: {e}")
+        return {}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compress stored alignments in place with a trained dictionary.")
+    parser.add_argument("--db", default=DB_NAME, help="Path to the alignments database.")
+    args = parser.parse_args()
+
+    stats = compress_existing(args.db)
+    ratio = stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else 1.0
+    print(f"Compressed {stats['rows']} alignments: {stats['bytes_before']} -> {stats['bytes_after']} bytes ({ratio:.1%})")
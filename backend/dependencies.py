@@ -1,7 +1,14 @@
+from functools import partial
+
+from fastapi import Request
+
 from backend.generators import ollama_stream, llama_stream
 
-def get_llama_streamer():
-    return llama_stream
+def get_llama_streamer(request: Request):
+    pool = getattr(request.app.state, "http_pool", None)
+    if pool is None:
+        return llama_stream
+    return partial(llama_stream, pool=pool)
 
 def get_ollama_streamer():
     return ollama_stream
@@ -1,53 +1,85 @@
-from anthropic import APIError as AnthropicAPIError, Anthropic
 import httpx
 import json
 import logging
-from typing import AsyncGenerator
+from typing import TYPE_CHECKING, AsyncGenerator, Callable
 
 from fastapi import HTTPException
-from ollama import AsyncClient
+
+# Provider SDKs are imported where they are used so only the ones in use are loaded
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+    from ollama import AsyncClient
 
 from backend.constants import SYSTEM_PROMPT, SYSTEM_PROMPT_FOR_SNIPPETS
+from backend.http_pool import HTTPClientPool
+from backend.prompt_cache import as_count, stats as prompt_cache_stats
+
+async def _llama_events(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: dict,
+) -> AsyncGenerator[str, None]:
+    async with client.stream("POST", url, json=payload) as response:
+        if response.status_code != 200:
+            error_msg = await response.aread()
+            logging.error(f"Llama Server Error: {error_msg.decode()}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail="Llama server error",
+            )
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+
+            data_str = line[6:]
+            if data_str.strip() == "[DONE]":
+                break
+
+            data_json = json.loads(data_str)
+
+            # With cache_prompt the final event reports how much of the prompt was reused
+            timings = data_json.get("timings")
+            if isinstance(timings, dict):
+                cached = as_count(timings.get("cache_n"))
+                evaluated = as_count(timings.get("prompt_n")) or 0
+                prompt_cache_stats.record("srvllama", cached, (cached or 0) + evaluated)
+
+            delta = data_json.get("choices", [{}])[0].get("delta", {})
+            content = delta.get("content", "")
+            if content:
+                yield content
+
 
 async def llama_stream(
     url: str,
     payload: dict,
+    pool: HTTPClientPool | None = None,
 ) -> AsyncGenerator[str, None]:
     try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", url, json=payload) as response:
-                if response.status_code != 200:
-                    error_msg = await response.aread()
-                    logging.error(f"Llama Server Error: {error_msg.decode()}")
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail="Llama server error",
-                    )
-
-                async for line in response.aiter_lines():
-                    if not line.startswith("data: "):
-                        continue
-
-                    data_str = line[6:]
-                    if data_str.strip() == "[DONE]":
-                        break
-
-                    data_json = json.loads(data_str)
-                    delta = data_json.get("choices", [{}])[0].get("delta", {})
-                    content = delta.get("content", "")
-                    if content:
-                        yield content
+        if pool is None:
+            async with httpx.AsyncClient(timeout=None) as client:
+                async for content in _llama_events(client, url, payload):
+                    yield content
+        else:
+            async with pool.client(url) as client:
+                async for content in _llama_events(client, url, payload):
+                    yield content
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
         yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
 
 
 async def ollama_stream(
-    client: AsyncClient | None,
+    client: "AsyncClient | None",
     full_prompt: str,
     model: str,
     use_snippet: bool | None,
+    on_model_missing: Callable[[str], None] | None = None,
+    keep_alive: str | None = None,
 ) -> AsyncGenerator[str, None]:
+        from ollama import ResponseError
+
         try:
             if client is None:
                 raise HTTPException(
@@ -63,33 +95,76 @@ async def ollama_stream(
 
             system = SYSTEM_PROMPT_FOR_SNIPPETS if use_snippet else SYSTEM_PROMPT
 
+            # A resident model reuses the KV cache of the shared system prompt,
+            # so keep it loaded between requests
             stream = await client.generate(
                 model=model,
                 prompt=full_prompt,
                 system=system,
-                stream=True
+                stream=True,
+                keep_alive=keep_alive,
             )
 
             async for chunk in stream:
                 response_text = chunk.get("response", "")
                 if response_text:
                     yield response_text
+                if chunk.get("done"):
+                    record_ollama_usage(chunk, system + full_prompt)
+        except ResponseError as e:
+            if e.status_code == 404 and on_model_missing is not None:
+                on_model_missing(model)
+            logging.error(f"Ollama Error: {e}")
+            yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
             yield f"\n[SERVER_ERROR] An unexpected error occurred: {e}"
 
-async def anthtropic_stream(client: Anthropic, systemPrompt: str, user_content: str, model_name: str) -> AsyncGenerator[str, None]: 
+def record_ollama_usage(chunk, full_text: str):
+    # Ollama only reports the tokens it had to evaluate; with the prefix
+    # reused that is far fewer than the whole prompt. Four characters per
+    # token is close enough to tell the two cases apart.
+    evaluated = as_count(chunk.get("prompt_eval_count"))
+    if evaluated is None:
+        return
+    estimated = len(full_text) // 4
+    cached = max(estimated - evaluated, 0) if evaluated < estimated // 2 else 0
+    prompt_cache_stats.record("ollama", cached, max(estimated, evaluated))
+
+
+async def record_anthropic_usage(stream):
     try:
-        with client.messages.stream(
+        message = await stream.get_final_message()
+        usage = message.usage
+    except Exception as e:
+        logging.debug(f"Claude usage unavailable: {e}")
+        return
+    cached = as_count(getattr(usage, "cache_read_input_tokens", None))
+    total = sum(
+        as_count(getattr(usage, field, None)) or 0
+        for field in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+    )
+    prompt_cache_stats.record("claude", cached, total)
+
+
+async def anthtropic_stream(client: "AsyncAnthropic", systemPrompt: str, user_content: str, model_name: str) -> AsyncGenerator[str, None]: 
+    from anthropic import APIError as AnthropicAPIError
+
+    try:
+        async with client.messages.stream(
             max_tokens=4096,
-            system=systemPrompt,
+            # The system prompt is identical across requests, so let Anthropic cache it
+            system=[
+                {"type": "text", "text": systemPrompt, "cache_control": {"type": "ephemeral"}}
+            ],
             messages=[
                 {"role": "user", "content": user_content}
             ],
             model=model_name,
         ) as stream:
-            for text in stream.text_stream:
+            async for text in stream.text_stream:
                 yield text
+            await record_anthropic_usage(stream)
 
     except AnthropicAPIError as e:
         logging.error(f"Claude API Error: {e}")
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+
+from collections import Counter, deque
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Deque, Dict, NamedTuple
+
+from backend.cache import is_error_chunk
+from backend.streaming import close_stream, resume_stream
+
+# Opens a provider stream and returns its body, raising HTTPException on setup errors
+Opener = Callable[[], Awaitable[AsyncIterator]]
+
+
+def _text(chunk: Any) -> str:
+    return chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else chunk or ""
+
+
+class HedgeResult(NamedTuple):
+    winner: str
+    body: AsyncIterator
+    hedged: bool
+
+
+class _Attempt:
+    def __init__(self, provider: str, opener: Opener):
+        self.provider = provider
+        self.body: AsyncIterator | None = None
+        self.started = time.monotonic()
+        self.elapsed: float | None = None
+        self.task = asyncio.create_task(self._first_chunk(opener))
+
+    async def _first_chunk(self, opener: Opener):
+        self.body = await opener()
+        try:
+            return await self.body.__anext__()
+        except StopAsyncIteration:
+            return ""
+        finally:
+            self.elapsed = time.monotonic() - self.started
+
+    @property
+    def succeeded(self) -> bool:
+        if not self.task.done() or self.task.cancelled() or self.task.exception() is not None:
+            return False
+        text = _text(self.task.result())
+        return bool(text) and not is_error_chunk(text)
+
+    def stream(self) -> AsyncIterator:
+        # Re-raises the opener's error, e.g. an HTTPException for a missing key
+        return resume_stream(self.task.result(), self.body)
+
+    async def close(self):
+        if not self.task.done():
+            self.task.cancel()
+        await asyncio.wait([self.task])
+        if not self.task.cancelled() and self.task.exception() is not None:
+            logging.debug(f"Hedged {self.provider} attempt failed: {self.task.exception()}")
+        await close_stream(self.body)
+
+
+class Hedger:
+    """
+    Races a second provider against a slow first one. The primary gets the
+    `percentile` time-to-first-chunk observed for it (or `default_delay`
+    until `min_samples` are in); if it has not produced a chunk by then the
+    secondary is started and whichever emits first is streamed while the
+    other is cancelled. A failed first chunk never wins a race it can lose.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        default_delay: float = 2.0,
+        min_delay: float = 0.25,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._outcomes: Dict[str, Dict[str, Any]] = {}
+
+    def record_ttft(self, provider: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, provider: str) -> float:
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if len(samples) < max(1, self.min_samples):
+            return self.default_delay
+        rank = min(len(samples), max(1, math.ceil(self.percentile / 100 * len(samples))))
+        return max(self.min_delay, samples[rank - 1])
+
+    def record_outcome(self, primary: str, winner: str, hedged: bool):
+        with self._lock:
+            entry = self._outcomes.setdefault(primary, {"requests": 0, "hedged": 0, "wins": Counter()})
+            entry["requests"] += 1
+            entry["hedged"] += int(hedged)
+            entry["wins"][winner] += 1
+
+    async def run(
+        self,
+        primary: str,
+        open_primary: Opener,
+        secondary: str,
+        open_secondary: Opener,
+    ) -> HedgeResult:
+        first = _Attempt(primary, open_primary)
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait([first.task], timeout=self.delay(primary))
+            if not done:
+                logging.info(f"No first chunk from {primary} in time, hedging with {secondary}")
+                attempts.append(_Attempt(secondary, open_secondary))
+                winner = await self._race(attempts)
+            else:
+                winner = first
+        except BaseException:
+            # The request itself went away; nothing may outlive it
+            for attempt in attempts:
+                if attempt.task.done():
+                    asyncio.ensure_future(close_stream(attempt.body))
+                else:
+                    attempt.task.cancel()
+            raise
+
+        for attempt in attempts:
+            if attempt is not winner:
+                # A cancelled attempt took at least this long; keep it as a lower bound
+                if not attempt.task.done():
+                    self.record_ttft(attempt.provider, time.monotonic() - attempt.started)
+                await attempt.close()
+        if winner.succeeded:
+            self.record_ttft(winner.provider, winner.elapsed)
+
+        hedged = len(attempts) > 1
+        self.record_outcome(primary, winner.provider, hedged)
+        return HedgeResult(winner.provider, winner.stream(), hedged)
+
+    async def _race(self, attempts) -> _Attempt:
+        pending = {attempt.task for attempt in attempts}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Ties go to the primary, which comes first
+            for attempt in attempts:
+                if attempt.task in done and attempt.succeeded:
+                    return attempt
+        # Both failed: answer as an unhedged request would have
+        return attempts[0]
+
+    async def timed(self, provider: str, body: AsyncIterator, started: float) -> AsyncGenerator[Any, None]:
+        """Passes an unhedged stream through, sampling its time to first chunk."""
+        waiting = True
+        try:
+            async for chunk in body:
+                if waiting:
+                    waiting = False
+                    text = _text(chunk)
+                    if text and not is_error_chunk(text):
+                        self.record_ttft(provider, time.monotonic() - started)
+                yield chunk
+        finally:
+            await close_stream(body)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = list(self._samples)
+            outcomes = {
+                primary: {**entry, "wins": dict(entry["wins"])}
+                for primary, entry in self._outcomes.items()
+            }
+        return {
+            "deadlines": {provider: round(self.delay(provider), 3) for provider in providers},
+            "outcomes": outcomes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._outcomes.clear()
@@ -0,0 +1,94 @@
+import asyncio
+import importlib.util
+import logging
+
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def base_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class _Entry:
+    __slots__ = ("client", "active")
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.active = 0
+
+
+class HTTPClientPool:
+    """
+    Long-lived httpx clients, one per upstream origin, so streaming calls to
+    the same llama-server reuse kept-alive connections instead of paying a
+    TCP/TLS handshake per request. Origins can come from request headers, so
+    beyond `max_clients` the least recently used clients with no request in
+    progress are closed.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        max_clients: int = 32,
+    ):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logging.warning("HTTP/2 requested for the upstream pool but 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_clients = max_clients
+        self._clients: OrderedDict[str, _Entry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    @asynccontextmanager
+    async def client(self, url: str) -> AsyncIterator[httpx.AsyncClient]:
+        """The client for `url`'s origin, kept open until the block exits."""
+        key = base_url(url)
+        entry = self._clients.get(key)
+        if entry is None or entry.client.is_closed:
+            entry = _Entry(httpx.AsyncClient(timeout=None, limits=self.limits, http2=self.http2))
+            self._clients[key] = entry
+        else:
+            self._clients.move_to_end(key)
+
+        entry.active += 1
+        try:
+            yield entry.client
+        finally:
+            entry.active -= 1
+            self._evict()
+
+    def _evict(self):
+        overflow = len(self._clients) - max(1, self.max_clients)
+        idle = [key for key, e in self._clients.items() if e.active == 0][:max(0, overflow)]
+        for key in idle:
+            asyncio.get_running_loop().create_task(_close(self._clients.pop(key).client))
+
+    async def aclose(self):
+        clients = [e.client for e in self._clients.values()]
+        self._clients.clear()
+        for client in clients:
+            await _close(client)
+
+
+async def _close(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception as e:
+        logging.error(f"Failed to close pooled HTTP client: {e}")
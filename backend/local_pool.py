@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+
+from typing import Any, Dict, List
+
+import httpx
+
+from backend.http_pool import base_url
+
+# Cheap endpoints that answer only when the server is up and ready
+PROBE_PATHS = {
+    "srvllama": "/health",
+    "ollama": "/api/version",
+}
+
+
+class Backend:
+    __slots__ = ("provider", "url", "outstanding", "failures", "healthy", "checked_at", "ejected_at")
+
+    def __init__(self, provider: str, url: str):
+        self.provider = provider
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self.checked_at = 0.0
+        self.ejected_at = 0.0
+
+
+class BackendLease:
+    def __init__(self, pool: "LocalBackendPool", backend: Backend):
+        self._pool = pool
+        self._released = False
+        self.backend = backend
+        self.url = backend.url
+
+    def release(self, failed: bool = False):
+        if self._released:
+            return
+        self._released = True
+        self.backend.outstanding -= 1
+        self._pool.report(self.backend, ok=not failed)
+
+
+class LocalBackendPool:
+    """
+    Server-side pools of llama-server / Ollama instances, keyed by local
+    provider name. Each request goes to the healthy backend with the fewest
+    streams in progress. A backend is ejected after `eject_after` consecutive
+    failures, whether seen by a request or by the periodic health probe, and
+    rejoins on its first successful probe. With probing off
+    (`probe_interval` <= 0) it instead gets a trial request once `cooldown`
+    seconds have passed, and a failed trial ejects it again.
+    """
+
+    def __init__(
+        self,
+        urls: Dict[str, List[str]],
+        eject_after: int = 2,
+        probe_interval: float = 10.0,
+        probe_timeout: float = 2.0,
+        cooldown: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.eject_after = max(1, eject_after)
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.cooldown = cooldown
+        self._transport = transport
+        self._backends: Dict[str, List[Backend]] = {
+            provider: [Backend(provider, url) for url in dict.fromkeys(provider_urls)]
+            for provider, provider_urls in urls.items()
+            if provider_urls
+        }
+        self._next: Dict[str, int] = {}
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+
+    def has(self, provider: str | None) -> bool:
+        return bool(provider) and provider in self._backends
+
+    def backends(self, provider: str) -> List[Backend]:
+        return list(self._backends.get(provider, []))
+
+    def acquire(self, provider: str) -> BackendLease:
+        if self.probe_interval <= 0:
+            self._readmit(provider)
+        backends = [b for b in self._backends.get(provider, []) if b.healthy]
+        if not backends:
+            raise LookupError(f"No healthy {provider} backend")
+
+        # Rotate the starting point so ties do not all land on the first node
+        start = self._next.get(provider, 0) % len(backends)
+        self._next[provider] = start + 1
+        rotated = backends[start:] + backends[:start]
+        backend = min(rotated, key=lambda b: b.outstanding)
+
+        backend.outstanding += 1
+        return BackendLease(self, backend)
+
+    def report(self, backend: Backend, ok: bool):
+        if ok:
+            if not backend.healthy:
+                logging.info(f"Local backend {backend.url} is healthy again")
+            backend.failures = 0
+            backend.healthy = True
+            return
+
+        backend.failures += 1
+        if backend.healthy and backend.failures >= self.eject_after:
+            logging.error(f"Ejecting local backend {backend.url} after {backend.failures} failures")
+            backend.healthy = False
+            backend.ejected_at = time.monotonic()
+
+    def _readmit(self, provider: str):
+        now = time.monotonic()
+        for b in self._backends.get(provider, []):
+            if not b.healthy and now - b.ejected_at >= self.cooldown:
+                logging.info(f"Retrying local backend {b.url} after its cool-down")
+                b.healthy = True
+                # One more failure ejects it again
+                b.failures = self.eject_after - 1
+
+    async def probe(self, backend: Backend) -> bool:
+        path = PROBE_PATHS.get(backend.provider, "/")
+        try:
+            response = await self._get_client().get(base_url(backend.url) + path)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        backend.checked_at = time.monotonic()
+        self.report(backend, ok)
+        return ok
+
+    async def probe_all(self):
+        backends = [b for group in self._backends.values() for b in group]
+        await asyncio.gather(*(self.probe(b) for b in backends))
+
+    async def _probe_forever(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logging.error(f"Local backend probe failed: {e}")
+            await asyncio.sleep(self.probe_interval)
+
+    def start(self):
+        if self._backends and self.probe_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._probe_forever())
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            provider: [
+                {"url": b.url, "healthy": b.healthy, "outstanding": b.outstanding, "failures": b.failures}
+                for b in group
+            ]
+            for provider, group in self._backends.items()
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.probe_timeout, transport=self._transport)
+        return self._client
+
+    def reset(self):
+        for group in self._backends.values():
+            for b in group:
+                b.outstanding = 0
+                b.failures = 0
+                b.healthy = True
+        self._next.clear()
+        self._client = None
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,262 @@
+import bisect
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Collection, Dict, Iterator, List, Sequence, Tuple
+
+from backend.cache import is_error_chunk
+from backend.streaming import close_stream
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+# Label value for anything outside a known set, so clients cannot create series
+OTHER = "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name] if labels[name] is not None else "") for name in self.labels)
+
+    def _selector(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._selector(key)} {_number(value)}" for key, value in values]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (the last one is +Inf), then sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._selector(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._selector(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._selector(key)} {cumulative}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+STREAM_LABELS = ("provider", "model")
+
+ttft_seconds = registry.register(Histogram(
+    "showcode_stream_ttft_seconds",
+    "Seconds from calling a provider handler to its first non-error chunk.",
+    (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+    STREAM_LABELS,
+))
+stream_duration_seconds = registry.register(Histogram(
+    "showcode_stream_duration_seconds",
+    "Seconds from calling a provider handler to the end of a stream that completed.",
+    (0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320),
+    STREAM_LABELS,
+))
+stream_characters_per_second = registry.register(Histogram(
+    "showcode_stream_characters_per_second",
+    "Characters per second after the first chunk, per completed stream.",
+    (10, 25, 50, 100, 200, 400, 800, 1600, 3200),
+    STREAM_LABELS,
+))
+stream_chunks = registry.register(Counter(
+    "showcode_stream_chunks_total",
+    "Chunks streamed from providers; rate() gives chunks per second.",
+    STREAM_LABELS,
+))
+stream_characters = registry.register(Counter(
+    "showcode_stream_characters_total",
+    "Characters streamed from providers; rate() gives characters per second.",
+    STREAM_LABELS,
+))
+upstream_errors = registry.register(Counter(
+    "showcode_upstream_errors_total",
+    "Failed provider calls by provider, model and error type.",
+    STREAM_LABELS + ("type",),
+))
+streams_in_flight = registry.register(Gauge(
+    "showcode_streams_in_flight",
+    "Provider streams currently open.",
+    STREAM_LABELS,
+))
+rate_limited_requests = registry.register(Counter(
+    "showcode_rate_limited_requests_total",
+    "Requests rejected by the per-client rate limit.",
+    ("path",),
+))
+upstream_rejections = registry.register(Counter(
+    "showcode_upstream_rejections_total",
+    "Requests not sent to an upstream because its circuit was open or its admission queue was full.",
+    ("upstream", "reason"),
+))
+db_seconds = registry.register(Histogram(
+    "showcode_db_operation_seconds",
+    "Latency of alignment database reads and writes.",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ("operation",),
+))
+
+
+def bounded(value: str | None, known: Collection[str]) -> str:
+    """`value` when it is one of `known`, else OTHER."""
+    return value if value in known else OTHER
+
+
+def error_type(chunk: str) -> str:
+    """`api_error` or `server_error` for an error marker chunk."""
+    return chunk.lstrip("\n").split("]", 1)[0].lstrip("[").lower()
+
+
+async def observe_stream(provider: str, model: str, body: AsyncIterator, started: float) -> AsyncGenerator[Any, None]:
+    """Passes a provider stream through, recording its timing, throughput and errors."""
+    labels = {"provider": provider, "model": model}
+    streams_in_flight.inc(**labels)
+    first_at = None
+    characters = 0
+    completed = False
+    try:
+        async for chunk in body:
+            text = chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else chunk or ""
+            if is_error_chunk(text):
+                upstream_errors.inc(type=error_type(text), **labels)
+            elif text:
+                if first_at is None:
+                    first_at = time.monotonic()
+                    ttft_seconds.observe(first_at - started, **labels)
+                characters += len(text)
+                stream_chunks.inc(**labels)
+                stream_characters.inc(len(text), **labels)
+            yield chunk
+        completed = True
+    except Exception as e:
+        upstream_errors.inc(type=type(e).__name__, **labels)
+        raise
+    finally:
+        streams_in_flight.dec(**labels)
+        if completed:
+            ended = time.monotonic()
+            stream_duration_seconds.observe(ended - started, **labels)
+            if first_at is not None and ended > first_at:
+                stream_characters_per_second.observe(characters / (ended - first_at), **labels)
+        await close_stream(body)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, FrozenSet, Tuple
+
+if TYPE_CHECKING:
+    import ollama
+
+
+async def _list_models(client: "ollama.AsyncClient") -> FrozenSet[str]:
+    model_dict = await client.list()
+    return frozenset(m["model"] for m in model_dict["models"])
+
+
+class OllamaRegistry:
+    """
+    One ollama.AsyncClient per host plus a cached view of each host's model
+    list. A fresh list is answered from memory; a stale one is still served
+    while a single background refresh replaces it.
+
+    Hosts come from request headers, so only the `max_hosts` most recently
+    used are kept. An evicted client is not closed, since a stream may still
+    be reading from it; its connections go with its last response.
+    """
+
+    def __init__(self, models_ttl: float = 60.0, max_hosts: int = 32):
+        self.models_ttl = models_ttl
+        self.max_hosts = max_hosts
+        self._clients: OrderedDict[str, "ollama.AsyncClient"] = OrderedDict()
+        self._models: Dict[str, Tuple[FrozenSet[str], float]] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get_client(self, host: str) -> "ollama.AsyncClient | None":
+        client = self._clients.get(host)
+        if client is not None:
+            self._clients.move_to_end(host)
+            return client
+
+        # Loaded on first use, so deployments without Ollama never import it
+        import ollama
+
+        try:
+            client = ollama.AsyncClient(host=host)
+            # Probing with list() also seeds the model cache for this host
+            models = await _list_models(client)
+        except Exception as e:
+            logging.error(f"Failed to initialize Ollama client: {e}")
+            return None
+
+        self._clients[host] = client
+        self._models[host] = (models, time.monotonic())
+        self._evict()
+        return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _evict(self):
+        while len(self._clients) > max(1, self.max_hosts):
+            host, _ = self._clients.popitem(last=False)
+            self._models.pop(host, None)
+            task = self._refreshing.pop(host, None)
+            if task is not None:
+                task.cancel()
+
+    async def has_model(self, host: str, model: str) -> bool:
+        entry = self._models.get(host)
+        if entry is None:
+            models = await self._refresh(host)
+        else:
+            models, fetched_at = entry
+            if time.monotonic() - fetched_at > self.models_ttl:
+                self._schedule_refresh(host)
+
+        if model in models:
+            return True
+
+        # The model may have been pulled since the last listing
+        self.invalidate(host)
+        return False
+
+    def invalidate(self, host: str):
+        self._models.pop(host, None)
+
+    async def _refresh(self, host: str) -> FrozenSet[str]:
+        client = self._clients.get(host)
+        if client is None:
+            client = await self.get_client(host)
+            return self._models[host][0] if client is not None else frozenset()
+        models = await _list_models(client)
+        if host in self._clients:
+            self._models[host] = (models, time.monotonic())
+        return models
+
+    def _schedule_refresh(self, host: str):
+        task = self._refreshing.get(host)
+        if task is not None and not task.done():
+            return
+
+        async def refresh():
+            try:
+                await self._refresh(host)
+            except Exception as e:
+                logging.error(f"Failed to refresh Ollama models for {host}: {e}")
+            finally:
+                self._refreshing.pop(host, None)
+
+        self._refreshing[host] = asyncio.create_task(refresh())
+
+    def clear(self):
+        for task in self._refreshing.values():
+            task.cancel()
+        self._refreshing.clear()
+        self._clients.clear()
+        self._models.clear()
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self.clear()
+        for client in clients:
+            http_client = getattr(client, "_client", None)
+            if http_client is not None:
+                try:
+                    await http_client.aclose()
+                except Exception as e:
+                    logging.error(f"Failed to close Ollama client: {e}")
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, List
+
+from backend.ollama_registry import OllamaRegistry
+
+
+class KeepAlivePolicy:
+    """keep_alive sent to Ollama per model, e.g. "-1" to pin the alignment model."""
+
+    def __init__(self, default: str | None, overrides: Dict[str, str] | None = None):
+        self.default = default or None
+        self.overrides = dict(overrides or {})
+
+    def for_model(self, model: str) -> str | None:
+        return self.overrides.get(model, self.default) or None
+
+
+class _HostState:
+    def __init__(self):
+        self.hot: str | None = None
+        self.priority: str | None = None
+        self.active: Counter[str] = Counter()
+        self.waiting: Counter[str] = Counter()
+        self.changed = asyncio.Condition()
+
+    def can_run(self, model: str) -> bool:
+        if self.priority is not None and self.priority != model:
+            return False
+        if self.hot is None or self.hot == model:
+            return True
+        # Switching models evicts the hot one; only do it once nothing needs it,
+        # or once this model has waited long enough to take priority
+        if self.active[self.hot]:
+            return False
+        return self.priority == model or not self.waiting[self.hot]
+
+
+class ModelScheduler:
+    """
+    Orders Ollama generations per host so alternating between models does not
+    thrash GPU memory. Requests for the model currently loaded run at once;
+    a request for another model waits until the loaded model has nothing
+    running or queued. After `max_wait` seconds the waiting model takes
+    priority, so a steady stream for one model cannot starve the other.
+    """
+
+    def __init__(self, max_wait: float = 10.0, enabled: bool = True):
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._hosts: Dict[str, _HostState] = {}
+
+    def hot_model(self, host: str) -> str | None:
+        state = self._hosts.get(host)
+        return state.hot if state else None
+
+    def queued(self, host: str, model: str) -> int:
+        state = self._hosts.get(host)
+        return state.waiting[model] if state else 0
+
+    @asynccontextmanager
+    async def slot(self, host: str, model: str) -> AsyncIterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        state = self._hosts.setdefault(host, _HostState())
+        await self._acquire(state, model)
+        try:
+            yield
+        finally:
+            async with state.changed:
+                state.active[model] -= 1
+                state.changed.notify_all()
+
+    async def _acquire(self, state: _HostState, model: str):
+        deadline = time.monotonic() + self.max_wait
+        async with state.changed:
+            state.waiting[model] += 1
+            try:
+                while not state.can_run(model):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if state.priority is None:
+                            state.priority = model
+                        await state.changed.wait()
+                        continue
+                    try:
+                        await asyncio.wait_for(state.changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                # A cancelled waiter must not leave its model holding priority
+                state.waiting[model] -= 1
+                if state.priority == model and not state.waiting[model]:
+                    state.priority = None
+                state.changed.notify_all()
+                raise
+            state.waiting[model] -= 1
+
+            if state.priority == model:
+                state.priority = None
+            state.hot = model
+            state.active[model] += 1
+            state.changed.notify_all()
+
+    def clear(self):
+        self._hosts.clear()
+
+
+async def warm_up(
+    registry: OllamaRegistry,
+    host: str,
+    models: Iterable[str],
+    keep_alive: KeepAlivePolicy,
+) -> List[str]:
+    """
+    Loads each model with an empty prompt, which Ollama treats as a load
+    request, so the first real request does not pay for it. Models are
+    loaded in order; put the one that must stay resident last.
+    """
+    client = await registry.get_client(host)
+    if client is None:
+        logging.error(f"Ollama warm-up skipped: {host} is unreachable")
+        return []
+
+    loaded = []
+    for model in models:
+        try:
+            if not await registry.has_model(host, model):
+                logging.warning(f"Ollama warm-up skipped {model}: not pulled on {host}")
+                continue
+            await client.generate(model=model, prompt="", keep_alive=keep_alive.for_model(model))
+            loaded.append(model)
+        except Exception as e:
+            logging.error(f"Ollama warm-up failed for {model}: {e}")
+    return loaded
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import codecs
+import logging
+import os
+import sys
+
+from functools import partial
+from typing import Any, Dict, Iterable, List, Tuple
+
+import backend.api as api
+import backend.content as content
+import backend.database as database
+
+from backend.cache import is_error_chunk
+from backend.constants import CLOUD_PROVIDERS, LOCAL_PROVIDERS
+from backend.generators import llama_stream, ollama_stream
+from backend.http_pool import HTTPClientPool
+from backend.services import Services
+from backend.sources import SourceCache
+
+
+def parse_mapping(value: str) -> Tuple[str, str]:
+    """`URL_PREFIX=DIR`, e.g. `https://raw.githubusercontent.com/me/repo/main/=../repo`."""
+    prefix, sep, directory = value.rpartition("=")
+    if not sep or not prefix or not directory:
+        raise argparse.ArgumentTypeError(f"Expected URL_PREFIX=DIR, got {value!r}")
+    return prefix, directory
+
+
+class SourceResolver:
+    """
+    Reads snippet sources from local checkouts that stand in for their raw
+    URLs. The longest matching prefix wins. URLs no mapping covers go through
+    `sources`, the API's source cache, unless `offline` is set.
+    """
+
+    def __init__(
+        self,
+        mappings: Iterable[Tuple[str, str]],
+        offline: bool = False,
+        sources: SourceCache | None = None,
+    ):
+        self.mappings = sorted(mappings, key=lambda m: len(m[0]), reverse=True)
+        self.offline = offline
+        self.sources = sources
+
+    def local_path(self, url: str) -> str | None:
+        for prefix, directory in self.mappings:
+            if url.startswith(prefix):
+                relative = url[len(prefix):].split("?", 1)[0].lstrip("/")
+                root = os.path.realpath(directory)
+                path = os.path.realpath(os.path.join(root, relative))
+                if os.path.commonpath([root, path]) != root:
+                    raise ValueError(f"{url} escapes {directory}")
+                return path
+        return None
+
+    async def fetch(self, url: str) -> str:
+        path = self.local_path(url)
+        if path is not None:
+            return await asyncio.to_thread(_read_text, path)
+        if self.offline or self.sources is None:
+            raise LookupError(f"No local mapping for {url}")
+        source = await self.sources.get(url)
+        return source.text
+
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def collect_snippets(data: Dict[str, Any], projects: List[str] | None = None) -> List[Dict[str, Any]]:
+    """Every snippet of the selected projects, once per signature."""
+    snippets: Dict[str, Dict[str, Any]] = {}
+    for project in data.get("collection", []):
+        if projects and project.get("project") not in projects:
+            continue
+        for snippet in content.iter_snippets(project):
+            snippets.setdefault(content.snippet_signature(snippet), snippet)
+    return list(snippets.values())
+
+
+def build_route(args: argparse.Namespace) -> api.ProviderRoute:
+    if args.provider in LOCAL_PROVIDERS:
+        return api.ProviderRoute(
+            use_local_provider=True,
+            use_snippet_model=False,
+            default_local_provider=args.provider,
+            local_url=args.url,
+            local_snippet_model=args.snippet_model or args.model,
+            local_alignment_model=args.model,
+        )
+    return api.ProviderRoute(
+        use_local_provider=False,
+        use_snippet_model=False,
+        default_cloud_provider=args.provider,
+    )
+
+
+async def analyze_snippet(
+    services: Services,
+    snippet: Dict[str, Any],
+    resolver: SourceResolver,
+    route: api.ProviderRoute,
+    streamers: Tuple[Any, Any],
+) -> str:
+    code = await resolver.fetch(snippet["repoUrl"])
+    code = content.trim_lines(code, snippet.get("lineStart"), snippet.get("lineEnd"))
+
+    response = await api.open_analysis_stream(
+        services,
+        api.CodeAnalysisRequest(code=code),
+        route,
+        None,
+        False,
+        *streamers,
+    )
+    if not isinstance(response, api.StreamingResponse):
+        raise RuntimeError(f"Provider returned status {getattr(response, 'status_code', '?')}")
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+    async for chunk in response.body_iterator:
+        parts.append(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+    text = "".join(parts)
+
+    if not text or is_error_chunk(text):
+        raise RuntimeError(text.strip() or "Empty response")
+    return text
+
+
+async def precompute(
+    services: Services,
+    snippets: List[Dict[str, Any]],
+    resolver: SourceResolver,
+    route: api.ProviderRoute,
+    streamers: Tuple[Any, Any],
+    jobs: int = 4,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Analyzes every snippet that has no stored alignment yet, `jobs` at a
+    time. Each result is saved as soon as it finishes, so an interrupted or
+    partly failed run picks up where it stopped when started again.
+    """
+    signatures = [content.snippet_signature(s) for s in snippets]
+    existing = set() if force else set(await database.run_read(database.query_alignments, None, signatures))
+
+    pending = [s for s, sig in zip(snippets, signatures) if sig not in existing]
+    stats: Dict[str, Any] = {"done": 0, "skipped": len(snippets) - len(pending), "failed": {}}
+    semaphore = asyncio.Semaphore(max(1, jobs))
+
+    async def run(snippet):
+        signature = content.snippet_signature(snippet)
+        async with semaphore:
+            try:
+                text = await analyze_snippet(services, snippet, resolver, route, streamers)
+                # A write that fails must count as a failure, or a rerun would skip the snippet
+                await asyncio.to_thread(database.write_alignments, [(signature, text)])
+            except Exception as e:
+                logging.error(f"Precompute failed for {signature}: {e}")
+                stats["failed"][signature] = str(e)
+                return
+        stats["done"] += 1
+        print(f"ok      {signature}")
+
+    await asyncio.gather(*(run(s) for s in pending))
+    return stats
+
+
+async def _main(args: argparse.Namespace) -> int:
+    if args.db:
+        database.DB_NAME = args.db
+    # The API creates the tables in its lifespan, which this script never runs
+    database.init_db()
+
+    settings = api.get_settings()
+    services = Services(settings)
+    data = content.load_content(args.content)
+    snippets = collect_snippets(data, args.project)
+    resolver = SourceResolver(args.map, offline=args.offline, sources=services.source_cache)
+    pool = HTTPClientPool(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+
+    try:
+        stats = await precompute(
+            services,
+            snippets,
+            resolver,
+            build_route(args),
+            (partial(llama_stream, pool=pool), ollama_stream),
+            jobs=args.jobs,
+            force=args.force,
+        )
+    finally:
+        await services.aclose()
+        await pool.aclose()
+
+    for signature, error in stats["failed"].items():
+        print(f"failed  {signature}: {error}")
+    print(f"{stats['done']} analyzed, {stats['skipped']} already stored, {len(stats['failed'])} failed")
+    return 1 if stats["failed"] else 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Fill the alignments table for every snippet in content.json.")
+    parser.add_argument("--provider", required=True, choices=LOCAL_PROVIDERS + CLOUD_PROVIDERS)
+    parser.add_argument("--url", help="Base URL of the local provider.")
+    parser.add_argument("--model", help="Alignment model for local providers.")
+    parser.add_argument("--snippet-model", help="Snippet model for local providers (defaults to --model).")
+    parser.add_argument("--map", action="append", type=parse_mapping, default=[], metavar="URL_PREFIX=DIR",
+                        help="Serve URLs under URL_PREFIX from the local directory DIR. Repeatable.")
+    parser.add_argument("--offline", action="store_true", help="Fail snippets no --map covers instead of fetching them.")
+    parser.add_argument("--project", action="append", help="Only this content.json project. Repeatable.")
+    parser.add_argument("--content", default=content.CONTENT_PATH, help="Path to content.json.")
+    parser.add_argument("--db", help="Path to the alignments database.")
+    parser.add_argument("--jobs", type=int, default=4, help="Snippets analyzed concurrently.")
+    parser.add_argument("--force", action="store_true", help="Re-analyze snippets that already have an alignment.")
+    args = parser.parse_args(argv)
+
+    if args.provider in LOCAL_PROVIDERS and not (args.url and args.model):
+        parser.error("--url and --model are required for local providers")
+    settings = api.get_settings()
+    if args.provider in CLOUD_PROVIDERS and not (settings.DEMO_MODE and settings.SERVER_SIDE_API_KEY):
+        parser.error("Cloud providers need DEMO_MODE and SERVER_SIDE_API_KEY set in the environment")
+
+    try:
+        return asyncio.run(_main(args))
+    finally:
+        database.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import threading
+
+from typing import Any, Dict
+
+
+def as_count(value: Any) -> int | None:
+    """Token counts from SDK usage objects, or None when the provider did not report one."""
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+
+class PromptCacheStats:
+    """
+    Per-provider prompt-prefix cache counters, fed from the usage each
+    provider reports once a stream ends. A request counts as a hit when any
+    of its prompt tokens were served from the provider's cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers: Dict[str, Dict[str, int]] = {}
+
+    def record(self, provider: str, cached_tokens: int | None, prompt_tokens: int | None = None):
+        if cached_tokens is None:
+            return
+        with self._lock:
+            entry = self._providers.setdefault(
+                provider, {"hits": 0, "misses": 0, "cached_tokens": 0, "prompt_tokens": 0}
+            )
+            entry["hits" if cached_tokens > 0 else "misses"] += 1
+            entry["cached_tokens"] += cached_tokens
+            entry["prompt_tokens"] += prompt_tokens or 0
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {provider: dict(entry) for provider, entry in self._providers.items()}
+
+    def clear(self):
+        with self._lock:
+            self._providers.clear()
+
+
+stats = PromptCacheStats()
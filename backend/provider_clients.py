@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+def client_fingerprint(provider: str, api_key: str, base_url: str | None = None) -> str:
+    material = "\0".join([provider, api_key or "", base_url or ""])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+async def close_client(client: Any):
+    # genai keeps its async transport under .aio; the OpenAI and Anthropic
+    # async clients expose close() as a coroutine
+    aio = getattr(client, "aio", None)
+    closer = getattr(aio, "aclose", None) or getattr(client, "close", None)
+    if closer is None:
+        return
+    try:
+        result = closer()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logging.error(f"Failed to close provider client: {e}")
+
+
+class _Entry:
+    __slots__ = ("client", "last_used", "active")
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.active = 0
+
+
+class ClientLease:
+    def __init__(self, cache: "ProviderClientCache", key: str, entry: _Entry):
+        self._cache = cache
+        self._key = key
+        self._entry = entry
+        self._released = False
+        self.client = entry.client
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._entry.active -= 1
+        self._entry.last_used = time.monotonic()
+        self._cache._evict()
+
+
+class ProviderClientCache:
+    """
+    Bounded LRU of SDK clients keyed by a fingerprint of (provider, decrypted
+    key, base URL), so repeated calls with the same credentials reuse one warm
+    connection pool. Clients idle longer than `idle_ttl` are closed; clients
+    with a stream still in progress are never evicted.
+    """
+
+    def __init__(self, max_clients: int = 32, idle_ttl: float = 300.0):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def acquire(
+        self,
+        provider: str,
+        api_key: str,
+        factory: Callable[[], Any],
+        base_url: str | None = None,
+    ) -> ClientLease:
+        key = client_fingerprint(provider, api_key, base_url)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(factory())
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+
+        entry.active += 1
+        entry.last_used = time.monotonic()
+        self._evict()
+        return ClientLease(self, key, entry)
+
+    def _evict(self):
+        now = time.monotonic()
+        evicted = [
+            key for key, e in self._entries.items()
+            if e.active == 0 and now - e.last_used > self.idle_ttl
+        ]
+
+        overflow = len(self._entries) - len(evicted) - self.max_clients
+        for key, e in self._entries.items():
+            if overflow <= 0:
+                break
+            if e.active == 0 and key not in evicted:
+                evicted.append(key)
+                overflow -= 1
+
+        for key in evicted:
+            self._schedule_close(self._entries.pop(key).client)
+
+    def _schedule_close(self, client: Any):
+        try:
+            asyncio.get_running_loop().create_task(close_client(client))
+        except RuntimeError:
+            pass
+
+    def clear(self):
+        self._entries.clear()
+
+    async def aclose(self):
+        clients = [e.client for e in self._entries.values()]
+        self._entries.clear()
+        for client in clients:
+            await close_client(client)
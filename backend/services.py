@@ -0,0 +1,112 @@
+from backend.admission import AdmissionControl
+from backend.batch import ProviderConcurrency
+from backend.cache import ResponseCache
+from backend.circuit import CircuitBreakers
+from backend.config import Settings
+from backend.hedging import Hedger
+from backend.local_pool import LocalBackendPool
+from backend.ollama_registry import OllamaRegistry
+from backend.ollama_scheduler import KeepAlivePolicy, ModelScheduler
+from backend.provider_clients import ProviderClientCache
+from backend.shared_state import state_store_from_url
+from backend.singleflight import SingleFlight
+from backend.sources import SourceCache
+
+
+class Services:
+    """
+    Everything an app serves requests with, built from its settings.
+    create_app() keeps one on `app.state.services`, so two apps in one
+    process never share caches, pools or counters. Building it opens no
+    file or socket; the lifespan opens the state store and `aclose()`
+    releases what this instance holds.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+
+        # State every worker sees: rate-limit counters, cached responses, in-flight claims
+        self.shared_state = state_store_from_url(settings.STATE_BACKEND)
+        crossWorkerState = self.shared_state if self.shared_state.shared else None
+
+        self.response_cache = ResponseCache(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            shared=crossWorkerState,
+        )
+
+        # Identical concurrent /analyze calls share one upstream generation
+        self.inflight = SingleFlight(
+            max_bytes=settings.STREAM_TEE_MAX_BYTES,
+            claims=crossWorkerState,
+            claim_ttl=settings.SHARED_INFLIGHT_TTL,
+            claim_wait=settings.SHARED_INFLIGHT_WAIT,
+        )
+
+        # Per-provider concurrency for /analyze/batch
+        self.batch_limits = ProviderConcurrency(settings.BATCH_CONCURRENCY, settings.BATCH_PROVIDER_CONCURRENCY)
+
+        # Raw snippet sources referenced by content.json
+        self.source_cache = SourceCache(
+            max_entries=settings.SOURCE_CACHE_MAX_ENTRIES,
+            revalidate_after=settings.SOURCE_CACHE_REVALIDATE_AFTER,
+        )
+
+        # Server-side pools of local inference backends, keyed by local provider
+        self.local_backends = LocalBackendPool(
+            settings.LOCAL_BACKEND_URLS,
+            eject_after=settings.LOCAL_BACKEND_EJECT_AFTER,
+            probe_interval=settings.LOCAL_BACKEND_PROBE_INTERVAL,
+            probe_timeout=settings.LOCAL_BACKEND_PROBE_TIMEOUT,
+            cooldown=settings.LOCAL_BACKEND_COOLDOWN,
+        )
+
+        # Ollama clients and model lists, keyed by host
+        self.ollama_registry = OllamaRegistry(models_ttl=settings.OLLAMA_MODELS_TTL, max_hosts=settings.OLLAMA_MAX_HOSTS)
+        self.ollama_keep_alive = KeepAlivePolicy(settings.OLLAMA_KEEP_ALIVE, settings.OLLAMA_KEEP_ALIVE_POLICIES)
+        self.ollama_scheduler = ModelScheduler(
+            max_wait=settings.OLLAMA_SWITCH_MAX_WAIT,
+            enabled=settings.OLLAMA_SCHEDULE_MODELS,
+        )
+
+        # Time-to-first-chunk deadlines and outcomes for hedged cloud requests
+        self.hedger = Hedger(
+            percentile=settings.HEDGE_PERCENTILE,
+            default_delay=settings.HEDGE_DEFAULT_DELAY,
+            min_delay=settings.HEDGE_MIN_DELAY,
+            min_samples=settings.HEDGE_MIN_SAMPLES,
+        )
+
+        # Upstreams that keep failing are skipped for a while instead of being waited on
+        self.circuits = CircuitBreakers(
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_RESET_TIMEOUT,
+            max_upstreams=settings.CIRCUIT_MAX_UPSTREAMS,
+        )
+
+        # Adaptive concurrency limit and wait queue per upstream, keyed like the circuits
+        self.admission = AdmissionControl(
+            initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+            min_limit=settings.ADMISSION_MIN_LIMIT,
+            max_limit=settings.ADMISSION_MAX_LIMIT,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            target_ttft=settings.ADMISSION_TARGET_TTFT,
+            enabled=settings.ADMISSION_ENABLED,
+            max_upstreams=settings.ADMISSION_MAX_UPSTREAMS,
+        )
+
+        # Cloud SDK clients, keyed by provider/key/base URL fingerprint
+        self.provider_clients = ProviderClientCache(
+            max_clients=settings.PROVIDER_CLIENT_CACHE_SIZE,
+            idle_ttl=settings.PROVIDER_CLIENT_IDLE_TTL,
+        )
+
+    async def aclose(self):
+        await self.ollama_registry.aclose()
+        await self.provider_clients.aclose()
+        await self.source_cache.aclose()
+        await self.local_backends.aclose()
+        # Queued on the state store thread, after any write still pending
+        await self.shared_state.run(self.shared_state.close)
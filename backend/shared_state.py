@@ -0,0 +1,397 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+from urllib.parse import urlsplit
+
+from limits.storage import Storage
+
+# Scheme under which StateStoreLimits is registered with `limits`
+LIMITS_SCHEME = "showcode-state"
+
+_state_executor: ThreadPoolExecutor | None = None
+
+
+def _get_state_executor() -> ThreadPoolExecutor:
+    # One thread, so operations land in the order they were issued: a flight's
+    # cached response is written before its in-flight claim is released
+    global _state_executor
+    if _state_executor is None:
+        _state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state")
+    return _state_executor
+
+
+def shutdown_state_executor():
+    """Waits for queued writes, then stops the state store thread."""
+    global _state_executor
+    if _state_executor is not None:
+        _state_executor.shutdown(wait=True)
+        _state_executor = None
+
+
+class StateStore:
+    """
+    Expiring key/value state. Every worker that opens the same backend sees
+    the same keys, so rate-limit counters, cached responses and in-flight
+    claims hold across processes. Values are bytes and every key has a TTL.
+    """
+
+    # False when the state lives in this process only
+    shared = False
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Sets `key` only if it is absent; True when this call set it."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        """Adds to a counter. The TTL starts with the first increment, like a fixed window."""
+        raise NotImplementedError
+
+    def ttl(self, key: str) -> float:
+        """Seconds until `key` expires, 0 when it does not exist."""
+        raise NotImplementedError
+
+    def clear(self, prefix: str = ""):
+        raise NotImplementedError
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        Awaits `fn(*args)`. For shared stores it runs on the state store
+        thread, since their file or network I/O would block the event loop.
+        """
+        if not self.shared:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(_get_state_executor(), fn, *args)
+
+    def submit(self, fn: Callable, *args) -> Future | None:
+        """Like `run`, without waiting for the result; `fn` handles its own errors."""
+        if not self.shared:
+            fn(*args)
+            return None
+        return _get_state_executor().submit(fn, *args)
+
+    def open(self):
+        """Connects ahead of the first request; stores also connect on first use."""
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """
+    State in this process. Expired entries are dropped when read, and all of
+    them once the writes since the last purge reach the number of entries it
+    left, so one-off keys such as per-client rate-limit counters do not pile
+    up and each write pays for a bounded share of the scan.
+    """
+
+    # Fewest writes between two purges, so a small store is not scanned on every write
+    PURGE_EVERY = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[bytes, float]] = {}
+        self._writes = 0
+        self._purge_after = self.PURGE_EVERY
+
+    def _store(self, key: str, entry: Tuple[bytes, float], now: float):
+        self._entries[key] = entry
+        self._writes += 1
+        if self._writes >= self._purge_after:
+            for expired in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[expired]
+            self._writes = 0
+            self._purge_after = max(self.PURGE_EVERY, len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _live(self, key: str, now: float) -> Tuple[bytes, float] | None:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._live(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._store(key, (value, now + ttl), now)
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, (value, now + ttl), now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                entry = (b"0", now + ttl)
+            count = int(entry[0]) + amount
+            self._store(key, (str(count).encode(), entry[1]), now)
+            return count
+
+    def ttl(self, key: str) -> float:
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            return entry[1] - now if entry else 0.0
+
+    def clear(self, prefix: str = ""):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    State in one SQLite file in WAL mode, for several workers on one host.
+    Read-modify-write operations run in BEGIN IMMEDIATE transactions, which
+    SQLite serializes across processes. The file is created on first use.
+    """
+
+    shared = True
+
+    CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """
+    SELECT_SQL = "SELECT value, expires_at FROM state WHERE key = ? AND expires_at > ?"
+    UPSERT_SQL = "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)"
+    DELETE_SQL = "DELETE FROM state WHERE key = ?"
+    PURGE_SQL = "DELETE FROM state WHERE expires_at <= ?"
+    CLEAR_SQL = "DELETE FROM state WHERE key >= ? AND key < ?"
+
+    # Expired rows are purged on roughly one write in this many
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._created = False
+
+    def open(self):
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._created:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            if not self._created:
+                conn.execute(self.CREATE_SQL)
+                self._created = True
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, time.time())
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute(self.PURGE_SQL, (time.time(),))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> bytes | None:
+        row = self._conn().execute(self.SELECT_SQL, (key, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._write(lambda conn, now: conn.execute(self.UPSERT_SQL, (key, value, now + ttl)))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        def add(conn, now):
+            if conn.execute(self.SELECT_SQL, (key, now)).fetchone() is not None:
+                return False
+            conn.execute(self.UPSERT_SQL, (key, value, now + ttl))
+            return True
+        return self._write(add)
+
+    def delete(self, key: str):
+        self._write(lambda conn, now: conn.execute(self.DELETE_SQL, (key,)))
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        def incr(conn, now):
+            row = conn.execute(self.SELECT_SQL, (key, now)).fetchone()
+            count = (int(row[0]) if row else 0) + amount
+            expires_at = row[1] if row else now + ttl
+            conn.execute(self.UPSERT_SQL, (key, str(count).encode(), expires_at))
+            return count
+        return self._write(incr)
+
+    def ttl(self, key: str) -> float:
+        now = time.time()
+        row = self._conn().execute(self.SELECT_SQL, (key, now)).fetchone()
+        return row[1] - now if row else 0.0
+
+    def clear(self, prefix: str = ""):
+        self._write(lambda conn, now: conn.execute(self.CLEAR_SQL, (prefix, prefix + "\U0010ffff")))
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class RedisStateStore(StateStore):
+    """State in Redis, for workers on several hosts. `client` is a redis-py compatible client."""
+
+    shared = True
+
+    def __init__(self, client: Any, prefix: str = "showcode:"):
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    def _ms(ttl: float) -> int:
+        return max(1, int(ttl * 1000))
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, px=self._ms(ttl))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(self.client.set(self.prefix + key, value, px=self._ms(ttl), nx=True))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str, ttl: float, amount: int = 1) -> int:
+        count = self.client.incrby(self.prefix + key, amount)
+        if count == amount:
+            self.client.pexpire(self.prefix + key, self._ms(ttl))
+        return count
+
+    def ttl(self, key: str) -> float:
+        remaining = self.client.pttl(self.prefix + key)
+        return remaining / 1000 if remaining and remaining > 0 else 0.0
+
+    def clear(self, prefix: str = ""):
+        keys = list(self.client.scan_iter(match=self.prefix + prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def close(self):
+        self.client.close()
+
+
+def state_store_from_url(url: str | None) -> StateStore:
+    """`memory://` (default), `sqlite:///path/to/state.db` or `redis://host:6379/0`."""
+    if not url or url == "memory://":
+        return MemoryStateStore()
+
+    scheme = urlsplit(url).scheme
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else ""
+        if not path:
+            raise ValueError(f"Expected sqlite:///path, got {url!r}")
+        return SQLiteStateStore(path)
+    if scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("A redis:// state backend needs the redis package") from None
+        return RedisStateStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported state backend {url!r}")
+
+
+class StateStoreLimits(Storage):
+    """Lets slowapi/limits keep fixed-window rate-limit counters in a StateStore."""
+
+    STORAGE_SCHEME = [LIMITS_SCHEME]
+    PREFIX = "limit:"
+
+    def __init__(
+        self,
+        uri: str | None = None,
+        wrap_exceptions: bool = False,
+        store: StateStore | Callable[[], StateStore] | None = None,
+        **options,
+    ):
+        self._store = store if store is not None else MemoryStateStore()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def store(self) -> StateStore:
+        # A callable is looked up on every use, for a store chosen after the limiter was built
+        return self._store() if callable(self._store) else self._store
+
+    @property
+    def base_exceptions(self):
+        return (sqlite3.Error, ConnectionError)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.store.incr(self.PREFIX + key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        value = self.store.get(self.PREFIX + key)
+        return int(value) if value else 0
+
+    def get_expiry(self, key: str) -> float:
+        return time.time() + self.store.ttl(self.PREFIX + key)
+
+    def check(self) -> bool:
+        try:
+            self.store.get(self.PREFIX + "check")
+            return True
+        except Exception:
+            return False
+
+    def reset(self) -> int | None:
+        self.store.clear(self.PREFIX)
+        return None
+
+    def clear(self, key: str):
+        self.store.delete(self.PREFIX + key)
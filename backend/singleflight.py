@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List
+
+from backend.shared_state import StateStore
+from backend.streaming import StreamTee, TeeSink
+
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+# Key prefix of in-flight claims in the shared state store
+CLAIM_PREFIX = "inflight:"
+CLAIM_POLL_INTERVAL = 0.25
+
+
+class Flight:
+    """
+    One upstream generation shared by every identical request that arrives
+    while it is running. Chunks pass through a StreamTee, so each is encoded
+    once and the same bytes object is handed to every subscriber and sink.
+    A late subscriber replays what the tee retained before going live; once
+    the tee exceeds its memory cap the flight stops accepting new subscribers.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        source: AsyncIterator,
+        on_finish: Callable[["Flight"], None],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.key = key
+        self.tee = StreamTee(max_bytes)
+        self.done = False
+        self._queues: List[asyncio.Queue] = []
+        self._on_finish = on_finish
+        self._task = asyncio.create_task(self._pump(source))
+
+    @property
+    def chunks(self) -> List[bytes]:
+        return self.tee.chunks
+
+    @property
+    def completed(self) -> bool:
+        return self.tee.completed
+
+    @property
+    def failed(self) -> bool:
+        return self.tee.failed
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._queues)
+
+    @property
+    def joinable(self) -> bool:
+        return not self.done and not self.tee.truncated
+
+    def add_sink(self, sink: TeeSink):
+        self.tee.add_sink(sink)
+
+    def text(self) -> str:
+        return self.tee.text()
+
+    async def _pump(self, source: AsyncIterator):
+        completed = False
+        try:
+            async for chunk in source:
+                data = self.tee.feed(chunk)
+                for queue in self._queues:
+                    queue.put_nowait(data)
+            completed = True
+        except Exception as e:
+            logging.error(f"Shared stream for {self.key[:12]} failed: {e}")
+            self.tee.failed = True
+        finally:
+            self.tee.close(completed)
+            self._on_finish(self)
+            self.done = True
+            for queue in self._queues:
+                queue.put_nowait(None)
+
+    def subscribe(self) -> AsyncGenerator[bytes, None]:
+        # Registered eagerly: the response body is not iterated until the
+        # response starts, and chunks produced in between must not be lost
+        queue: asyncio.Queue = asyncio.Queue()
+        for data in self.tee.chunks:
+            queue.put_nowait(data)
+        if self.done:
+            queue.put_nowait(None)
+        self._queues.append(queue)
+        return self._drain(queue)
+
+    async def _drain(self, queue: asyncio.Queue) -> AsyncGenerator[bytes, None]:
+        try:
+            while True:
+                data = await queue.get()
+                if data is None:
+                    return
+                yield data
+        finally:
+            if queue in self._queues:
+                self._queues.remove(queue)
+
+
+class SingleFlight:
+    """
+    Registry of in-flight generations keyed by the response cache key.
+
+    A flight keeps pumping after its subscribers disconnect so the finished
+    text still reaches persistence and the response cache. While the first
+    request is still opening its stream the key is reserved, and identical
+    requests wait for that flight instead of calling the provider too.
+
+    With a shared `claims` store a flight is also claimed for other workers.
+    They cannot subscribe to it, so they wait (up to `claim_wait`) for the
+    claim to go away and then find the result in the shared response cache.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        claims: StateStore | None = None,
+        claim_ttl: float = 300.0,
+        claim_wait: float = 120.0,
+    ):
+        self.max_bytes = max_bytes
+        self.claims = claims
+        self.claim_ttl = claim_ttl
+        self.claim_wait = claim_wait
+        self.owner = f"{socket.gethostname()}:{os.getpid()}".encode()
+        self._flights: Dict[str, Flight] = {}
+        self._opening: Dict[str, asyncio.Event] = {}
+        self._claimed: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def get(self, key: str) -> Flight | None:
+        flight = self._flights.get(key)
+        if flight is None or not flight.joinable:
+            return None
+        return flight
+
+    async def join(self, key: str, shared: bool = True) -> Flight | None:
+        """
+        The flight for `key`, waiting for one still being opened here or, when
+        `shared`, running in another worker. None means open it yourself.
+        """
+        while True:
+            opened = self._opening.get(key)
+            if opened is not None:
+                await opened.wait()
+                flight = self.get(key)
+                if flight is not None:
+                    return flight
+                # The opener failed or answered without a stream; the next waiter takes over
+                continue
+
+            flight = self.get(key)
+            if flight is not None or not shared or not await self._wait_for_claim(key):
+                return flight
+
+    async def _wait_for_claim(self, key: str) -> bool:
+        """True once another worker's claim on `key` is gone; False if there was none or it outlasted the wait."""
+        if self.claims is None:
+            return False
+        deadline = time.monotonic() + self.claim_wait
+        waited = False
+        while True:
+            try:
+                owner = await self.claims.run(self.claims.get, CLAIM_PREFIX + key)
+            except Exception as e:
+                logging.error(f"Reading in-flight claim failed: {e}")
+                return waited
+            if owner is None or owner == self.owner:
+                return waited
+            if time.monotonic() >= deadline:
+                return False
+            waited = True
+            await asyncio.sleep(CLAIM_POLL_INTERVAL)
+
+    @asynccontextmanager
+    async def opening(self, key: str) -> AsyncIterator[None]:
+        opened = asyncio.Event()
+        self._opening[key] = opened
+        await self._claim(key)
+        try:
+            yield
+        finally:
+            if self._opening.get(key) is opened:
+                del self._opening[key]
+            if key not in self._flights:
+                self._unclaim(key)
+            opened.set()
+
+    async def _claim(self, key: str):
+        if self.claims is None:
+            return
+        try:
+            if await self.claims.run(self.claims.add, CLAIM_PREFIX + key, self.owner, self.claim_ttl):
+                self._claimed.add(key)
+        except Exception as e:
+            logging.error(f"Claiming in-flight key failed: {e}")
+
+    def _unclaim(self, key: str):
+        if key not in self._claimed:
+            return
+        self._claimed.discard(key)
+        # Also called when a flight's pump finishes, so the delete is not awaited
+        self.claims.submit(self._delete_claim, key)
+
+    def _delete_claim(self, key: str):
+        try:
+            self.claims.delete(CLAIM_PREFIX + key)
+        except Exception as e:
+            logging.error(f"Releasing in-flight claim failed: {e}")
+
+    def start(self, key: str, source: AsyncIterator) -> Flight:
+        flight = Flight(key, source, self._finish, self.max_bytes)
+        self._flights[key] = flight
+        return flight
+
+    def clear(self):
+        self._flights.clear()
+        self._opening.clear()
+        self._claimed.clear()
+
+    def _finish(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+            self._unclaim(flight.key)
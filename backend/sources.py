@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import time
+
+from array import array
+from collections import OrderedDict
+from typing import Dict
+
+import httpx
+
+
+class SourceFile:
+    """
+    One fetched file plus the offset where each of its lines starts, so a
+    line range is a single slice instead of a split of the whole file.
+    """
+
+    __slots__ = ("url", "text", "starts", "digest", "etag", "last_modified", "checked_at")
+
+    def __init__(self, url: str, text: str, etag: str | None = None, last_modified: str | None = None):
+        self.url = url
+        self.text = text
+        self.starts = array("I", [0])
+        position = text.find("\n")
+        while position != -1:
+            self.starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = time.monotonic()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts)
+
+    def lines(self, line_start: int | None, line_end: int | None) -> str:
+        """Lines `line_start`..`line_end` (1-based, inclusive), joined the way js/alignment.js joins them."""
+        if not (line_start and line_end):
+            return self.text
+        first = max(int(line_start), 1) - 1
+        last = min(int(line_end), len(self.starts))
+        if first >= last:
+            return ""
+        end = len(self.text)
+        if last < len(self.starts):
+            end = self.starts[last] - 1
+            if end > self.starts[first] and self.text[end - 1] == "\r":
+                end -= 1
+        return self.text[self.starts[first]:end].replace("\r\n", "\n")
+
+
+class SourceCache:
+    """
+    LRU of raw source files. An entry younger than `revalidate_after` is
+    served as is; an older one is revalidated with If-None-Match /
+    If-Modified-Since, so an unchanged file costs a 304 instead of a transfer.
+    Concurrent requests for the same URL share one fetch.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        revalidate_after: float = 300.0,
+        max_file_bytes: int = 2 * 1024 * 1024,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.max_entries = max_entries
+        self.revalidate_after = revalidate_after
+        self.max_file_bytes = max_file_bytes
+        self._transport = transport
+        self._entries: OrderedDict[str, SourceFile] = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._client: httpx.AsyncClient | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, url: str) -> SourceFile:
+        entry = self._entries.get(url)
+        if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_after:
+            self._entries.move_to_end(url)
+            return entry
+
+        # The fetch is a task of its own, so a caller that goes away stops
+        # waiting for it without cancelling it for everyone else
+        task = self._pending.get(url)
+        if task is None:
+            task = asyncio.create_task(self._fetch(url, entry))
+            self._pending[url] = task
+            task.add_done_callback(lambda done: self._fetched(url, done))
+        return await asyncio.shield(task)
+
+    def _fetched(self, url: str, task: asyncio.Task):
+        if self._pending.get(url) is task:
+            del self._pending[url]
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody else awaited is not logged as unhandled
+            task.exception()
+
+    async def _fetch(self, url: str, stale: SourceFile | None) -> SourceFile:
+        headers = {}
+        if stale is not None:
+            if stale.etag:
+                headers["If-None-Match"] = stale.etag
+            if stale.last_modified:
+                headers["If-Modified-Since"] = stale.last_modified
+
+        try:
+            response = await self._get_client().get(url, headers=headers)
+        except httpx.HTTPError:
+            if stale is None:
+                raise
+            # Origin unreachable: a stale copy beats no copy
+            return stale
+
+        if response.status_code == 304 and stale is not None:
+            stale.checked_at = time.monotonic()
+            self._store(stale)
+            return stale
+
+        response.raise_for_status()
+        if len(response.content) > self.max_file_bytes:
+            raise ValueError(f"{url} is larger than {self.max_file_bytes} bytes")
+
+        entry = SourceFile(
+            url,
+            response.text,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+        )
+        self._store(entry)
+        return entry
+
+    def _store(self, entry: SourceFile):
+        self._entries[entry.url] = entry
+        self._entries.move_to_end(entry.url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0, follow_redirects=True, transport=self._transport)
+        return self._client
+
+    def clear(self):
+        self._entries.clear()
+        self._pending.clear()
+        # Clients are bound to the loop that opened them
+        self._client = None
+
+    async def aclose(self):
+        self._entries.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,124 @@
+import logging
+
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, List
+
+from backend.cache import ERROR_MARKERS, ResponseCache
+
+_ERROR_MARKERS_BYTES = tuple(m.encode("utf-8") for m in ERROR_MARKERS)
+
+
+async def close_stream(body: AsyncIterator | None):
+    aclose = getattr(body, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def resume_stream(first: Any, body: AsyncIterator) -> AsyncGenerator[Any, None]:
+    """Puts back a chunk already read from `body`, e.g. to inspect it before answering."""
+    try:
+        if first:
+            yield first
+        async for chunk in body:
+            yield chunk
+    finally:
+        await close_stream(body)
+
+
+class TeeSink:
+    """
+    Observer of a StreamTee. `on_chunk` sees each encoded chunk fed after the
+    sink was added; `on_complete` runs once when the upstream finished normally.
+    Both receive the tee's own objects, never copies.
+    """
+
+    def on_chunk(self, data: bytes):
+        pass
+
+    def on_complete(self, tee: "StreamTee"):
+        pass
+
+
+class StreamTee:
+    """
+    Encodes each chunk of a text stream exactly once and retains the encoded
+    chunks for sinks and late readers, up to `max_bytes`. Past the cap the
+    retained chunks are released and the tee is marked truncated; chunks
+    still flow through `feed` and `on_chunk`, but sinks that need the whole
+    text must skip it.
+    """
+
+    def __init__(self, max_bytes: int, sinks: List[TeeSink] | None = None):
+        self.max_bytes = max_bytes
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.truncated = False
+        self.failed = False
+        self.starts_with_error = False
+        self.completed = False
+        self._sinks: List[TeeSink] = list(sinks or [])
+
+    def add_sink(self, sink: TeeSink):
+        self._sinks.append(sink)
+
+    def feed(self, chunk: str | bytes) -> bytes:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+        if data.startswith(_ERROR_MARKERS_BYTES):
+            self.failed = True
+            if self.size == 0:
+                self.starts_with_error = True
+
+        self.size += len(data)
+        if not self.truncated:
+            if self.size > self.max_bytes:
+                self.truncated = True
+                self.chunks = []
+            else:
+                self.chunks.append(data)
+
+        for sink in self._sinks:
+            self._notify(sink.on_chunk, data)
+        return data
+
+    def close(self, completed: bool):
+        self.completed = completed
+        if not completed:
+            return
+        for sink in self._sinks:
+            self._notify(sink.on_complete, self)
+
+    def text(self) -> str:
+        return b"".join(self.chunks).decode("utf-8", errors="ignore")
+
+    @staticmethod
+    def _notify(fn: Callable, arg):
+        try:
+            fn(arg)
+        except Exception as e:
+            logging.error(f"Stream sink failed: {e}")
+
+
+class PersistenceSink(TeeSink):
+    """Saves the finished text under a snippet signature."""
+
+    def __init__(self, signature: str, save: Callable[[str, str], None]):
+        self.signature = signature
+        self.save = save
+
+    def on_complete(self, tee: StreamTee):
+        if tee.truncated or tee.starts_with_error or not tee.chunks:
+            return
+        self.save(self.signature, tee.text())
+
+
+class CacheSink(TeeSink):
+    """Stores a clean, complete stream in the response cache."""
+
+    def __init__(self, cache: ResponseCache, key: str):
+        self.cache = cache
+        self.key = key
+
+    def on_complete(self, tee: StreamTee):
+        if tee.truncated or tee.failed or not tee.chunks:
+            return
+        self.cache.put(self.key, tee.chunks)
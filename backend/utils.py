@@ -1,7 +1,12 @@
+import asyncio
+import hashlib
 import logging
+import threading
 import backend.config as config
 import base64
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
@@ -11,41 +16,143 @@ from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 def get_settings():
     return config.Settings()
 
+@lru_cache(maxsize=4)
+def load_private_key(private_key_pem: str) -> rsa.RSAPrivateKey:
+    """
+    Parses the PEM once per distinct key; later calls return the loaded key.
+    """
+    private_key = serialization.load_pem_private_key(
+        private_key_pem.encode(),
+        password=None
+    )
+
+    if not isinstance(private_key, rsa.RSAPrivateKey):
+        raise ValueError("Loaded key is not an RSA Private Key")
+
+    return private_key
+
+@lru_cache(maxsize=4)
+def _key_id(private_key_pem: str) -> bytes:
+    return hashlib.sha256(private_key_pem.encode()).digest()
+
+class DEKCache:
+    """
+    Bounded LRU from a digest of the wrapped DEK to the unwrapped DEK. The
+    frontend reuses one envelope across calls, so a hit skips the RSA unwrap.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(encrypted_dek_b64: str, private_key_pem: str) -> bytes:
+        return hashlib.sha256(_key_id(private_key_pem) + encrypted_dek_b64.encode()).digest()
+
+    def get(self, key: bytes) -> bytes | None:
+        with self._lock:
+            dek = self._entries.get(key)
+            if dek is not None:
+                self._entries.move_to_end(key)
+            return dek
+
+    def put(self, key: bytes, dek: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = dek
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Sized with DEK_CACHE_SIZE when the first app starts
+dek_cache = DEKCache()
+
+_crypto_executor: ThreadPoolExecutor | None = None
+
+def _get_crypto_executor() -> ThreadPoolExecutor:
+    global _crypto_executor
+    if _crypto_executor is None:
+        _crypto_executor = ThreadPoolExecutor(
+            max_workers=get_settings().CRYPTO_WORKERS,
+            thread_name_prefix="crypto",
+        )
+    return _crypto_executor
+
+def shutdown_crypto_executor():
+    global _crypto_executor
+    if _crypto_executor is not None:
+        _crypto_executor.shutdown(wait=True)
+        _crypto_executor = None
+
 def decrypt_envelope(encrypted_dek_b64: str, iv_b64: str, ciphertext_b64: str, private_key_pem: str) -> str:
     """
     Unwraps the AES key using RSA Private Key, then decrypts the data.
     """
     try:
-        # 1. Load Private Key (KEK)
-        private_key = serialization.load_pem_private_key(
-            private_key_pem.encode(),
-            password=None
-        )
-
-        if not isinstance(private_key, rsa.RSAPrivateKey):
-            raise ValueError("Loaded key is not an RSA Private Key")
+        cache_key = DEKCache.key(encrypted_dek_b64, private_key_pem)
+        dek = dek_cache.get(cache_key)
 
-        # 2. Decode Base64 inputs
-        encrypted_dek = base64.b64decode(encrypted_dek_b64)
+        # 1. Decode Base64 inputs
         iv = base64.b64decode(iv_b64)
         ciphertext = base64.b64decode(ciphertext_b64)
 
-        # 3. Unwrap DEK (Decrypt AES Key using RSA)
-        dek = private_key.decrypt(
-            encrypted_dek,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
+        if dek is None:
+            # 2. Load Private Key (KEK)
+            private_key = load_private_key(private_key_pem)
+
+            # 3. Unwrap DEK (Decrypt AES Key using RSA)
+            encrypted_dek = base64.b64decode(encrypted_dek_b64)
+            dek = private_key.decrypt(
+                encrypted_dek,
+                padding.OAEP(
+                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                    algorithm=hashes.SHA256(),
+                    label=None
+                )
             )
-        )
 
         # 4. Decrypt Data using DEK (AES-GCM)
         aesgcm = AESGCM(dek)
         plaintext_bytes = aesgcm.decrypt(iv, ciphertext, None)
+
+        # Only cache a DEK once it has authenticated real ciphertext
+        dek_cache.put(cache_key, dek)
         
         return plaintext_bytes.decode('utf-8')
 
     except Exception as e:
         logging.error(f"Envelope Decryption Failed: {e}")
         return "error"
+
+async def decrypt_envelope_async(encrypted_dek_b64: str, iv_b64: str, ciphertext_b64: str, private_key_pem: str) -> str:
+    """
+    Same as decrypt_envelope, but a cold RSA unwrap runs on the crypto worker
+    pool instead of the event loop. Cached DEKs only cost an AES-GCM decrypt,
+    which is cheap enough to do inline.
+    """
+    try:
+        cached = dek_cache.get(DEKCache.key(encrypted_dek_b64, private_key_pem)) is not None
+    except Exception:
+        cached = False
+
+    if cached:
+        return decrypt_envelope(encrypted_dek_b64, iv_b64, ciphertext_b64, private_key_pem)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_crypto_executor(),
+        decrypt_envelope,
+        encrypted_dek_b64,
+        iv_b64,
+        ciphertext_b64,
+        private_key_pem,
+    )
@@ -0,0 +1,87 @@
+"""
+Per-call cost of decrypt_envelope before and after the crypto fast path.
+
+    python -m benchmarks.bench_decrypt_envelope [--iterations N]
+
+"before" re-parses the PEM and performs the RSA-OAEP unwrap on every call,
+which is what the original implementation did. "cold" keeps the parsed key
+but unwraps a new envelope each time. "warm" reuses one envelope, the way
+js/encryption.js does across requests.
+"""
+import argparse
+import base64
+import os
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from backend import utils
+
+
+def make_envelope(public_key, data: str = "sk-benchmark-api-key"):
+    dek = AESGCM.generate_key(bit_length=256)
+    iv = os.urandom(12)
+    ciphertext = AESGCM(dek).encrypt(iv, data.encode(), None)
+    encrypted_dek = public_key.encrypt(
+        dek,
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    )
+    return tuple(base64.b64encode(v).decode() for v in (encrypted_dek, iv, ciphertext))
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--key-size", type=int, default=2048)
+    args = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=args.key_size)
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode()
+    envelope = make_envelope(private_key.public_key())
+    cold_envelopes = [make_envelope(private_key.public_key()) for _ in range(args.iterations)]
+
+    def before():
+        utils.load_private_key.cache_clear()
+        utils.dek_cache.clear()
+        utils.decrypt_envelope(*envelope, private_pem)
+
+    cold_iter = iter(cold_envelopes)
+
+    def cold():
+        utils.decrypt_envelope(*next(cold_iter), private_pem)
+
+    def warm():
+        utils.decrypt_envelope(*envelope, private_pem)
+
+    results = [("before (parse + unwrap)", per_call_us(before, args.iterations))]
+    utils.dek_cache.clear()
+    utils.load_private_key(private_pem)
+    results.append(("cold (cached key, unwrap)", per_call_us(cold, args.iterations)))
+    utils.decrypt_envelope(*envelope, private_pem)
+    results.append(("warm (cached DEK)", per_call_us(warm, args.iterations)))
+
+    baseline = results[0][1]
+    print(f"decrypt_envelope, RSA-{args.key_size}, {args.iterations} iterations")
+    for label, us in results:
+        print(f"  {label:<28} {us:10.1f} us/call  {baseline / us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-import { callCodeAnalysisApi } from "./code.js";
+import { callCodeAnalysisApi, fetchProjectSources, fetchSnippetCode, snippetSignature } from "./code.js";
 import { API_BASE_URL } from "./config.js";
 
-export async function renderAlignmentView(container, dataArray) {
+export async function renderAlignmentView(container, dataArray, projectName = null) {
 	if (!dataArray || dataArray.length === 0) {
 		container.innerHTML = '<div style="padding:20px;">No data available.</div>';
 		return;
@@ -9,10 +9,19 @@ export async function renderAlignmentView(container, dataArray) {
 
 	container.innerHTML = ``;
 
+	// Fetched in the background so a click rarely waits on the raw file
+	const prefetchedSources = projectName ? fetchProjectSources(projectName) : Promise.resolve({});
+
 	// Fetch existing alignments
 	let alignmentsMap = {};
 	try {
-		const res = await fetch(`${API_BASE_URL}/alignments`);
+		// 'no-cache' revalidates with If-None-Match, so an unchanged snapshot is a 304
+		let res = projectName
+			? await fetch(`${API_BASE_URL}/alignments?project=${encodeURIComponent(projectName)}`, { cache: 'no-cache' })
+			: null;
+		if (!res || res.status === 404) {
+			res = await fetch(`${API_BASE_URL}/alignments`, { cache: 'no-cache' });
+		}
 		if (res.ok) {
 			alignmentsMap = await res.json();
 		}
@@ -63,7 +72,7 @@ export async function renderAlignmentView(container, dataArray) {
 
 				const displayTitle = snippet.label || `Snippet ${sIdx + 1}`;
 				// Generate signature
-				const signature = `${snippet.repoUrl}|${snippet.lineStart || ''}|${snippet.lineEnd || ''}`;
+				const signature = snippetSignature(snippet);
 
 				wrapper.innerHTML = `
                     <div class="alignment-inner-header">
@@ -142,11 +151,6 @@ export async function renderAlignmentView(container, dataArray) {
 					}
 				});
 
-				function trimLines(code, startLine, endLine) {
-					const lines = code.split(/\r?\n/); // handles \n and \r\n
-					return lines.slice(startLine - 1, endLine).join('\n');
-				}
-
 				btn.addEventListener('click', async (e) => {
 					e.preventDefault();
 					e.stopPropagation();
@@ -156,13 +160,8 @@ export async function renderAlignmentView(container, dataArray) {
 					statusText.textContent = '';
 
 					try {
-						const res = await fetch(snippet.repoUrl);
-						if (!res.ok) throw new Error('Network error');
-						var rawCode = await res.text();
-
-						if (snippet.lineStart && snippet.lineEnd) {
-							rawCode = trimLines(rawCode, snippet.lineStart, snippet.lineEnd);
-						}
+						const prefetched = await prefetchedSources;
+						const rawCode = prefetched[signature] ?? await fetchSnippetCode(snippet);
 
 						// Pass signature to API
 						const score = await callCodeAnalysisApi(rawCode, outputDiv, () => {
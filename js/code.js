@@ -173,3 +173,46 @@ export async function callSnippetAnalysisApi(codeSnippet, outputEle, firstTokenG
 		throw error;
 	}
 }
+
+function trimLines(code, startLine, endLine) {
+	const lines = code.split(/\r?\n/); // handles \n and \r\n
+	return lines.slice(startLine - 1, endLine).join('\n');
+}
+
+export function snippetSignature(snippet) {
+	return `${snippet.repoUrl}|${snippet.lineStart || ''}|${snippet.lineEnd || ''}`;
+}
+
+export async function fetchProjectSources(projectName) {
+	try {
+		const res = await fetch(`${API_BASE_URL}/snippets/sources?project=${encodeURIComponent(projectName)}`);
+		if (res.ok) {
+			return (await res.json()).sources;
+		}
+	} catch (e) {
+		console.warn("Failed to prefetch snippet sources:", e);
+	}
+	return {};
+}
+
+export async function fetchSnippetCode(snippet) {
+	// The backend serves trimmed snippets from its own cache; snippets not yet
+	// saved to content.json are only reachable directly
+	try {
+		const res = await fetch(`${API_BASE_URL}/snippets/source?signature=${encodeURIComponent(snippetSignature(snippet))}`, { cache: 'no-cache' });
+		if (res.ok) {
+			return await res.text();
+		}
+	} catch (e) {
+		console.warn("Snippet source endpoint unavailable, fetching directly:", e);
+	}
+
+	const res = await fetch(snippet.repoUrl);
+	if (!res.ok) throw new Error('Network error');
+	let rawCode = await res.text();
+
+	if (snippet.lineStart && snippet.lineEnd) {
+		rawCode = trimLines(rawCode, snippet.lineStart, snippet.lineEnd);
+	}
+	return rawCode;
+}
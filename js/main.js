@@ -2,7 +2,7 @@ import { initSettings } from './settings.js';
 import { renderOverview } from './overview.js';
 import { initFlow } from './flow.js';
 import { renderAlignmentView } from './alignment.js';
-import { callSnippetAnalysisApi } from './code.js';
+import { callSnippetAnalysisApi, fetchSnippetCode } from './code.js';
 
 let appData = null;
 const urlParams = new URLSearchParams(window.location.search);
@@ -74,7 +74,7 @@ function loadProject(index) {
 	}
 
 	renderOverview(document.getElementById('overview-view'), projectData.data);
-	renderAlignmentView(document.getElementById('alignment-view'), projectData.data);
+	renderAlignmentView(document.getElementById('alignment-view'), projectData.data, projectData.project);
 
 	updateCarouselUI();
 
@@ -276,19 +276,8 @@ export async function openModal(snippet) {
 	modal.classList.add('open');
 	body.innerHTML = `<div class="loading-text">Fetching ${snippet.file}...</div>`;
 
-	function trimLines(code, startLine, endLine) {
-		const lines = code.split(/\r?\n/); // handles \n and \r\n
-		return lines.slice(startLine - 1, endLine).join('\n');
-	}
-
 	try {
-		const res = await fetch(snippet.repoUrl);
-		if (!res.ok) throw new Error('Network error');
-		var rawCode = await res.text();
-
-		if (snippet.lineStart && snippet.lineEnd) {
-			rawCode = trimLines(rawCode, snippet.lineStart, snippet.lineEnd);
-		}
+		const rawCode = await fetchSnippetCode(snippet);
 
 		const markdownString = "```" + snippet.language + "\n" + rawCode + "\n```";
 		const parsedHtml = marked.parse(markdownString);
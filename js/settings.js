@@ -10,6 +10,7 @@ let currentSettings = {
 	grokEncrypted: {},
 	useLocalProvider: true,
 	defaultCloudProvider: 'gemini',
+	hedgeCloudProvider: '',
 	defaultLocalProvider: 'ollama',
 	ollama: {
 		url: 'http://localhost:11434',
@@ -239,6 +240,17 @@ function renderSettings(container) {
                             </label>
                         </div>
                     </div>
+                    <div class="input-group" style="margin-top: 15px;">
+                        <label class="input-label">Hedge Cloud Provider</label>
+                        <p class="settings-helper-text" style="margin: 0 0 6px;">Started too when the primary is slow to answer; the faster one is kept</p>
+                        <div class="radio-options">
+                            ${[['', 'Off'], ['gemini', 'Gemini'], ['openai', 'OpenAI'], ['anthropic', 'Anthropic'], ['grok', 'Grok']].map(([value, label]) => `
+                            <label class="model-radio-label">
+                                <input type="radio" name="hedgeCloud" value="${value}" ${currentSettings.hedgeCloudProvider === value ? 'checked' : ''}>
+                                <span>${label}</span>
+                            </label>`).join('')}
+                        </div>
+                    </div>
                     <div class="input-group" style="margin-top: 15px;">
                         <label class="input-label">Primary Local Provider</label>
                         <div class="radio-options">
@@ -485,6 +497,13 @@ function attachEventListeners() {
 		});
 	});
 
+	document.querySelectorAll('input[name="hedgeCloud"]').forEach(radio => {
+		radio.addEventListener('change', (e) => {
+			currentSettings.hedgeCloudProvider = e.target.value;
+			showSave();
+		});
+	});
+
 	document.querySelectorAll('input[name="defaultLocal"]').forEach(radio => {
 		radio.addEventListener('change', (e) => {
 			currentSettings.defaultLocalProvider = e.target.value;
@@ -683,6 +702,15 @@ export function getSettingsHeaders() {
 		headers['X-Cloud-IV'] = currentSettings[activeCloudKey].iv;
 	}
 
+	// Hedging needs the key of the second provider as well
+	const hedgeCloudKey = cloudKeyMap[currentSettings.hedgeCloudProvider];
+	if (hedgeCloudKey && Object.entries(currentSettings[hedgeCloudKey]).length) {
+		headers['X-Hedge-Provider'] = currentSettings.hedgeCloudProvider;
+		headers['X-Hedge-Api-Key'] = currentSettings[hedgeCloudKey].ciphertext;
+		headers['X-Hedge-Encrypted-Key'] = currentSettings[hedgeCloudKey].encryptedKey;
+		headers['X-Hedge-IV'] = currentSettings[hedgeCloudKey].iv;
+	}
+
 	// Attach the active local provider URL
 	if (currentSettings.defaultLocalProvider === 'ollama') {
 		headers['X-Local-Url'] = currentSettings.ollama.url;
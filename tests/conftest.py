@@ -1,10 +1,58 @@
 import pytest
+from unittest import mock
 from fastapi.testclient import TestClient
+from backend import database, metrics
+from backend.prompt_cache import stats as prompt_cache_stats
 from backend.api import app, limiter
 
+services = app.state.services
+
 # Disable rate limiting for all tests
 limiter.enabled = False
 
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    # Mocks differ per test, so nothing produced by one may leak into another
+    services.response_cache.clear()
+    services.inflight.clear()
+    services.ollama_registry.clear()
+    services.provider_clients.clear()
+    services.batch_limits.clear()
+    services.source_cache.clear()
+    prompt_cache_stats.clear()
+    services.ollama_scheduler.clear()
+    services.local_backends.reset()
+    services.hedger.clear()
+    services.circuits.clear()
+    services.admission.clear()
+    services.shared_state.clear()
+    metrics.registry.clear()
+    yield
+    services.response_cache.clear()
+    services.inflight.clear()
+    services.ollama_registry.clear()
+    services.provider_clients.clear()
+    services.batch_limits.clear()
+    services.source_cache.clear()
+    prompt_cache_stats.clear()
+    services.ollama_scheduler.clear()
+    services.local_backends.reset()
+    services.hedger.clear()
+    services.circuits.clear()
+    services.admission.clear()
+    services.shared_state.clear()
+    metrics.registry.clear()
+
+@pytest.fixture
+def temp_db(tmp_path):
+    db_path = tmp_path / "test_alignments.db"
+    # Patch the DB_NAME in the database module
+    with mock.patch("backend.database.DB_NAME", str(db_path)):
+        database.init_db()
+        yield str(db_path)
+        database.alignment_writer.flush()
+        database.connections.close_all()
+
 @pytest.fixture(scope="module")
 def client():
     return TestClient(app)
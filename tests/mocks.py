@@ -1,4 +1,6 @@
 import asyncio
+import fnmatch
+import time
 import ollama
 
 def make_mock_llama_stream(output: str):
@@ -21,3 +23,62 @@ def make_mock_anthropic_stream(output: str):
             await asyncio.sleep(0)
             yield token + " "
     return _stream
+
+class FakeRedis:
+    """In-memory stand-in for the subset of redis-py that RedisStateStore uses."""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+
+    def _alive(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._data
+
+    def get(self, name):
+        return self._data[name] if self._alive(name) else None
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        if nx and self._alive(name):
+            return None
+        self._data[name] = value if isinstance(value, bytes) else str(value).encode()
+        self._expires.pop(name, None)
+        ttl = px / 1000 if px is not None else ex
+        if ttl is not None:
+            self._expires[name] = time.monotonic() + ttl
+        return True
+
+    def incrby(self, name, amount=1):
+        value = int(self.get(name) or 0) + amount
+        self._data[name] = str(value).encode()
+        return value
+
+    def pexpire(self, name, ms):
+        if not self._alive(name):
+            return False
+        self._expires[name] = time.monotonic() + ms / 1000
+        return True
+
+    def pttl(self, name):
+        if not self._alive(name):
+            return -2
+        expires = self._expires.get(name)
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    def delete(self, *names):
+        removed = 0
+        for name in names:
+            if self._alive(name):
+                removed += 1
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return removed
+
+    def scan_iter(self, match="*"):
+        return iter([name for name in list(self._data) if self._alive(name) and fnmatch.fnmatchcase(name, match)])
+
+    def close(self):
+        pass
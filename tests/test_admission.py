@@ -0,0 +1,155 @@
+import asyncio
+import httpx
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.admission import AdmissionControl, Overloaded
+from backend.api import app
+
+admission = app.state.services.admission
+
+# --- AdmissionControl Unit Tests ---
+
+def test_requests_over_limit_queue_in_order():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1, max_queue=2)
+        first = await control.acquire("srvllama@http://gpu")
+        order = []
+
+        async def queued(tag):
+            permit = await control.acquire("srvllama@http://gpu")
+            order.append(tag)
+            permit.release()
+
+        tasks = [asyncio.create_task(queued(tag)) for tag in ("a", "b")]
+        await asyncio.sleep(0)
+        assert control.snapshot()["srvllama@http://gpu"] == {"limit": 1, "in_use": 1, "queued": 2}
+
+        first.release()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b"]
+        assert control.snapshot()["srvllama@http://gpu"]["in_use"] == 0
+
+    asyncio.run(run_test())
+
+def test_full_queue_sheds_with_retry_after():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1, max_queue=1, target_ttft=2)
+        await control.acquire("gemini")
+        waiting = asyncio.create_task(control.acquire("gemini"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as exc:
+            await control.acquire("gemini")
+        assert exc.value.retry_after >= 1
+        waiting.cancel()
+
+    asyncio.run(run_test())
+
+def test_queue_timeout_sheds_and_leaves_queue():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1, queue_timeout=0.01)
+        await control.acquire("gemini")
+        with pytest.raises(Overloaded):
+            await control.acquire("gemini")
+        assert control.snapshot()["gemini"]["queued"] == 0
+
+    asyncio.run(run_test())
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1)
+        holder = await control.acquire("gemini")
+        waiting = asyncio.create_task(control.acquire("gemini"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        holder.release()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert control.snapshot()["gemini"] == {"limit": 1, "in_use": 0, "queued": 0}
+
+    asyncio.run(run_test())
+
+def test_limit_grows_when_fast_and_backs_off_when_slow():
+    async def run_test():
+        control = AdmissionControl(initial_limit=2, max_limit=4, target_ttft=1.0, backoff=0.5)
+        for _ in range(6):
+            permit = await control.acquire("ollama@http://gpu")
+            permit.first_chunk()
+            permit.release()
+        assert control.snapshot()["ollama@http://gpu"]["limit"] == 4
+
+        with mock.patch("backend.admission.time.monotonic", side_effect=[100.0, 103.0, 103.0]):
+            permit = await control.acquire("ollama@http://gpu")
+            permit.first_chunk()
+            permit.release()
+        assert control.snapshot()["ollama@http://gpu"]["limit"] == 2
+
+        # A failure right after a decrease does not halve it again
+        with mock.patch("backend.admission.time.monotonic", side_effect=[103.2, 103.5]):
+            permit = await control.acquire("ollama@http://gpu")
+            permit.release(failed=True)
+        assert control.snapshot()["ollama@http://gpu"]["limit"] == 2
+
+    asyncio.run(run_test())
+
+def test_disabled_control_admits_everything():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1, max_queue=0, enabled=False)
+        permits = [await control.acquire("gemini") for _ in range(5)]
+        for permit in permits:
+            permit.release()
+        assert control.snapshot() == {}
+
+    asyncio.run(run_test())
+
+def test_only_idle_upstreams_are_forgotten():
+    async def run_test():
+        control = AdmissionControl(initial_limit=1, max_upstreams=2)
+        busy = await control.acquire("ollama@http://busy")
+        (await control.acquire("ollama@http://a")).release()
+        (await control.acquire("ollama@http://b")).release()
+
+        assert len(control) == 2
+        assert set(control.snapshot()) == {"ollama@http://busy", "ollama@http://b"}
+        assert control.snapshot()["ollama@http://busy"]["in_use"] == 1
+        busy.release()
+
+    asyncio.run(run_test())
+
+# --- API Integration Tests ---
+
+def test_analyze_sheds_load_with_429(base_headers, base_payload):
+    release = asyncio.Event()
+
+    async def slow_endpoint(*args):
+        async def gen():
+            yield "busy "
+            await release.wait()
+            yield "done"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+    })
+
+    async def run_test():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            first = asyncio.create_task(ac.post("/analyze", headers=headers, json=base_payload))
+            await asyncio.sleep(0.05)
+            other = {**base_payload, "code": "print('other')"}
+            shed = await ac.post("/analyze", headers=headers, json=other)
+            release.set()
+            return await first, shed
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": slow_endpoint}), \
+         mock.patch.object(admission, "initial_limit", 1), \
+         mock.patch.object(admission, "max_queue", 0):
+        first, shed = asyncio.run(run_test())
+
+    assert first.text == "busy done"
+    assert shed.status_code == 429
+    assert int(shed.headers["retry-after"]) >= 1
@@ -0,0 +1,99 @@
+import json
+import pytest
+from unittest import mock
+from backend import database
+from backend.content import snippet_signature
+
+REPO = "https://raw.githubusercontent.com/example/repo/main"
+
+@pytest.fixture
+def content_file(tmp_path):
+    path = tmp_path / "content.json"
+    path.write_text(json.dumps({
+        "collection": [
+            {
+                "project": "Alpha",
+                "data": [{"title": "S", "snippets": [
+                    {"repoUrl": f"{REPO}/a.py", "lineStart": 1, "lineEnd": 5},
+                    {"repoUrl": f"{REPO}/b.py"},
+                ]}],
+            },
+            {
+                "project": "Empty",
+                "data": [{"title": "S", "snippets": []}],
+            },
+        ]
+    }))
+    with mock.patch("backend.content.CONTENT_PATH", str(path)):
+        yield path
+
+@pytest.fixture
+def seeded_db(temp_db):
+    database.save_alignment(f"{REPO}/a.py|1|5", "alpha a")
+    database.save_alignment(f"{REPO}/b.py||", "alpha b")
+    database.save_alignment("https://other.example/c.py||", "other c")
+    return temp_db
+
+def test_snippet_signature_matches_frontend():
+    assert snippet_signature({"repoUrl": "u", "lineStart": 3, "lineEnd": 9}) == "u|3|9"
+    assert snippet_signature({"repoUrl": "u"}) == "u||"
+
+def test_unfiltered_returns_everything(client, seeded_db):
+    response = client.get("/alignments")
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert response.headers["x-total-count"] == "3"
+    assert response.headers["cache-control"] == "no-cache"
+
+def test_prefix_filter(client, seeded_db):
+    response = client.get("/alignments", params={"prefix": REPO})
+    assert response.json() == {
+        f"{REPO}/a.py|1|5": "alpha a",
+        f"{REPO}/b.py||": "alpha b",
+    }
+
+def test_project_filter(client, seeded_db, content_file):
+    response = client.get("/alignments", params={"project": "Alpha"})
+    assert set(response.json()) == {f"{REPO}/a.py|1|5", f"{REPO}/b.py||"}
+
+    assert client.get("/alignments", params={"project": "Empty"}).json() == {}
+    assert client.get("/alignments", params={"project": "Missing"}).status_code == 404
+
+def test_pagination(client, seeded_db):
+    first = client.get("/alignments", params={"limit": 2})
+    second = client.get("/alignments", params={"limit": 2, "offset": 2})
+
+    assert len(first.json()) == 2
+    assert len(second.json()) == 1
+    assert first.headers["x-total-count"] == "3"
+    assert not set(first.json()) & set(second.json())
+
+def test_since_delta(client, seeded_db):
+    with database.connections.writer() as conn:
+        conn.execute("UPDATE alignments SET timestamp = '2024-01-01 00:00:00'")
+    snapshot = client.get("/alignments").headers["x-alignments-timestamp"]
+    assert snapshot == "2024-01-01 00:00:00"
+
+    database.save_alignment("new||", "fresh")
+    later = client.get("/alignments", params={"since": "2024-01-01 00:00:01"})
+
+    assert later.json() == {"new||": "fresh"}
+    assert later.headers["x-alignments-timestamp"] > snapshot
+
+def test_etag_round_trip(client, seeded_db):
+    first = client.get("/alignments")
+    etag = first.headers["etag"]
+
+    cached = client.get("/alignments", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    database.save_alignment(f"{REPO}/a.py|1|5", "alpha a, re-checked")
+    changed = client.get("/alignments", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+def test_etag_depends_on_filters(client, seeded_db):
+    full = client.get("/alignments").headers["etag"]
+    filtered = client.get("/alignments", params={"prefix": REPO}).headers["etag"]
+    assert full != filtered
@@ -2,13 +2,15 @@ import pytest
 from unittest import mock
 
 class MockStream:
-    def __init__(self):
-        self.text_stream = ["hello ", "claude "]
+    @property
+    async def text_stream(self):
+        for text in ["hello ", "claude "]:
+            yield text
     
-    def __enter__(self):
+    async def __aenter__(self):
         return self
     
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
 
 @pytest.fixture
@@ -19,7 +21,7 @@ def mock_decrypt():
 
 @pytest.fixture
 def mock_anthropic_client():
-    with mock.patch("backend.api.Anthropic") as mock_client:
+    with mock.patch("anthropic.AsyncAnthropic") as mock_client:
         instance = mock_client.return_value
         instance.messages.stream.return_value = MockStream()
         yield mock_client
@@ -42,7 +44,7 @@ def test_analyze_codesnippet_claude_init_failure(client, base_headers, base_payl
         "x-default-cloud-provider": "claude",
     })
 
-    with mock.patch("backend.api.Anthropic", side_effect=Exception("boom")):
+    with mock.patch("anthropic.AsyncAnthropic", side_effect=Exception("boom")):
         response = client.post(
             "/analyze",
             json=base_payload,
@@ -1,7 +1,13 @@
 import pytest
 import os
+import sqlite3
+import subprocess
+import sys
+from unittest import mock
+from fastapi.responses import StreamingResponse
 from fastapi.testclient import TestClient
-from backend.api import app
+from backend import database, utils
+from backend.api import app, create_app, get_settings, limiter
 
 client = TestClient(app)
 
@@ -30,3 +36,76 @@ def test_cors_headers():
     )
     assert response.status_code == 200
     assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+
+def test_import_loads_no_provider_sdk():
+    script = (
+        "import sys, backend.api; "
+        "print([m for m in ('google.genai', 'openai', 'anthropic', 'ollama') if m in sys.modules])"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_import_reads_no_settings(tmp_path):
+    # A .env the settings cannot be built from only fails once the app is created
+    (tmp_path / ".env").write_text("STATE_BACKEND=etcd://somewhere\n")
+    script = (
+        "import backend.api as api, backend.utils as utils; "
+        "print(api.get_settings.cache_info().currsize, utils.get_settings.cache_info().currsize)"
+    )
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "0 0"
+
+def test_create_app_keeps_services_on_app_state():
+    built = create_app()
+    assert built.state.settings is get_settings()
+    assert built.state.services.settings is built.state.settings
+    # Each app gets its own caches, pools and counters
+    assert built.state.services is not app.state.services
+    assert built.state.services.response_cache is not app.state.services.response_cache
+
+def test_create_app_uses_given_settings():
+    settings = get_settings().model_copy(update={"RATE_LIMIT": "1/minute"})
+    built = create_app(settings)
+    assert built.state.services.settings.RATE_LIMIT == "1/minute"
+    assert app.state.settings.RATE_LIMIT != "1/minute"
+
+def test_apps_keep_separate_rate_limit_counters(base_headers):
+    async def endpoint(*args):
+        return StreamingResponse(iter(["ok"]), media_type="text/plain")
+
+    headers = {**base_headers, "x-use-local-provider": "true", "x-default-local-provider": "test"}
+    settings = get_settings().model_copy(update={"RATE_LIMIT": "1/minute"})
+    first, second = TestClient(create_app(settings)), TestClient(create_app(settings))
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch.object(limiter, "enabled", True):
+        statuses = [first.post("/analyze", headers=headers, json={"code": "x"}).status_code for _ in range(2)]
+        assert second.post("/analyze", headers=headers, json={"code": "x"}).status_code == 200
+
+    assert statuses == [200, 429]
+
+def test_lifespan_initializes_database(tmp_path):
+    db_path = tmp_path / "lifespan.db"
+    with mock.patch("backend.database.DB_NAME", str(db_path)):
+        assert not db_path.exists()
+        with TestClient(create_app()) as app_client:
+            assert app_client.app.state.http_pool is not None
+            conn = sqlite3.connect(db_path)
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            conn.close()
+            assert "alignments" in tables
+            assert utils.dek_cache.max_entries == app_client.app.state.settings.DEK_CACHE_SIZE
+        assert app_client.app.state.http_pool is None
+    database.connections.close_all()
+
+def test_stopping_one_app_leaves_process_resources_to_the_others(tmp_path):
+    with mock.patch("backend.database.DB_NAME", str(tmp_path / "apps.db")), \
+         mock.patch("backend.database.shutdown") as mock_shutdown:
+        with TestClient(create_app()) as first:
+            with TestClient(create_app()):
+                pass
+            mock_shutdown.assert_not_called()
+            assert first.get("/cache/stats").status_code == 200
+        mock_shutdown.assert_called_once()
+    database.connections.close_all()
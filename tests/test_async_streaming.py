@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from unittest import mock
+from backend.api import (
+    CodeAnalysisRequest,
+    analyze_codesnippet_endpoint_chatgpt,
+    analyze_codesnippet_endpoint_claude,
+    analyze_codesnippet_endpoint_gemini,
+    analyze_codesnippet_endpoint_grok,
+    get_settings,
+)
+from backend.services import Services
+
+# Each upstream read yields to the event loop, like a real network read.
+# With blocking SDK iteration the first stream would run to completion
+# before the second produced anything.
+
+def slow_tokens(name, events):
+    async def tokens():
+        for i in range(3):
+            await asyncio.sleep(0.001)
+            events.append(name)
+            yield f"{name}{i} "
+    return tokens()
+
+class GeminiChunk:
+    def __init__(self, text):
+        self.text = text
+
+class OpenAIChunk:
+    def __init__(self, text):
+        self.choices = [mock.Mock()]
+        self.choices[0].delta.content = text
+
+class AnthropicStream:
+    def __init__(self, tokens):
+        self.text_stream = tokens
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+def patch_gemini(events):
+    def factory(*args, **kwargs):
+        client = mock.Mock()
+
+        async def generate(**kwargs):
+            name = kwargs["contents"][0].strip()
+            return (GeminiChunk(t) async for t in slow_tokens(name, events))
+
+        client.aio.models.generate_content_stream = generate
+        return client
+    return mock.patch("google.genai.Client", side_effect=factory)
+
+def patch_openai(events):
+    def factory(*args, **kwargs):
+        client = mock.Mock()
+
+        async def create(**kwargs):
+            name = kwargs["messages"][1]["content"].strip()
+            return (OpenAIChunk(t) async for t in slow_tokens(name, events))
+
+        client.chat.completions.create = create
+        return client
+    return mock.patch("openai.AsyncOpenAI", side_effect=factory)
+
+def patch_claude(events):
+    def factory(*args, **kwargs):
+        client = mock.Mock()
+        client.messages.stream = lambda **kw: AnthropicStream(
+            slow_tokens(kw["messages"][0]["content"].strip(), events)
+        )
+        return client
+    return mock.patch("anthropic.AsyncAnthropic", side_effect=factory)
+
+@pytest.mark.parametrize("handler, patcher", [
+    (analyze_codesnippet_endpoint_gemini, patch_gemini),
+    (analyze_codesnippet_endpoint_chatgpt, patch_openai),
+    (analyze_codesnippet_endpoint_grok, patch_openai),
+    (analyze_codesnippet_endpoint_claude, patch_claude),
+])
+def test_concurrent_cloud_streams_interleave(handler, patcher):
+    events = []
+    services = Services(get_settings())
+
+    async def consume(name):
+        response = await handler(CodeAnalysisRequest(code=name), "false", "key", "dek", "iv", services)
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    async def run_test():
+        return await asyncio.gather(consume("a"), consume("b"))
+
+    with patcher(events), mock.patch("backend.api.utils.decrypt_envelope", return_value="FAKE_API_KEY"):
+        results = asyncio.run(run_test())
+
+    assert results == ["a0 a1 a2 ", "b0 b1 b2 "]
+    # Both streams are in progress before either finishes
+    assert events.index("b") < len(events) - 1 - events[::-1].index("a")
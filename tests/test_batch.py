@@ -0,0 +1,132 @@
+import asyncio
+import json
+import pytest
+from unittest import mock
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from backend.api import app, limiter
+from backend.batch import ProviderConcurrency
+
+batch_limits = app.state.services.batch_limits
+
+# --- ProviderConcurrency Unit Tests ---
+
+def test_provider_concurrency_overrides():
+    limits = ProviderConcurrency(2, {"ollama": 1})
+    assert limits.limit("gemini") == 2
+    assert limits.limit("ollama") == 1
+    assert limits.get("ollama") is limits.get("ollama")
+    assert limits.get("ollama") is not limits.get("gemini")
+
+# --- API Integration Tests ---
+
+@pytest.fixture
+def batch_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+    })
+    return headers
+
+def parse_ndjson(text):
+    return [json.loads(line) for line in text.splitlines() if line]
+
+def test_batch_streams_tagged_results_with_bounded_concurrency(client, batch_headers):
+    running = []
+    peak = []
+
+    async def endpoint(request_data, *args):
+        async def gen():
+            running.append(1)
+            peak.append(len(running))
+            try:
+                for token in [f"{request_data.code}-a ", f"{request_data.code}-b"]:
+                    await asyncio.sleep(0.01)
+                    yield token
+            finally:
+                running.pop()
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    payload = {"items": [
+        {"id": str(i), "code": f"code{i}", "signature": f"sig{i}"} for i in range(5)
+    ]}
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch.object(batch_limits, "default", 2), \
+         mock.patch("backend.api.queue_alignment") as mock_queue:
+        response = client.post("/analyze/batch", headers=batch_headers, json=payload)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    events = parse_ndjson(response.text)
+    for i in range(5):
+        mine = [e for e in events if e["id"] == str(i)]
+        assert "".join(e["text"] for e in mine if e["event"] == "chunk") == f"code{i}-a code{i}-b"
+        assert mine[-1] == {"id": str(i), "event": "done", "cache": "MISS", "failed": False}
+
+    assert max(peak) == 2
+    saved = sorted(call.args for call in mock_queue.call_args_list)
+    assert saved == [(f"sig{i}", f"code{i}-a code{i}-b") for i in range(5)]
+
+def test_batch_reports_item_errors_without_failing_others(client, batch_headers):
+    async def endpoint(request_data, *args):
+        if request_data.code == "bad":
+            raise HTTPException(status_code=404, detail="Unavailable model")
+
+        async def gen():
+            yield "ok"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    payload = {"items": [{"id": "a", "code": "bad"}, {"id": "b", "code": "good"}]}
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}):
+        response = client.post("/analyze/batch", headers=batch_headers, json=payload)
+
+    events = parse_ndjson(response.text)
+    assert {"id": "a", "event": "error", "status": 404, "detail": "Unavailable model"} in events
+    assert {"id": "b", "event": "chunk", "text": "ok"} in events
+
+def test_batch_rejects_duplicate_ids(client, batch_headers):
+    payload = {"items": [{"id": "a", "code": "x"}, {"id": "a", "code": "y"}]}
+    response = client.post("/analyze/batch", headers=batch_headers, json=payload)
+    assert response.status_code == 400
+
+def test_batch_rejects_oversized_batches(client, batch_headers):
+    payload = {"items": [{"id": str(i), "code": "x"} for i in range(3)]}
+    with mock.patch("backend.api.app.state.settings.BATCH_MAX_ITEMS", 2):
+        response = client.post("/analyze/batch", headers=batch_headers, json=payload)
+    assert response.status_code == 400
+
+def test_server_key_batch_is_charged_per_item(client):
+    headers = {"x-use-local-provider": "false", "x-default-cloud-provider": "gemini"}
+    payload = {"items": [{"id": str(i), "code": "x"} for i in range(3)]}
+
+    with mock.patch("backend.api.app.state.settings.DEMO_MODE", True), \
+         mock.patch("backend.api.app.state.settings.SERVER_SIDE_API_KEY", "server_secret"), \
+         mock.patch("backend.api.app.state.settings.RATE_LIMIT", "5/minute"), \
+         mock.patch("backend.api.app.state.settings.BATCH_MAX_ITEMS", 0), \
+         mock.patch.object(limiter, "enabled", True):
+        statuses = [client.post("/analyze/batch", headers=headers, json=payload).status_code for _ in range(2)]
+
+    # The first batch passes the limiter and stops at the size check; the
+    # second would take the client past five analyses
+    assert statuses == [400, 429]
+
+def test_batch_with_client_keys_costs_one_hit(client, batch_headers):
+    async def endpoint(request_data, *args):
+        async def gen():
+            yield "ok"
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    payload = {"items": [{"id": str(i), "code": "x"} for i in range(6)]}
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.api.app.state.settings.RATE_LIMIT", "5/minute"), \
+         mock.patch.object(limiter, "enabled", True):
+        response = client.post("/analyze/batch", headers=batch_headers, json=payload)
+
+    assert response.status_code == 200
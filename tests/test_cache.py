@@ -0,0 +1,124 @@
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.cache import ResponseCache, make_cache_key
+
+# --- ResponseCache Unit Tests ---
+
+def test_cache_key_normalizes_inputs():
+    a = make_cache_key("gemini", None, False, "x = 1\r\ny = 2\n", None)
+    b = make_cache_key("gemini", None, False, "x = 1\ny = 2", "")
+    assert a == b
+
+def test_cache_key_separates_provider_model_and_mode():
+    base = make_cache_key("ollama", "m1", False, "code", None)
+    assert base != make_cache_key("srvllama", "m1", False, "code", None)
+    assert base != make_cache_key("ollama", "m2", False, "code", None)
+    assert base != make_cache_key("ollama", "m1", True, "code", None)
+    assert base != make_cache_key("ollama", "m1", False, "code", "ctx")
+
+def test_cache_key_changes_with_prompt_version():
+    base = make_cache_key("gemini", None, False, "code", None)
+    with mock.patch("backend.cache.SYSTEM_PROMPT_VERSION", "other"):
+        assert make_cache_key("gemini", None, False, "code", None) != base
+
+def test_cache_replay_preserves_chunks():
+    cache = ResponseCache(max_entries=4, max_bytes=1024, ttl=60)
+    cache.put("k", ["héllo ", "wörld", "!"])
+    entry = cache.get("k")
+    assert list(entry.chunks()) == ["héllo ".encode(), "wörld".encode(), b"!"]
+    assert entry.text() == "héllo wörld!"
+
+def test_cache_ttl_expiry():
+    cache = ResponseCache(max_entries=4, max_bytes=1024, ttl=10)
+    with mock.patch("backend.cache.time.monotonic", return_value=100.0):
+        cache.put("k", ["a"])
+    with mock.patch("backend.cache.time.monotonic", return_value=105.0):
+        assert cache.get("k") is not None
+    with mock.patch("backend.cache.time.monotonic", return_value=111.0):
+        assert cache.get("k") is None
+    assert len(cache) == 0
+
+def test_cache_lru_eviction_by_count_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.put("a", ["1"])
+    cache.put("b", ["2"])
+    cache.get("a")
+    cache.put("c", ["3"])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    cache = ResponseCache(max_entries=10, max_bytes=20, ttl=60)
+    cache.put("a", ["x" * 8])
+    cache.put("b", ["y" * 8])
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.put("huge", ["z" * 64]) is None
+
+# --- API Integration Tests ---
+
+@pytest.fixture
+def counting_endpoint():
+    calls = []
+
+    async def fake_endpoint(*args, **kwargs):
+        calls.append(args)
+
+        async def gen():
+            yield "cached "
+            yield "answer"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": fake_endpoint}):
+        yield calls
+
+@pytest.fixture
+def test_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+    })
+    return headers
+
+def test_analyze_replays_cached_response(client, test_headers, base_payload, counting_endpoint):
+    first = client.post("/analyze", headers=test_headers, json=base_payload)
+    assert first.text == "cached answer"
+    assert first.headers["x-cache"] == "MISS"
+
+    second = client.post("/analyze", headers=test_headers, json=base_payload)
+    assert second.text == "cached answer"
+    assert second.headers["x-cache"] == "HIT"
+    assert len(counting_endpoint) == 1
+
+def test_analyze_cache_hit_still_saves_alignment(client, test_headers, base_payload, counting_endpoint):
+    client.post("/analyze", headers=test_headers, json=base_payload)
+
+    headers = test_headers.copy()
+    headers["x-snippet-signature"] = "sig"
+    with mock.patch("backend.api.queue_alignment") as mock_save:
+        response = client.post("/analyze", headers=headers, json=base_payload)
+        assert response.headers["x-cache"] == "HIT"
+        mock_save.assert_called_once_with("sig", "cached answer")
+
+def test_analyze_no_cache_header_bypasses_lookup(client, test_headers, base_payload, counting_endpoint):
+    client.post("/analyze", headers=test_headers, json=base_payload)
+
+    headers = test_headers.copy()
+    headers["cache-control"] = "no-cache"
+    response = client.post("/analyze", headers=headers, json=base_payload)
+    assert response.headers["x-cache"] == "MISS"
+    assert len(counting_endpoint) == 2
+
+def test_analyze_does_not_cache_errors(client, test_headers, base_payload):
+    async def failing_endpoint(*args, **kwargs):
+        async def gen():
+            yield "\n[SERVER_ERROR] An unexpected error occurred: boom"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": failing_endpoint}):
+        client.post("/analyze", headers=test_headers, json=base_payload)
+        response = client.post("/analyze", headers=test_headers, json=base_payload)
+        assert response.headers["x-cache"] == "MISS"
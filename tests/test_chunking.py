@@ -0,0 +1,47 @@
+from backend.chunking import split_code
+
+PYTHON = '''import os
+
+
+def first():
+    return 1
+
+
+@decorator
+def second():
+    x = 1
+    return x
+
+
+class Third:
+    def method(self):
+        pass
+'''
+
+def test_small_input_is_one_chunk():
+    chunks = split_code("x = 1\n", 100)
+    assert [(c.text, c.line_start, c.line_end) for c in chunks] == [("x = 1\n", 1, 1)]
+
+def test_splits_between_definitions():
+    chunks = split_code(PYTHON, 60)
+    assert "".join(c.text for c in chunks) == PYTHON
+    assert all(len(c.text) <= 60 for c in chunks)
+    # Decorators stay with their function, methods with their class
+    assert any(c.text.startswith("@decorator\ndef second") for c in chunks)
+    assert any(c.text.startswith("class Third") and "def method" in c.text for c in chunks)
+
+def test_line_numbers_cover_input():
+    chunks = split_code(PYTHON, 60)
+    assert chunks[0].line_start == 1
+    assert chunks[-1].line_end == PYTHON.count("\n")
+    for before, after in zip(chunks, chunks[1:]):
+        assert after.line_start == before.line_end + 1
+
+def test_oversized_units_fall_back_to_lines_and_characters():
+    body = "def big():\n" + "".join(f"    x{i} = {i}\n" for i in range(50))
+    long_line = "y" * 250 + "\n"
+    code = body + long_line
+
+    chunks = split_code(code, 100)
+    assert "".join(c.text for c in chunks) == code
+    assert all(len(c.text) <= 100 for c in chunks)
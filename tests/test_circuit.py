@@ -0,0 +1,194 @@
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.api import app
+from backend.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreakers
+
+circuits = app.state.services.circuits
+settings = app.state.settings
+
+# --- CircuitBreakers Unit Tests ---
+
+@pytest.fixture
+def clock():
+    now = [100.0]
+    with mock.patch("backend.circuit.time.monotonic", lambda: now[0]):
+        yield now
+
+def test_circuit_opens_after_threshold(clock):
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=30)
+    breakers.record("gemini", ok=False)
+    assert breakers.allow("gemini")
+
+    breakers.record("gemini", ok=False)
+    assert breakers.state("gemini") == OPEN
+    assert not breakers.allow("gemini")
+    assert breakers.retry_after("gemini") == 30
+
+    # Other upstreams are unaffected
+    assert breakers.allow("openai")
+
+def test_success_resets_failure_count(clock):
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=30)
+    breakers.record("gemini", ok=False)
+    breakers.record("gemini", ok=True)
+    breakers.record("gemini", ok=False)
+    assert breakers.state("gemini") == CLOSED
+
+def test_half_open_lets_one_probe_through(clock):
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=30)
+    breakers.record("ollama@http://gpu", ok=False)
+
+    clock[0] += 31
+    assert breakers.allow("ollama@http://gpu")
+    assert breakers.state("ollama@http://gpu") == HALF_OPEN
+    assert not breakers.allow("ollama@http://gpu")
+
+    breakers.record("ollama@http://gpu", ok=True)
+    assert breakers.state("ollama@http://gpu") == CLOSED
+    assert breakers.allow("ollama@http://gpu")
+
+def test_failed_probe_reopens(clock):
+    breakers = CircuitBreakers(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breakers.record("grok", ok=False)
+
+    clock[0] += 31
+    assert breakers.allow("grok")
+    breakers.record("grok", ok=False)
+    assert breakers.state("grok") == OPEN
+    assert not breakers.allow("grok")
+
+def test_abandoned_probe_is_retried(clock):
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=30)
+    breakers.record("grok", ok=False)
+    clock[0] += 31
+    assert breakers.allow("grok")
+
+    clock[0] += 31
+    assert breakers.allow("grok")
+
+    breakers.release("grok")
+    assert breakers.allow("grok")
+
+def test_zero_threshold_disables_breaking():
+    breakers = CircuitBreakers(failure_threshold=0)
+    for _ in range(10):
+        breakers.record("gemini", ok=False)
+    assert breakers.allow("gemini")
+
+def test_least_recently_recorded_circuit_is_forgotten(clock):
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=30, max_upstreams=2)
+    breakers.record("gemini", ok=False)
+    breakers.record("ollama@http://a", ok=False)
+    breakers.record("gemini", ok=False)
+    breakers.record("ollama@http://b", ok=False)
+
+    assert len(breakers) == 2
+    assert breakers.state("gemini") == OPEN
+    assert breakers.state("ollama@http://a") == CLOSED
+
+# --- API Integration Tests ---
+
+def stream_endpoint(chunks, calls, name):
+    async def endpoint(*args):
+        calls.append(name)
+
+        async def gen():
+            for chunk in chunks:
+                yield chunk
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    return endpoint
+
+@pytest.fixture
+def failover_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+        "x-default-cloud-provider": "backup",
+        "cache-control": "no-cache",
+    })
+    return headers
+
+def test_analyze_fails_over_before_first_byte(client, failover_headers, base_payload):
+    calls = []
+    endpoints = {
+        "analyze_codesnippet_test": stream_endpoint(["\n[SERVER_ERROR] An unexpected error occurred: down"], calls, "test"),
+        "analyze_codesnippet_backup": stream_endpoint(["backup ", "answer"], calls, "backup"),
+    }
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch.dict(settings.PROVIDER_FALLBACKS, {"test": ["backup"]}), \
+         mock.patch.object(circuits, "failure_threshold", 1):
+        first = client.post("/analyze", headers=failover_headers, json=base_payload)
+        second = client.post("/analyze", headers=failover_headers, json=base_payload)
+
+    assert first.text == "backup answer"
+    assert first.headers["x-failover"] == "backup"
+    # The open circuit skips the local provider without calling it
+    assert second.text == "backup answer"
+    assert calls == ["test", "backup", "backup"]
+    assert client.get("/circuits").json()["test@http://test.com"]["state"] == OPEN
+
+def test_failover_answer_is_not_cached_as_the_requested_provider(client, failover_headers, base_payload):
+    calls = []
+    responses = iter([["\n[SERVER_ERROR] An unexpected error occurred: down"], ["local answer"]])
+
+    async def flaky(request_data, *args):
+        return await stream_endpoint(next(responses), calls, "test")(request_data, *args)
+
+    endpoints = {
+        "analyze_codesnippet_test": flaky,
+        "analyze_codesnippet_backup": stream_endpoint(["backup answer"], calls, "backup"),
+    }
+    del failover_headers["cache-control"]
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch.dict(settings.PROVIDER_FALLBACKS, {"test": ["backup"]}):
+        first = client.post("/analyze", headers=failover_headers, json=base_payload)
+        second = client.post("/analyze", headers=failover_headers, json=base_payload)
+        backup = client.post("/analyze", headers={**failover_headers, "x-use-local-provider": "false"}, json=base_payload)
+
+    assert first.text == "backup answer"
+    # The local provider recovered; its own answer is fetched, not the backup's from cache
+    assert second.headers["x-cache"] == "MISS"
+    assert second.text == "local answer"
+    # The backup's answer is cached under the backup provider
+    assert backup.headers["x-cache"] == "HIT"
+    assert backup.text == "backup answer"
+    assert calls == ["test", "backup", "test"]
+
+def test_analyze_without_fallback_keeps_error_then_fails_fast(client, failover_headers, base_payload):
+    calls = []
+    endpoints = {
+        "analyze_codesnippet_test": stream_endpoint(["\n[SERVER_ERROR] An unexpected error occurred: down"], calls, "test"),
+    }
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch.object(circuits, "failure_threshold", 1):
+        first = client.post("/analyze", headers=failover_headers, json=base_payload)
+        second = client.post("/analyze", headers=failover_headers, json=base_payload)
+
+    assert first.status_code == 200
+    assert first.text.startswith("\n[SERVER_ERROR]")
+    assert second.status_code == 503
+    assert int(second.headers["retry-after"]) >= 1
+    assert calls == ["test"]
+
+def test_analyze_skips_fallback_without_credentials(client, failover_headers, base_payload):
+    calls = []
+    endpoints = {
+        "analyze_codesnippet_test": stream_endpoint(["\n[SERVER_ERROR] boom"], calls, "test"),
+        "analyze_codesnippet_other": stream_endpoint(["unreachable"], calls, "other"),
+    }
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch.dict(settings.PROVIDER_FALLBACKS, {"test": ["other"]}), \
+         mock.patch.object(settings, "DEMO_MODE", False):
+        response = client.post("/analyze", headers=failover_headers, json=base_payload)
+
+    assert response.text == "\n[SERVER_ERROR] boom"
+    assert calls == ["test"]
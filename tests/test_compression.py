@@ -0,0 +1,130 @@
+import sqlite3
+import pytest
+from unittest import mock
+from backend import compression, database
+
+def make_audit(i):
+    return (
+        "## Industry Alignment Score\n"
+        f"{40 + i}/100\n\n"
+        "## Strengths\n"
+        f"* Clear separation of concerns in module {i}\n"
+        "* Consistent error handling\n\n"
+        "## Weaknesses\n"
+        f"* Missing input validation on handler {i} (Source: [OWASP](https://owasp.org))\n\n"
+        "## Justification\n"
+        "The code is readable and mostly idiomatic, but it is not production ready.\n"
+    )
+
+# --- Codec Unit Tests ---
+
+def test_dictionary_prefers_recurring_lines():
+    samples = [make_audit(i) for i in range(5)]
+    zdict = compression.train_dictionary(samples)
+
+    assert b"## Strengths\n" in zdict
+    assert b"module 3" not in zdict
+    assert len(zdict) <= compression.MAX_DICT_SIZE
+
+def test_dictionary_respects_size_limit():
+    samples = ["\n".join(f"line {j} " * 20 for j in range(200))] * 2
+    assert len(compression.train_dictionary(samples, size=1024)) <= 1024
+
+def test_round_trip_with_and_without_dictionary():
+    zdict = compression.train_dictionary([make_audit(i) for i in range(5)])
+    text = make_audit(99) + "ünïcödé"
+
+    assert compression.decompress(compression.compress(text, zdict), zdict) == text
+    assert compression.decompress(compression.compress(text, None), None) == text
+
+def test_dictionary_improves_ratio():
+    zdict = compression.train_dictionary([make_audit(i) for i in range(20)])
+    text = make_audit(123)
+    assert len(compression.compress(text, zdict)) < len(compression.compress(text, None))
+
+# --- Storage Tests ---
+
+def test_saved_alignments_are_stored_compressed(temp_db):
+    database.save_alignment("sig1", make_audit(1))
+
+    conn = sqlite3.connect(temp_db)
+    text, blob, dict_id = conn.execute(
+        "SELECT alignment_text, alignment_blob, dict_id FROM alignments WHERE signature = 'sig1'"
+    ).fetchone()
+    conn.close()
+
+    assert text is None
+    assert blob and dict_id is not None
+    assert database.get_all_alignments() == {"sig1": make_audit(1)}
+
+def test_rows_are_decompressed_only_when_served(temp_db):
+    for i in range(10):
+        database.save_alignment(f"sig{i}", make_audit(i))
+
+    with mock.patch("backend.database.compression.decompress", wraps=compression.decompress) as decompress:
+        page = database.query_alignments(limit=3)
+        database.get_alignments_version()
+
+    assert len(page) == 3
+    assert decompress.call_count == 3
+
+def test_worker_writing_with_an_older_dictionary_survives_migration(temp_db):
+    database.save_alignment("sig0", make_audit(0))
+    workerDictionary = database._current_dictionary[temp_db]
+
+    database.compress_existing(temp_db)
+    # Another worker still compresses against the dictionary it cached before the migration
+    with mock.patch.dict(database._current_dictionary, {temp_db: workerDictionary}):
+        database.save_alignment("sig1", make_audit(1))
+
+    # After a restart nothing is cached and every dictionary is read back from the file
+    database._dictionaries.clear()
+    database._current_dictionary.clear()
+    assert database.get_all_alignments() == {"sig0": make_audit(0), "sig1": make_audit(1)}
+
+def test_undecodable_row_is_left_out(temp_db):
+    for i in range(3):
+        database.save_alignment(f"sig{i}", make_audit(i))
+    with database.connections.writer(temp_db) as conn:
+        conn.execute("UPDATE alignments SET dict_id = 999 WHERE signature = 'sig1'")
+
+    expected = {"sig0": make_audit(0), "sig2": make_audit(2)}
+    assert database.get_all_alignments() == expected
+    assert database.query_alignments(prefix="sig") == expected
+
+def test_migration_compresses_legacy_database(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE alignments (
+            signature TEXT PRIMARY KEY,
+            alignment_text TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO alignments VALUES (?, ?, '2024-01-01 00:00:00')",
+        [(f"sig{i}", make_audit(i)) for i in range(50)],
+    )
+    conn.commit()
+    conn.close()
+
+    try:
+        stats = database.compress_existing(path)
+        assert stats["rows"] == 50
+        assert stats["bytes_after"] < stats["bytes_before"] / 2
+
+        with mock.patch("backend.database.DB_NAME", path):
+            assert database.get_all_alignments() == {f"sig{i}": make_audit(i) for i in range(50)}
+            # Re-running trains a replacement dictionary and keeps the old one
+            database.compress_existing(path)
+            database.save_alignment("sig50", make_audit(50))
+            assert database.get_all_alignments()["sig50"] == make_audit(50)
+
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM alignments WHERE alignment_text IS NOT NULL").fetchone()[0] == 0
+        assert conn.execute("SELECT DISTINCT timestamp FROM alignments WHERE signature != 'sig50'").fetchall() == [("2024-01-01 00:00:00",)]
+        assert conn.execute("SELECT COUNT(*) FROM compression_dicts").fetchone()[0] == 2
+        conn.close()
+    finally:
+        database.connections.close_all()
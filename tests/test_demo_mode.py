@@ -1,7 +1,9 @@
 import pytest
 from unittest import mock
 from fastapi.testclient import TestClient
-from backend.api import settings  # Import the specific instance used by the app
+from backend.api import app
+
+settings = app.state.settings  # The specific instance used by the app
 
 @pytest.fixture
 def demo_mode_settings():
@@ -27,14 +29,14 @@ def test_analyze_demo_mode_success(client, base_payload, demo_mode_settings):
         # Missing keys and other headers, relying on Demo Mode to bypass strict check
     }
     
-    with mock.patch("backend.api.genai.Client") as mock_genai:
+    with mock.patch("google.genai.Client") as mock_genai:
         instance = mock_genai.return_value
         # Mock the stream
         class MockStream:
-            def __iter__(self):
+            async def __aiter__(self):
                 yield mock.Mock(text="demo content")
                 
-        instance.models.generate_content_stream.return_value = MockStream()
+        instance.aio.models.generate_content_stream = mock.AsyncMock(return_value=MockStream())
 
         response = client.post("/analyze", json=base_payload, headers=headers)
         
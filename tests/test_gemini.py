@@ -7,15 +7,15 @@ class MockChunk:
         self.text = text
 
 class MockStream:
-    def __iter__(self):
+    async def __aiter__(self):
         yield MockChunk("hello ")
         yield MockChunk("world ")
 
 @pytest.fixture
 def mock_gemini_client():
-    with mock.patch("backend.api.genai.Client") as mock_client:
+    with mock.patch("google.genai.Client") as mock_client:
         instance = mock_client.return_value
-        instance.models.generate_content_stream.return_value = MockStream()
+        instance.aio.models.generate_content_stream = mock.AsyncMock(return_value=MockStream())
         yield mock_client
 
 @pytest.fixture
@@ -52,7 +52,7 @@ def test_analyze_codesnippet_incomplete_headers(client, base_headers, base_paylo
 
 def test_gemini_client_init_failure(client, base_headers, base_payload):
     # Force client init to fail
-    with mock.patch("backend.api.genai.Client", side_effect=Exception("boom")):
+    with mock.patch("google.genai.Client", side_effect=Exception("boom")):
         response = client.post(
             "/analyze",
             json=base_payload,
@@ -150,12 +150,17 @@ def test_ollama_stream_exception():
 
 class MockAnthropicStream:
     def __init__(self, text_chunks):
-        self.text_stream = text_chunks
+        self.text_chunks = text_chunks
+
+    @property
+    async def text_stream(self):
+        for text in self.text_chunks:
+            yield text
     
-    def __enter__(self):
+    async def __aenter__(self):
         return self
     
-    def __exit__(self, *args):
+    async def __aexit__(self, *args):
         pass
 
 def test_anthropic_stream_success():
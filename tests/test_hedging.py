@@ -0,0 +1,251 @@
+import asyncio
+import pytest
+from unittest import mock
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from backend.hedging import Hedger
+
+def make_opener(chunks, delay=0.0, log=None, name=None):
+    async def gen():
+        try:
+            await asyncio.sleep(delay)
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if log is not None:
+                log.append(f"closed {name}")
+
+    async def opener():
+        if log is not None:
+            log.append(f"opened {name}")
+        return gen()
+
+    return opener
+
+async def drain(body):
+    return "".join([chunk async for chunk in body])
+
+# --- Hedger Unit Tests ---
+
+def test_fast_primary_is_not_hedged():
+    async def run_test():
+        hedger = Hedger(default_delay=0.2)
+        log = []
+        result = await hedger.run(
+            "gemini", make_opener(["a", "b"], log=log, name="gemini"),
+            "openai", make_opener(["x"], log=log, name="openai"),
+        )
+        assert result.winner == "gemini"
+        assert not result.hedged
+        assert await drain(result.body) == "ab"
+        assert "opened openai" not in log
+        assert hedger.snapshot()["outcomes"]["gemini"] == {"requests": 1, "hedged": 0, "wins": {"gemini": 1}}
+
+    asyncio.run(run_test())
+
+def test_slow_primary_loses_to_hedge_and_is_cancelled():
+    async def run_test():
+        hedger = Hedger(default_delay=0.01)
+        log = []
+        result = await hedger.run(
+            "gemini", make_opener(["slow"], delay=1, log=log, name="gemini"),
+            "openai", make_opener(["fast ", "answer"], log=log, name="openai"),
+        )
+        assert result.winner == "openai"
+        assert result.hedged
+        assert "closed gemini" in log
+        assert await drain(result.body) == "fast answer"
+        assert hedger.snapshot()["outcomes"]["gemini"]["wins"] == {"openai": 1}
+
+    asyncio.run(run_test())
+
+def test_failed_hedge_does_not_beat_slow_primary():
+    async def run_test():
+        hedger = Hedger(default_delay=0.01)
+        result = await hedger.run(
+            "gemini", make_opener(["late answer"], delay=0.05),
+            "openai", make_opener(["\n[API_ERROR] OpenAI API Error: quota"]),
+        )
+        assert result.winner == "gemini"
+        assert await drain(result.body) == "late answer"
+
+    asyncio.run(run_test())
+
+def test_primary_setup_error_surfaces_when_both_fail():
+    async def run_test():
+        hedger = Hedger(default_delay=0.01)
+
+        async def broken():
+            await asyncio.sleep(0.02)
+            raise HTTPException(status_code=503, detail="no client")
+
+        with pytest.raises(HTTPException) as exc:
+            await hedger.run("gemini", broken, "openai", make_opener(["\n[SERVER_ERROR] boom"]))
+        assert exc.value.status_code == 503
+
+    asyncio.run(run_test())
+
+def test_delay_follows_observed_percentile():
+    hedger = Hedger(percentile=90, default_delay=5, min_delay=0.1, min_samples=10)
+    for i in range(9):
+        hedger.record_ttft("grok", 1.0)
+    assert hedger.delay("grok") == 5
+
+    hedger.record_ttft("grok", 3.0)
+    assert hedger.delay("grok") == 1.0
+    for _ in range(10):
+        hedger.record_ttft("grok", 3.0)
+    assert hedger.delay("grok") == 3.0
+
+    for _ in range(200):
+        hedger.record_ttft("claude", 0.01)
+    assert hedger.delay("claude") == 0.1
+
+# --- API Integration Tests ---
+
+@pytest.fixture
+def hedge_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-default-cloud-provider": "slow",
+        "x-hedge-provider": "fast",
+        "cache-control": "no-cache",
+    })
+    with mock.patch("backend.api.app.state.settings.HEDGE_ENABLED", True):
+        yield headers
+
+def stream_endpoint(chunks, delay=0.0, calls=None):
+    async def endpoint(request_data, use_snippet, api_key, enc_key, iv, services):
+        if calls is not None:
+            calls.append(api_key)
+
+        async def gen():
+            await asyncio.sleep(delay)
+            for chunk in chunks:
+                yield chunk
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    return endpoint
+
+def test_analyze_hedges_to_secondary_provider(client, hedge_headers, base_payload):
+    calls = []
+    hedge_headers.update({"x-hedge-api-key": "hedge-key", "x-hedge-encrypted-key": "k", "x-hedge-iv": "iv"})
+    endpoints = {
+        "analyze_codesnippet_slow": stream_endpoint(["slow"], delay=1, calls=calls),
+        "analyze_codesnippet_fast": stream_endpoint(["fast"], calls=calls),
+    }
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch("backend.api.app.state.services.hedger.default_delay", 0.01):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.status_code == 200
+    assert response.text == "fast"
+    assert response.headers["x-hedge-winner"] == "fast"
+    assert calls == ["encrypted", "hedge-key"]
+
+    stats = client.get("/hedging/stats").json()
+    assert stats["outcomes"]["slow"]["wins"] == {"fast": 1}
+
+def test_analyze_without_hedge_header_samples_ttft(client, hedge_headers, base_payload):
+    del hedge_headers["x-hedge-provider"]
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_slow": stream_endpoint(["ok"])}):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.text == "ok"
+    assert "x-hedge-winner" not in response.headers
+    assert "slow" in client.get("/hedging/stats").json()["deadlines"]
+
+def test_analyze_ignores_unknown_hedge_provider(client, hedge_headers, base_payload):
+    hedge_headers["x-hedge-provider"] = "nope"
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_slow": stream_endpoint(["ok"])}):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.text == "ok"
+    assert "x-hedge-winner" not in response.headers
+
+def test_hedging_is_off_by_default(client, base_headers, base_payload):
+    from backend.config import Settings
+    assert Settings.model_fields["HEDGE_ENABLED"].default is False
+
+    calls = []
+    headers = {**base_headers, "x-default-cloud-provider": "slow", "x-hedge-provider": "fast",
+               "x-hedge-api-key": "hedge-key", "x-hedge-encrypted-key": "k", "x-hedge-iv": "iv"}
+    endpoints = {
+        "analyze_codesnippet_slow": stream_endpoint(["slow"], delay=0.05, calls=calls),
+        "analyze_codesnippet_fast": stream_endpoint(["fast"], calls=calls),
+    }
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch("backend.api.app.state.settings.HEDGE_ENABLED", False), \
+         mock.patch("backend.api.app.state.services.hedger.default_delay", 0.01):
+        response = client.post("/analyze", headers=headers, json=base_payload)
+
+    assert response.text == "slow"
+    assert calls == ["encrypted"]
+
+def test_hedge_to_the_primary_provider_is_ignored(client, hedge_headers, base_payload):
+    calls = []
+    hedge_headers.update({
+        "x-hedge-provider": "slow",
+        "x-hedge-api-key": "hedge-key", "x-hedge-encrypted-key": "k", "x-hedge-iv": "iv",
+    })
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_slow": stream_endpoint(["ok"], delay=0.05, calls=calls)}), \
+         mock.patch("backend.api.app.state.services.hedger.default_delay", 0.01):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.status_code == 200
+    assert response.text == "ok"
+    assert calls == ["encrypted"]
+
+def test_same_hedge_and_cloud_provider_do_not_block_local_requests(client, hedge_headers, base_payload):
+    hedge_headers.update({
+        "x-hedge-provider": "slow",
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+        "x-local-url": "http://local",
+        "x-local-alignment-model": "m",
+        "x-local-snippet-model": "m",
+    })
+    async def local_endpoint(*args):
+        return StreamingResponse(iter(["local"]), media_type="text/plain")
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": local_endpoint}):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.status_code == 200
+    assert response.text == "local"
+
+def test_hedge_without_its_own_key_is_ignored(client, hedge_headers, base_payload):
+    calls = []
+    endpoints = {
+        "analyze_codesnippet_slow": stream_endpoint(["slow"], delay=0.05, calls=calls),
+        "analyze_codesnippet_fast": stream_endpoint(["fast"], calls=calls),
+    }
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch("backend.api.app.state.services.hedger.default_delay", 0.01):
+        response = client.post("/analyze", headers=hedge_headers, json=base_payload)
+
+    assert response.text == "slow"
+    assert calls == ["encrypted"]
+
+def test_hedge_winner_is_cached_as_its_own_provider(client, hedge_headers, base_payload):
+    del hedge_headers["cache-control"]
+    hedge_headers.update({"x-hedge-api-key": "hedge-key", "x-hedge-encrypted-key": "k", "x-hedge-iv": "iv"})
+    endpoints = {
+        "analyze_codesnippet_slow": stream_endpoint(["slow"], delay=1),
+        "analyze_codesnippet_fast": stream_endpoint(["fast"]),
+    }
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", endpoints), \
+         mock.patch("backend.api.app.state.services.hedger.default_delay", 0.01):
+        hedged = client.post("/analyze", headers=hedge_headers, json=base_payload)
+        fast = client.post("/analyze", headers={**hedge_headers, "x-default-cloud-provider": "fast", "x-hedge-provider": ""}, json=base_payload)
+
+    assert hedged.text == "fast"
+    assert fast.headers["x-cache"] == "HIT"
+    assert fast.text == "fast"
+    # Nothing was cached for the provider that lost
+    from backend.api import app
+    response_cache = app.state.services.response_cache
+    assert len(response_cache) == 1
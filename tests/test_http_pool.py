@@ -0,0 +1,125 @@
+import asyncio
+import json
+import pytest
+from unittest import mock
+from fastapi.testclient import TestClient
+from backend.api import app
+from backend.dependencies import get_llama_streamer
+from backend.generators import llama_stream
+from backend.http_pool import HTTPClientPool
+
+class MockHttpxResponse:
+    status_code = 200
+
+    async def aiter_lines(self):
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": "pooled"}}]})
+        yield "data: [DONE]"
+
+    async def aread(self):
+        return b""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+def test_pool_reuses_client_per_origin():
+    async def run_test():
+        pool = HTTPClientPool()
+        async with pool.client("http://gpu-1:8080/v1/chat/completions") as a:
+            pass
+        async with pool.client("http://GPU-1:8080/health") as b:
+            pass
+        async with pool.client("http://gpu-2:8080/v1/chat/completions") as c:
+            pass
+
+        assert a is b
+        assert a is not c
+        assert len(pool) == 2
+
+        await pool.aclose()
+        assert a.is_closed and c.is_closed
+        assert len(pool) == 0
+
+    asyncio.run(run_test())
+
+def test_pool_closes_least_recently_used_idle_clients():
+    async def run_test():
+        pool = HTTPClientPool(max_clients=2)
+        async with pool.client("http://busy:8080") as busy:
+            async with pool.client("http://a:8080") as a:
+                pass
+            async with pool.client("http://b:8080") as b:
+                pass
+            await asyncio.sleep(0)
+            # The oldest client is still streaming, so the next oldest goes
+            assert len(pool) == 2
+            assert a.is_closed
+            assert not busy.is_closed and not b.is_closed
+
+        async with pool.client("http://c:8080"):
+            pass
+        await asyncio.sleep(0)
+        assert busy.is_closed
+        assert len(pool) == 2
+        await pool.aclose()
+
+    asyncio.run(run_test())
+
+def test_pool_applies_limits():
+    pool = HTTPClientPool(max_connections=3, max_keepalive_connections=2, keepalive_expiry=5)
+    assert pool.limits.max_connections == 3
+    assert pool.limits.max_keepalive_connections == 2
+    assert pool.limits.keepalive_expiry == 5
+
+def test_pool_falls_back_without_h2():
+    with mock.patch("backend.http_pool.importlib.util.find_spec", return_value=None):
+        pool = HTTPClientPool(http2=True)
+    assert pool.http2 is False
+
+def test_llama_stream_uses_pooled_client_without_closing():
+    async def run_test():
+        pool = HTTPClientPool()
+        async with pool.client("http://test/v1") as client:
+            pass
+
+        with mock.patch.object(client, "stream", return_value=MockHttpxResponse()) as stream:
+            chunks = [c async for c in llama_stream("http://test/v1", {}, pool=pool)]
+
+        assert chunks == ["pooled"]
+        assert stream.call_args.args[1] == "http://test/v1"
+        assert not client.is_closed
+        await pool.aclose()
+
+    asyncio.run(run_test())
+
+def test_lifespan_creates_and_closes_pool(temp_db):
+    with TestClient(app) as client:
+        pool = app.state.http_pool
+        assert isinstance(pool, HTTPClientPool)
+
+        request = mock.Mock()
+        request.app = app
+        assert get_llama_streamer(request).keywords["pool"] is pool
+
+    assert app.state.http_pool is None
+
+def test_llama_streamer_is_injectable(client, base_headers, base_payload):
+    async def fake_streamer(url, payload):
+        yield "injected"
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-use-snippet-model": "true",
+        "x-default-local-provider": "srvllama",
+    })
+
+    app.dependency_overrides[get_llama_streamer] = lambda: fake_streamer
+    try:
+        response = client.post("/analyze", headers=headers, json=base_payload)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.text == "injected"
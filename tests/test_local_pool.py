@@ -0,0 +1,148 @@
+import asyncio
+import httpx
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.local_pool import LocalBackendPool
+
+NODES = ["http://gpu1:11434", "http://gpu2:11434"]
+
+# --- LocalBackendPool Unit Tests ---
+
+def test_acquire_prefers_least_outstanding():
+    pool = LocalBackendPool({"ollama": NODES})
+
+    first = pool.acquire("ollama")
+    second = pool.acquire("ollama")
+    assert {first.url, second.url} == set(NODES)
+
+    # With the first node still busy, new work goes to the idle one
+    second.release()
+    assert pool.acquire("ollama").url == second.url
+
+def test_release_is_idempotent():
+    pool = LocalBackendPool({"ollama": NODES[:1]})
+    lease = pool.acquire("ollama")
+    lease.release()
+    lease.release()
+    assert pool.snapshot()["ollama"][0]["outstanding"] == 0
+
+def test_failures_eject_backend_until_probe_succeeds():
+    async def run_test():
+        up = {"gpu1": False, "gpu2": True}
+
+        def handler(request):
+            assert request.url.path == "/api/version"
+            return httpx.Response(200 if up[request.url.host] else 503)
+
+        pool = LocalBackendPool({"ollama": NODES}, eject_after=2, transport=httpx.MockTransport(handler))
+        gpu1 = pool.backends("ollama")[0]
+
+        pool.report(gpu1, ok=False)
+        assert gpu1.healthy
+        assert await pool.probe(gpu1) is False
+        assert not gpu1.healthy
+        assert all(pool.acquire("ollama").url == NODES[1] for _ in range(3))
+
+        up["gpu1"] = True
+        await pool.probe_all()
+        assert gpu1.healthy
+        assert gpu1.failures == 0
+        await pool.aclose()
+
+    asyncio.run(run_test())
+
+def test_ejected_backend_is_retried_after_cooldown_without_probes():
+    pool = LocalBackendPool({"ollama": NODES}, eject_after=2, probe_interval=0, cooldown=30)
+    gpu1 = pool.backends("ollama")[0]
+
+    with mock.patch("backend.local_pool.time.monotonic", return_value=100.0):
+        pool.report(gpu1, ok=False)
+        pool.report(gpu1, ok=False)
+        assert not gpu1.healthy
+        assert pool.acquire("ollama").url == NODES[1]
+
+    with mock.patch("backend.local_pool.time.monotonic", return_value=130.0):
+        lease = pool.acquire("ollama")
+        assert gpu1.healthy and lease.url == NODES[0]
+
+        # A failed trial ejects it again straight away
+        lease.release(failed=True)
+        assert not gpu1.healthy
+        assert gpu1.ejected_at == 130.0
+
+def test_no_healthy_backend_raises():
+    pool = LocalBackendPool({"srvllama": ["http://gpu1:8080/v1/chat/completions"]}, eject_after=1)
+    pool.acquire("srvllama").release(failed=True)
+    with pytest.raises(LookupError):
+        pool.acquire("srvllama")
+    assert not pool.has("ollama")
+
+def test_probe_uses_provider_health_path():
+    async def run_test():
+        seen = []
+
+        def handler(request):
+            seen.append(str(request.url))
+            return httpx.Response(200)
+
+        pool = LocalBackendPool(
+            {"srvllama": ["http://gpu1:8080/v1/chat/completions"]},
+            transport=httpx.MockTransport(handler),
+        )
+        await pool.probe_all()
+        assert seen == ["http://gpu1:8080/health"]
+        await pool.aclose()
+
+    asyncio.run(run_test())
+
+# --- API Integration Tests ---
+
+@pytest.fixture
+def pooled_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+        "cache-control": "no-cache",
+    })
+    return headers
+
+def test_analyze_routes_across_pool_and_ejects_failing_node(client, pooled_headers, base_payload):
+    urls = []
+
+    async def endpoint(request_data, url, *args):
+        urls.append(url)
+
+        async def gen():
+            if url == NODES[0]:
+                yield "\n[SERVER_ERROR] An unexpected error occurred: down"
+            else:
+                yield "ok"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    pool = LocalBackendPool({"test": NODES}, eject_after=1)
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.api.app.state.services.local_backends", pool):
+        responses = [client.post("/analyze", headers=pooled_headers, json=base_payload) for _ in range(4)]
+
+    # The header URL is ignored once a pool is configured
+    assert "http://test.com" not in urls
+    assert urls[:2] == NODES or urls[:2] == NODES[::-1]
+    assert urls[2:] == [NODES[1], NODES[1]]
+    assert [r.text for r in responses].count("ok") == 3
+    assert all(b["outstanding"] == 0 for b in pool.snapshot()["test"])
+    assert pool.snapshot()["test"][0]["healthy"] is False
+
+def test_analyze_without_healthy_backend_returns_503(client, pooled_headers, base_payload):
+    endpoint = mock.AsyncMock()
+    pool = LocalBackendPool({"test": NODES[:1]}, eject_after=1)
+    pool.acquire("test").release(failed=True)
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.api.app.state.services.local_backends", pool):
+        response = client.post("/analyze", headers=pooled_headers, json=base_payload)
+
+    assert response.status_code == 503
+    endpoint.assert_not_called()
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.constants import MAP_REDUCE_EXCERPT_CONTEXT, MAP_REDUCE_MERGE_INSTRUCTIONS
+
+def make_code(*bodies):
+    return "".join(f"def f{i}():\n    return {body!r}\n\n\n" for i, body in enumerate(bodies))
+
+@pytest.fixture
+def local_headers(base_headers):
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+    })
+    return headers
+
+@pytest.fixture
+def recording_endpoint():
+    calls = []
+
+    async def endpoint(request_data, *args):
+        calls.append(request_data.code)
+        isMerge = request_data.code.startswith(MAP_REDUCE_MERGE_INSTRUCTIONS)
+
+        async def gen():
+            if isMerge:
+                yield "merged audit of "
+                yield str(request_data.code.count("### Lines"))
+            else:
+                yield f"audit({len(request_data.code)})"
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.api.app.state.settings.MAP_REDUCE_THRESHOLD", 60), \
+         mock.patch("backend.api.app.state.settings.MAP_REDUCE_CHUNK_CHARS", 60):
+        yield calls
+
+def test_large_input_is_split_and_merged(client, local_headers, recording_endpoint):
+    code = make_code("aaaaaaaaaa", "bbbbbbbbbb", "cccccccccc")
+
+    with mock.patch("backend.api.queue_alignment") as mock_queue:
+        response = client.post(
+            "/analyze",
+            headers={**local_headers, "x-snippet-signature": "sig"},
+            json={"code": code},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["x-analysis-mode"] == "map-reduce"
+    assert response.text == "merged audit of 3"
+    assert len(recording_endpoint) == 4
+    mock_queue.assert_called_once_with("sig", "merged audit of 3")
+
+def test_excerpt_instruction_travels_in_the_code_field(client, local_headers, recording_endpoint):
+    client.post("/analyze", headers=local_headers, json={"code": make_code("aaaaaaaaaa", "bbbbbbbbbb", "cccccccccc")})
+
+    excerpts = [c for c in recording_endpoint if not c.startswith(MAP_REDUCE_MERGE_INSTRUCTIONS)]
+    assert len(excerpts) == 3
+    assert all(c.startswith(MAP_REDUCE_EXCERPT_CONTEXT) for c in excerpts)
+
+def test_edit_only_reruns_changed_excerpt(client, local_headers, recording_endpoint):
+    client.post("/analyze", headers=local_headers, json={"code": make_code("aaaaaaaaaa", "bbbbbbbbbb", "cccccccccc")})
+    recording_endpoint.clear()
+
+    edited = make_code("aaaaaaaaaa", "BBBBBBBBBBBB", "cccccccccc")
+    response = client.post("/analyze", headers=local_headers, json={"code": edited})
+
+    assert response.text == "merged audit of 3"
+    excerpts = [c for c in recording_endpoint if not c.startswith(MAP_REDUCE_MERGE_INSTRUCTIONS)]
+    assert len(excerpts) == 1 and "BBBB" in excerpts[0]
+    assert len(recording_endpoint) == 2
+
+def test_failed_excerpt_reports_error(client, local_headers):
+    async def endpoint(request_data, *args):
+        async def gen():
+            yield "\n[SERVER_ERROR] An unexpected error occurred: boom"
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.api.app.state.settings.MAP_REDUCE_THRESHOLD", 60), \
+         mock.patch("backend.api.app.state.settings.MAP_REDUCE_CHUNK_CHARS", 60), \
+         mock.patch("backend.api.queue_alignment") as mock_queue:
+        response = client.post(
+            "/analyze",
+            headers={**local_headers, "x-snippet-signature": "sig"},
+            json={"code": make_code("aaaaaaaaaa", "bbbbbbbbbb")},
+        )
+
+    assert response.text.startswith("\n[API_ERROR]")
+    mock_queue.assert_not_called()
+
+def test_too_many_chunks_is_rejected(client, local_headers, recording_endpoint):
+    with mock.patch("backend.api.app.state.settings.MAP_REDUCE_MAX_CHUNKS", 2):
+        response = client.post("/analyze", headers=local_headers, json={"code": make_code("a" * 10, "b" * 10, "c" * 10)})
+    assert response.status_code == 413
+
+def test_cloud_providers_are_not_split_by_default(client, base_headers, recording_endpoint):
+    headers = {**base_headers, "x-default-cloud-provider": "test"}
+    response = client.post("/analyze", headers=headers, json={"code": make_code("a" * 10, "b" * 10, "c" * 10)})
+
+    assert response.status_code == 200
+    assert "x-analysis-mode" not in response.headers
+    assert len(recording_endpoint) == 1
+
+def test_provider_threshold_overrides_default(client, base_headers, local_headers, recording_endpoint):
+    code = make_code("a" * 10, "b" * 10, "c" * 10)
+    with mock.patch.dict("backend.api.app.state.settings.MAP_REDUCE_PROVIDER_THRESHOLDS", {"test": 0}):
+        response = client.post("/analyze", headers=local_headers, json={"code": code})
+    assert "x-analysis-mode" not in response.headers
+
+    with mock.patch.dict("backend.api.app.state.settings.MAP_REDUCE_PROVIDER_THRESHOLDS", {"test": 60}):
+        response = client.post("/analyze", headers={**base_headers, "x-default-cloud-provider": "test"}, json={"code": code})
+    assert response.headers["x-analysis-mode"] == "map-reduce"
+
+def test_group_sections_packs_consecutive_audits():
+    from backend.api import group_sections
+    sections = [(1, 10, "x" * 40), (11, 20, "y" * 40), (21, 30, "z" * 10)]
+    groups = group_sections(sections, 60)
+    assert [[s[0] for s in g] for g in groups] == [[1], [11, 21]]
@@ -0,0 +1,187 @@
+import asyncio
+import pytest
+from unittest import mock
+from backend import database, metrics
+from fastapi.responses import StreamingResponse
+from backend.api import ProviderRoute, app, dispatch, limiter, metric_labels, upstream_label
+from backend.metrics import Counter, Gauge, Histogram, Registry, observe_stream
+
+services = app.state.services
+
+class MockChunk:
+    def __init__(self, text):
+        self.text = text
+
+class MockStream:
+    async def __aiter__(self):
+        yield MockChunk("hello ")
+        yield MockChunk("world ")
+
+@pytest.fixture
+def mock_gemini_client():
+    with mock.patch("google.genai.Client") as mock_client:
+        instance = mock_client.return_value
+        instance.aio.models.generate_content_stream = mock.AsyncMock(side_effect=lambda **kwargs: MockStream())
+        yield mock_client
+
+@pytest.fixture
+def mock_decrypt():
+    with mock.patch("backend.api.utils.decrypt_envelope") as decrypt:
+        decrypt.return_value = "FAKE_API_KEY"
+        yield decrypt
+
+async def chunks(*items, error: Exception | None = None):
+    for item in items:
+        yield item
+    if error is not None:
+        raise error
+
+async def drain(body):
+    return [chunk async for chunk in body]
+
+GEMINI = {"provider": "gemini", "model": "gemini-2.5-flash"}
+
+# --- Metrics Unit Tests ---
+
+def test_counter_and_gauge_render_with_labels():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ("path",)))
+    open_streams = registry.register(Gauge("open_streams", "Open streams."))
+
+    requests.inc(path="/analyze")
+    requests.inc(2, path='/a"b')
+    open_streams.inc()
+    open_streams.inc()
+    open_streams.dec()
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP requests_total Requests.", "# TYPE requests_total counter"]
+    assert 'requests_total{path="/analyze"} 1' in lines
+    assert 'requests_total{path="/a\\"b"} 2' in lines
+    assert "# TYPE open_streams gauge" in lines
+    assert "open_streams 1" in lines
+
+def test_labels_must_match():
+    requests = Counter("requests_total", "Requests.", ("path",))
+    with pytest.raises(ValueError):
+        requests.inc(route="/analyze")
+
+def test_histogram_buckets_are_cumulative():
+    latency = Histogram("latency_seconds", "Latency.", (0.1, 1), ("op",))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, op="read")
+
+    lines = latency.render()
+    assert 'latency_seconds_bucket{op="read",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{op="read",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{op="read",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{op="read"} 3.65' in lines
+    assert 'latency_seconds_count{op="read"} 4' in lines
+
+def test_observe_stream_records_timing_and_throughput():
+    async def run_test():
+        body = observe_stream("gemini", "gemini-2.5-flash", chunks("hello ", b"world"), 0.0)
+        assert await drain(body) == ["hello ", b"world"]
+
+    asyncio.run(run_test())
+    assert metrics.ttft_seconds.count(**GEMINI) == 1
+    assert metrics.stream_duration_seconds.count(**GEMINI) == 1
+    assert metrics.stream_characters_per_second.count(**GEMINI) == 1
+    assert metrics.stream_chunks.value(**GEMINI) == 2
+    assert metrics.stream_characters.value(**GEMINI) == 11
+    assert metrics.streams_in_flight.value(**GEMINI) == 0
+
+def test_observe_stream_counts_errors_by_type():
+    async def run_test():
+        await drain(observe_stream("gemini", "gemini-2.5-flash", chunks("\n[API_ERROR] quota"), 0.0))
+        with pytest.raises(ConnectionError):
+            await drain(observe_stream("gemini", "gemini-2.5-flash", chunks("partial", error=ConnectionError()), 0.0))
+
+    asyncio.run(run_test())
+    assert metrics.upstream_errors.value(type="api_error", **GEMINI) == 1
+    assert metrics.upstream_errors.value(type="ConnectionError", **GEMINI) == 1
+    # The error-only stream completed without a first chunk; the other had one but never completed
+    assert metrics.ttft_seconds.count(**GEMINI) == 1
+    assert metrics.stream_duration_seconds.count(**GEMINI) == 1
+    assert metrics.streams_in_flight.value(**GEMINI) == 0
+
+def test_observe_stream_tracks_open_streams():
+    async def run_test():
+        body = observe_stream("gemini", "gemini-2.5-flash", chunks("a", "b"), 0.0)
+        await body.__anext__()
+        assert metrics.streams_in_flight.value(**GEMINI) == 1
+        await body.aclose()
+        assert metrics.streams_in_flight.value(**GEMINI) == 0
+
+    asyncio.run(run_test())
+    # A stream the client abandoned is neither an error nor a completed stream
+    assert metrics.stream_duration_seconds.count(**GEMINI) == 0
+    assert metrics.upstream_errors.value(type="GeneratorExit", **GEMINI) == 0
+
+def test_database_operations_are_timed(temp_db):
+    database.save_alignment("sig", "text")
+    database.get_all_alignments()
+    database.query_alignments(prefix="s")
+
+    assert metrics.db_seconds.count(operation="write") == 1
+    assert metrics.db_seconds.count(operation="read") == 2
+
+def test_labels_from_request_headers_are_bounded():
+    assert metric_labels(services, "gemini", "gemini-2.5-flash") == GEMINI
+    assert metric_labels(services, "ollama", "qwen2.5-coder:3b") == {"provider": "ollama", "model": "qwen2.5-coder:3b"}
+    assert metric_labels(services, "ollama", "made-up:1b") == {"provider": "ollama", "model": "other"}
+    assert metric_labels(services, "nonsense", "x") == {"provider": "other", "model": "other"}
+
+def test_dispatch_reports_unknown_models_as_other():
+    async def handler(*args):
+        return StreamingResponse(chunks("hi"))
+
+    async def run_test():
+        response = await dispatch(services, "ollama", "made-up:1b")
+        await drain(response.body_iterator)
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_ollama": handler}):
+        asyncio.run(run_test())
+    assert metrics.stream_chunks.value(provider="ollama", model="other") == 1
+    assert metrics.stream_chunks.value(provider="ollama", model="made-up:1b") == 0
+
+def test_upstream_label_folds_unconfigured_hosts():
+    local = ProviderRoute(use_local_provider=True, default_local_provider="ollama", local_url="http://attacker:1")
+    with mock.patch.object(services.settings, "OLLAMA_HOST", "http://ollama:11434"):
+        assert upstream_label(services, local) == "ollama@other"
+        assert upstream_label(services, local.model_copy(update={"local_url": "http://OLLAMA:11434"})) == "ollama@http://ollama:11434"
+    assert upstream_label(services, ProviderRoute(use_local_provider=False, default_cloud_provider="gemini")) == "gemini"
+    assert upstream_label(services, ProviderRoute(use_local_provider=False, default_cloud_provider="nonsense")) == "other"
+
+# --- API Integration Tests ---
+
+def test_metrics_endpoint_reports_analysis(client, base_headers, base_payload, mock_gemini_client, mock_decrypt):
+    response = client.post("/analyze", json=base_payload, headers=base_headers)
+    assert "".join(response.iter_text()) == "hello world "
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'showcode_stream_ttft_seconds_count{provider="gemini",model="gemini-2.5-flash"} 1' in body
+    assert 'showcode_stream_duration_seconds_count{provider="gemini",model="gemini-2.5-flash"} 1' in body
+    assert 'showcode_stream_characters_total{provider="gemini",model="gemini-2.5-flash"} 12' in body
+    assert 'showcode_streams_in_flight{provider="gemini",model="gemini-2.5-flash"} 0' in body
+
+def test_metrics_count_handler_failures(client, base_headers, base_payload):
+    with mock.patch("google.genai.Client", side_effect=Exception("boom")), \
+         mock.patch("backend.api.utils.decrypt_envelope", return_value="FAKE_API_KEY"):
+        response = client.post("/analyze", json=base_payload, headers=base_headers)
+
+    assert response.status_code == 503
+    assert metrics.upstream_errors.value(type="http_503", **GEMINI) == 1
+
+def test_metrics_count_rate_limited_requests(client, base_headers, base_payload, mock_gemini_client, mock_decrypt):
+    with mock.patch.object(limiter, "enabled", True):
+        statuses = [
+            client.post("/analyze", json=base_payload, headers=base_headers).status_code
+            for _ in range(6)
+        ]
+
+    assert statuses[-1] == 429
+    assert metrics.rate_limited_requests.value(path="/analyze") == statuses.count(429)
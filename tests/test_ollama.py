@@ -38,7 +38,7 @@ class FakeOllamaClient:
     async def __aenter__(self):
         return self
 
-    async def generate(self, prompt, model, system, stream):
+    async def generate(self, prompt, model, system, stream, keep_alive=None):
         return FakeStreamResponse()
 
     async def list(self):
@@ -54,7 +54,7 @@ def test_analyze_code_ollama_streaming_success(client, base_headers, base_payloa
         "x-default-local-provider": "ollama",
     })
 
-    with patch("backend.api.ollama.AsyncClient", FakeOllamaClient):
+    with patch("ollama.AsyncClient", FakeOllamaClient):
         response = client.post(
             "/analyze",
             headers=headers,
@@ -74,7 +74,7 @@ def test_analyze_code_ollama_client_init_failure(client, base_headers, base_payl
     })
 
     with patch(
-        "backend.api.ollama.AsyncClient",
+        "ollama.AsyncClient",
         side_effect=RuntimeError("Connection failed"),
     ):
         response = client.post(
@@ -95,7 +95,7 @@ def test_analyze_code_ollama_unavailable_model(client, base_headers, base_payloa
         "x-default-local-provider": "ollama",
     })
 
-    with patch("backend.api.ollama.AsyncClient", FakeOllamaClient):
+    with patch("ollama.AsyncClient", FakeOllamaClient):
         response = client.post(
             "/analyze",
             headers=headers,
@@ -107,7 +107,7 @@ def test_analyze_code_ollama_unavailable_model(client, base_headers, base_payloa
 
 def test_analyze_code_ollama_incomplete_header(client, base_payload):
     # Only sending payload, no headers
-    with patch("backend.api.ollama.AsyncClient", FakeOllamaClient):
+    with patch("ollama.AsyncClient", FakeOllamaClient):
         response = client.post(
             "/analyze",
             json=base_payload,
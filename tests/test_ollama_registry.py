@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+from unittest import mock
+from ollama import ResponseError
+from backend.generators import ollama_stream
+from backend.ollama_registry import OllamaRegistry
+
+class CountingOllamaClient:
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.host = kwargs.get("host")
+        self.list_calls = 0
+        self.models = ["test-model"]
+        CountingOllamaClient.instances.append(self)
+
+    async def list(self):
+        self.list_calls += 1
+        return {"models": [{"model": m} for m in self.models]}
+
+@pytest.fixture
+def counting_client():
+    CountingOllamaClient.instances = []
+    with mock.patch("ollama.AsyncClient", CountingOllamaClient):
+        yield CountingOllamaClient
+
+def test_registry_reuses_client_and_model_list(counting_client):
+    async def run_test():
+        registry = OllamaRegistry(models_ttl=60)
+        a = await registry.get_client("http://ollama")
+        b = await registry.get_client("http://ollama")
+        assert a is b
+
+        assert await registry.has_model("http://ollama", "test-model")
+        assert await registry.has_model("http://ollama", "test-model")
+        assert a.list_calls == 1
+
+        other = await registry.get_client("http://other")
+        assert other is not a
+
+    asyncio.run(run_test())
+
+def test_registry_refreshes_stale_list_in_background(counting_client):
+    async def run_test():
+        registry = OllamaRegistry(models_ttl=10)
+        with mock.patch("backend.ollama_registry.time.monotonic", return_value=0):
+            client = await registry.get_client("http://ollama")
+
+        client.models = ["test-model", "new-model"]
+        with mock.patch("backend.ollama_registry.time.monotonic", return_value=20):
+            # Stale data is served immediately, the refresh runs behind it
+            assert await registry.has_model("http://ollama", "test-model")
+            assert client.list_calls == 1
+            await asyncio.sleep(0)
+            assert client.list_calls == 2
+            assert await registry.has_model("http://ollama", "new-model")
+
+    asyncio.run(run_test())
+
+def test_registry_invalidates_on_missing_model(counting_client):
+    async def run_test():
+        registry = OllamaRegistry(models_ttl=60)
+        client = await registry.get_client("http://ollama")
+
+        assert not await registry.has_model("http://ollama", "fresh-pull")
+        client.models = ["test-model", "fresh-pull"]
+        assert await registry.has_model("http://ollama", "fresh-pull")
+        assert client.list_calls == 2
+
+    asyncio.run(run_test())
+
+def test_registry_does_not_cache_failed_clients():
+    async def run_test():
+        registry = OllamaRegistry()
+        with mock.patch("ollama.AsyncClient", side_effect=RuntimeError("down")):
+            assert await registry.get_client("http://ollama") is None
+        with mock.patch("ollama.AsyncClient", CountingOllamaClient):
+            assert await registry.get_client("http://ollama") is not None
+
+    asyncio.run(run_test())
+
+def test_registry_keeps_most_recent_hosts(counting_client):
+    async def run_test():
+        registry = OllamaRegistry(max_hosts=2)
+        first = await registry.get_client("http://a")
+        await registry.get_client("http://b")
+        assert await registry.get_client("http://a") is first
+        await registry.get_client("http://c")
+
+        assert len(registry) == 2
+        assert await registry.get_client("http://a") is first
+        assert len(counting_client.instances) == 3
+
+        # http://b was least recently used, so it needs a new client
+        await registry.get_client("http://b")
+        assert len(counting_client.instances) == 4
+
+    asyncio.run(run_test())
+
+def test_ollama_stream_reports_missing_model():
+    async def run_test():
+        mock_client = mock.Mock()
+        mock_client.generate.side_effect = ResponseError("model 'gone' not found", 404)
+        missing = []
+
+        chunks = [c async for c in ollama_stream(mock_client, "prompt", "gone", True, on_model_missing=missing.append)]
+
+        assert missing == ["gone"]
+        assert "[SERVER_ERROR]" in chunks[0]
+
+    asyncio.run(run_test())
+
+def test_analyze_ollama_lists_models_once(client, base_headers, base_payload, counting_client):
+    class FakeStream:
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            raise StopAsyncIteration
+
+    async def generate(self, **kwargs):
+        return FakeStream()
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-use-snippet-model": "true",
+        "x-default-local-provider": "ollama",
+    })
+
+    with mock.patch.object(CountingOllamaClient, "generate", generate, create=True):
+        for code in ["a = 1", "b = 2"]:
+            response = client.post("/analyze", headers=headers, json={"code": code})
+            assert response.status_code == 200
+
+    assert len(counting_client.instances) == 1
+    assert counting_client.instances[0].list_calls == 1
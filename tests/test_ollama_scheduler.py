@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+from unittest import mock
+from backend.ollama_scheduler import KeepAlivePolicy, ModelScheduler, warm_up
+
+HOST = "http://ollama"
+
+# --- ModelScheduler Unit Tests ---
+
+def test_hot_model_runs_concurrently_and_blocks_switch():
+    async def run_test():
+        scheduler = ModelScheduler(max_wait=5)
+        order = []
+        release = asyncio.Event()
+
+        async def run(model, tag):
+            async with scheduler.slot(HOST, model):
+                order.append(f"start {tag}")
+                await release.wait()
+                order.append(f"end {tag}")
+
+        a1 = asyncio.create_task(run("big", "a1"))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(run("small", "b"))
+        await asyncio.sleep(0)
+        a2 = asyncio.create_task(run("big", "a2"))
+        await asyncio.sleep(0.01)
+
+        # The second request for the loaded model overtakes the switch
+        assert order == ["start a1", "start a2"]
+        assert scheduler.queued(HOST, "small") == 1
+
+        release.set()
+        await asyncio.gather(a1, a2, b)
+        assert order[-2:] == ["start b", "end b"]
+        assert scheduler.hot_model(HOST) == "small"
+
+    asyncio.run(run_test())
+
+def test_waiting_model_takes_priority_after_max_wait():
+    async def run_test():
+        scheduler = ModelScheduler(max_wait=0.02)
+        order = []
+        release_first = asyncio.Event()
+
+        async def run(model, tag, gate=None):
+            async with scheduler.slot(HOST, model):
+                order.append(tag)
+                if gate is not None:
+                    await gate.wait()
+
+        first = asyncio.create_task(run("big", "big-1", release_first))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(run("small", "small"))
+        await asyncio.sleep(0.05)
+
+        # Past max_wait the switch has priority over new requests for the hot model
+        late = asyncio.create_task(run("big", "big-2"))
+        await asyncio.sleep(0.01)
+        assert order == ["big-1"]
+
+        release_first.set()
+        await asyncio.gather(first, small, late)
+        assert order == ["big-1", "small", "big-2"]
+
+    asyncio.run(run_test())
+
+def test_cancelled_waiter_releases_priority():
+    async def run_test():
+        scheduler = ModelScheduler(max_wait=0.01)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(HOST, "big"):
+                await release.wait()
+
+        async def use(model):
+            async with scheduler.slot(HOST, model):
+                return model
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(use("small"))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.sleep(0)
+
+        # Without the reset this would wait forever behind a dead priority
+        assert await asyncio.wait_for(use("big"), 1) == "big"
+        release.set()
+        await holder
+
+    asyncio.run(run_test())
+
+def test_disabled_scheduler_never_blocks():
+    async def run_test():
+        scheduler = ModelScheduler(enabled=False)
+        async with scheduler.slot(HOST, "big"):
+            async with scheduler.slot(HOST, "small"):
+                return True
+
+    assert asyncio.run(run_test())
+
+# --- Keep-alive and warm-up ---
+
+def test_keep_alive_policy():
+    policy = KeepAlivePolicy("30m", {"big": "-1"})
+    assert policy.for_model("big") == "-1"
+    assert policy.for_model("small") == "30m"
+    assert KeepAlivePolicy("").for_model("small") is None
+
+def test_warm_up_loads_available_models_in_order():
+    client = mock.Mock()
+    client.generate = mock.AsyncMock()
+    registry = mock.Mock()
+    registry.get_client = mock.AsyncMock(return_value=client)
+    registry.has_model = mock.AsyncMock(side_effect=lambda host, model: model != "missing")
+
+    policy = KeepAlivePolicy("30m", {"big": "-1"})
+    loaded = asyncio.run(warm_up(registry, HOST, ["small", "missing", "big"], policy))
+
+    assert loaded == ["small", "big"]
+    assert client.generate.await_args_list == [
+        mock.call(model="small", prompt="", keep_alive="30m"),
+        mock.call(model="big", prompt="", keep_alive="-1"),
+    ]
+
+def test_warm_up_skips_unreachable_host():
+    registry = mock.Mock()
+    registry.get_client = mock.AsyncMock(return_value=None)
+    assert asyncio.run(warm_up(registry, HOST, ["big"], KeepAlivePolicy("30m"))) == []
+
+# --- API Integration Tests ---
+
+def test_ollama_handler_passes_model_keep_alive(client, base_headers, base_payload):
+    calls = []
+
+    class FakeOllamaClient:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def list(self):
+            return {"models": [{"model": "test-model"}]}
+
+        async def generate(self, **kwargs):
+            calls.append(kwargs)
+
+            async def stream():
+                yield {"response": "ok", "done": True}
+
+            return stream()
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-use-snippet-model": "true",
+        "x-local-snippet-model": "test-model",
+        "x-default-local-provider": "ollama",
+    })
+
+    with mock.patch("ollama.AsyncClient", FakeOllamaClient), \
+         mock.patch.dict("backend.api.app.state.services.ollama_keep_alive.overrides", {"test-model": "-1"}):
+        response = client.post("/analyze", headers=headers, json=base_payload)
+
+    assert response.text == "ok"
+    assert calls[0]["keep_alive"] == "-1"
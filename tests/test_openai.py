@@ -11,7 +11,7 @@ class MockChunk:
         self.choices = [MockChoice(content)]
 
 class MockStream:
-    def __iter__(self):
+    async def __aiter__(self):
         yield MockChunk("hello ")
         yield MockChunk("openai ")
 
@@ -23,10 +23,10 @@ def mock_decrypt():
 
 @pytest.fixture
 def mock_openai_client():
-    with mock.patch("backend.api.OpenAI") as mock_client:
+    with mock.patch("openai.AsyncOpenAI") as mock_client:
         instance = mock_client.return_value
         # Mock streaming response
-        instance.chat.completions.create.return_value = MockStream()
+        instance.chat.completions.create = mock.AsyncMock(return_value=MockStream())
         yield mock_client
 
 def test_analyze_codesnippet_chatgpt_success(client, base_headers, base_payload, mock_openai_client, mock_decrypt):
@@ -71,7 +71,7 @@ def test_analyze_codesnippet_openai_init_failure(client, base_headers, base_payl
          "x-default-cloud-provider": "openai",
     })
     
-    with mock.patch("backend.api.OpenAI", side_effect=Exception("boom")):
+    with mock.patch("openai.AsyncOpenAI", side_effect=Exception("boom")):
         response = client.post(
             "/analyze",
             json=base_payload,
@@ -87,7 +87,7 @@ def test_analyze_codesnippet_grok_init_failure(client, base_headers, base_payloa
          "x-default-cloud-provider": "grok",
     })
 
-    with mock.patch("backend.api.OpenAI", side_effect=Exception("boom")):
+    with mock.patch("openai.AsyncOpenAI", side_effect=Exception("boom")):
         response = client.post(
             "/analyze",
             json=base_payload,
@@ -1,17 +1,12 @@
 import pytest
+import asyncio
+import sqlite3
+import threading
 from unittest import mock
 from backend import database
 
 # --- Database Unit Tests ---
 
-@pytest.fixture
-def temp_db(tmp_path):
-    db_path = tmp_path / "test_alignments.db"
-    # Patch the DB_NAME in the database module
-    with mock.patch("backend.database.DB_NAME", str(db_path)):
-        database.init_db()
-        yield str(db_path)
-
 def test_database_operations(temp_db):
     # Test Save
     database.save_alignment("sig1", "content1")
@@ -33,11 +28,96 @@ def test_database_operations(temp_db):
     assert len(alignments) == 2
     assert alignments["sig2"] == "content2"
 
+def test_database_uses_wal(temp_db):
+    conn = database.connections.reader()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # 1 == NORMAL
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+def test_database_reuses_connections(temp_db):
+    database.get_all_alignments()
+    with mock.patch("backend.database.sqlite3.connect", wraps=sqlite3.connect) as connect:
+        for i in range(5):
+            database.save_alignment(f"sig{i}", "content")
+            database.get_all_alignments()
+    connect.assert_not_called()
+
+def test_reader_not_blocked_by_open_write(temp_db):
+    database.save_alignment("sig1", "committed")
+    result = {}
+
+    with database.connections.writer() as conn:
+        conn.execute(
+            "UPDATE alignments SET alignment_text = ?, alignment_blob = NULL WHERE signature = ?",
+            ("uncommitted", "sig1"),
+        )
+        # A reader on another thread sees the last committed snapshot
+        reader = threading.Thread(target=lambda: result.update(database.get_all_alignments()))
+        reader.start()
+        reader.join(timeout=5)
+
+    assert result == {"sig1": "committed"}
+    assert database.get_all_alignments() == {"sig1": "uncommitted"}
+
+def test_writer_batches_pending_saves(temp_db):
+    writer = database.AlignmentWriter(linger=0.2)
+    with mock.patch("backend.database.save_alignments", wraps=database.save_alignments) as save_batch:
+        for i in range(10):
+            writer.enqueue(f"sig{i}", f"content{i}")
+        writer.enqueue("sig0", "content0_updated")
+        writer.flush()
+    writer.close()
+
+    alignments = database.get_all_alignments()
+    assert len(alignments) == 10
+    assert alignments["sig0"] == "content0_updated"
+    # The first item may be picked up alone before the rest arrive
+    assert save_batch.call_count <= 2
+
+def test_writer_close_flushes_pending_saves(temp_db):
+    writer = database.AlignmentWriter()
+    writer.enqueue("sig1", "content1")
+    writer.close()
+    assert database.get_all_alignments() == {"sig1": "content1"}
+
+def test_queue_alignment_does_not_block_on_disk(temp_db):
+    release = threading.Event()
+    original = database.save_alignments
+
+    def slow_save(*args, **kwargs):
+        release.wait(timeout=5)
+        original(*args, **kwargs)
+
+    with mock.patch("backend.database.save_alignments", side_effect=slow_save):
+        database.queue_alignment("sig1", "content1")
+        # Returned while the write is still held up
+        assert database.get_all_alignments() == {}
+        release.set()
+        database.alignment_writer.flush()
+
+    assert database.get_all_alignments() == {"sig1": "content1"}
+
+def test_run_read_uses_worker_thread(temp_db):
+    database.save_alignment("sig1", "content1")
+
+    async def run_test():
+        thread_names = []
+
+        def read():
+            thread_names.append(threading.current_thread().name)
+            return database.get_all_alignments()
+
+        assert await database.run_read(read) == {"sig1": "content1"}
+        return thread_names
+
+    assert asyncio.run(run_test())[0].startswith("db-read")
+
 # --- API Integration Tests ---
 
 @pytest.fixture
-def mock_db_funcs():
-    with mock.patch("backend.api.save_alignment") as mock_save, \
+def mock_db_funcs(temp_db):
+    # The endpoint still reads the alignments version, so point it at a temporary database
+    with mock.patch("backend.api.queue_alignment") as mock_save, \
          mock.patch("backend.api.get_all_alignments") as mock_get:
         yield mock_save, mock_get
 
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend import database
+from backend.api import ProviderRoute, get_settings
+from backend.constants import SYSTEM_PROMPT
+from backend.content import trim_lines
+from backend.precompute import SourceResolver, _main, build_route, collect_snippets, parse_mapping, precompute
+from backend.services import Services
+
+PREFIX = "https://raw.githubusercontent.com/me/repo/main/"
+
+@pytest.fixture
+def services():
+    return Services(get_settings())
+
+@pytest.fixture
+def checkout(tmp_path):
+    (tmp_path / "a.py").write_text("l1\r\nl2\nl3\nl4\n")
+    (tmp_path / "b.py").write_text("print('b')\n")
+    return tmp_path
+
+def make_content(*snippets):
+    return {"collection": [{"project": "demo", "data": [{"snippets": list(snippets)}]}]}
+
+ROUTE = ProviderRoute(
+    use_local_provider=True,
+    use_snippet_model=False,
+    default_local_provider="test",
+    local_url="http://local",
+    local_snippet_model="m",
+    local_alignment_model="m",
+)
+
+# --- Unit Tests ---
+
+def test_trim_lines_matches_frontend():
+    assert trim_lines("l1\r\nl2\nl3\nl4", 2, 3) == "l2\nl3"
+    assert trim_lines("l1\r\nl2", None, None) == "l1\r\nl2"
+
+def test_parse_mapping_splits_on_last_equals():
+    assert parse_mapping("https://x/?a=b=/srv/repo") == ("https://x/?a=b", "/srv/repo")
+
+def test_resolver_reads_mapped_files_and_refuses_escapes(checkout):
+    resolver = SourceResolver([(PREFIX, str(checkout))], offline=True)
+    assert asyncio.run(resolver.fetch(PREFIX + "b.py")) == "print('b')\n"
+
+    with pytest.raises(ValueError):
+        resolver.local_path(PREFIX + "../outside.py")
+    with pytest.raises(LookupError):
+        asyncio.run(resolver.fetch("https://example.com/unmapped.py"))
+
+def test_collect_snippets_dedupes_signatures():
+    snippet = {"repoUrl": PREFIX + "a.py", "lineStart": 1, "lineEnd": 2}
+    data = make_content(snippet, dict(snippet), {"repoUrl": PREFIX + "b.py"})
+    assert len(collect_snippets(data)) == 2
+    assert collect_snippets(data, ["other"]) == []
+
+# --- Integration Tests ---
+
+def test_precompute_saves_resumes_and_reports_failures(temp_db, checkout, services):
+    seen = []
+
+    async def endpoint(request_data, *args):
+        seen.append(request_data.code)
+        if "b" in request_data.code:
+            raise RuntimeError("provider down")
+
+        async def gen():
+            yield "audit of "
+            yield request_data.code
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    snippets = [
+        {"repoUrl": PREFIX + "a.py", "lineStart": 2, "lineEnd": 3},
+        {"repoUrl": PREFIX + "b.py"},
+    ]
+    resolver = SourceResolver([(PREFIX, str(checkout))], offline=True)
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}):
+        stats = asyncio.run(precompute(services, snippets, resolver, ROUTE, (None, None), jobs=2))
+        assert stats["done"] == 1
+        assert list(stats["failed"]) == [f"{PREFIX}b.py||"]
+        assert database.get_all_alignments() == {f"{PREFIX}a.py|2|3": "audit of l2\nl3"}
+
+        seen.clear()
+        stats = asyncio.run(precompute(services, snippets, resolver, ROUTE, (None, None), jobs=2))
+
+    assert stats["skipped"] == 1
+    assert seen == ["print('b')\n"]
+
+def test_precompute_runs_srvllama_through_real_handler(temp_db, checkout, services):
+    payloads = []
+
+    async def fake_llama_streamer(url, payload):
+        payloads.append((url, payload))
+        yield "alignment audit"
+
+    args = argparse.Namespace(provider="srvllama", url="http://llama", model="align-model", snippet_model=None)
+    resolver = SourceResolver([(PREFIX, str(checkout))], offline=True)
+
+    stats = asyncio.run(precompute(services, [{"repoUrl": PREFIX + "b.py"}], resolver, build_route(args), (fake_llama_streamer, None), jobs=1))
+
+    assert stats["done"] == 1 and not stats["failed"]
+    assert database.get_all_alignments() == {f"{PREFIX}b.py||": "alignment audit"}
+    url, payload = payloads[0]
+    assert url == "http://llama"
+    assert payload["model"] == "align-model"
+    assert payload["messages"][0]["content"] == SYSTEM_PROMPT
+
+def test_precompute_counts_failed_writes_as_failures(temp_db, checkout, services):
+    async def endpoint(request_data, *args):
+        async def gen():
+            yield "audit"
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    resolver = SourceResolver([(PREFIX, str(checkout))], offline=True)
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": endpoint}), \
+         mock.patch("backend.database.UPSERT_ALIGNMENT_SQL", "INSERT INTO missing VALUES (?, ?, ?)"):
+        stats = asyncio.run(precompute(services, [{"repoUrl": PREFIX + "b.py"}], resolver, ROUTE, (None, None), jobs=1))
+
+    assert stats["done"] == 0
+    assert "missing" in stats["failed"][f"{PREFIX}b.py||"]
+    assert database.get_all_alignments() == {}
+
+def test_main_creates_tables_without_db_flag(tmp_path):
+    db_path = tmp_path / "fresh.db"
+    args = argparse.Namespace(
+        db=None, content="content.json", project=["none"], map=[], offline=True,
+        provider="srvllama", url="http://llama", model="m", snippet_model=None, jobs=1, force=False,
+    )
+    with mock.patch("backend.database.DB_NAME", str(db_path)):
+        assert asyncio.run(_main(args)) == 0
+        assert database.get_all_alignments() == {}
+        tables = {row[0] for row in database.connections.reader().execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    database.connections.close_all()
+    assert {"alignments", "compression_dicts"} <= tables
@@ -0,0 +1,154 @@
+import asyncio
+import httpx
+import json
+import pytest
+from types import SimpleNamespace
+from unittest import mock
+from backend.api import app
+from backend.dependencies import get_llama_streamer
+from backend.generators import anthtropic_stream, llama_stream
+from backend.prompt_cache import PromptCacheStats, stats
+
+# --- Unit Tests ---
+
+def test_stats_count_hits_and_misses():
+    counters = PromptCacheStats()
+    counters.record("claude", 900, 1000)
+    counters.record("claude", 0, 1000)
+    counters.record("claude", None)
+    assert counters.snapshot() == {
+        "claude": {"hits": 1, "misses": 1, "cached_tokens": 900, "prompt_tokens": 2000}
+    }
+
+# --- Provider Tests ---
+
+class MockHttpxResponse:
+    status_code = 200
+
+    def __init__(self, lines):
+        self._lines = lines
+
+    async def aiter_lines(self):
+        for line in self._lines:
+            yield line
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+def test_llama_timings_are_recorded():
+    lines = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": "ok"}}]}),
+        "data: " + json.dumps({"choices": [{"delta": {}}], "timings": {"cache_n": 1500, "prompt_n": 40}}),
+        "data: [DONE]",
+    ]
+
+    async def run_test():
+        with mock.patch("backend.generators.httpx.AsyncClient") as mock_client:
+            instance = mock_client.return_value
+            instance.__aenter__.return_value = instance
+            instance.stream.return_value = MockHttpxResponse(lines)
+            return [c async for c in llama_stream("http://test", {})]
+
+    assert asyncio.run(run_test()) == ["ok"]
+    assert stats.snapshot()["srvllama"] == {"hits": 1, "misses": 0, "cached_tokens": 1500, "prompt_tokens": 1540}
+
+def test_llama_payload_requests_prompt_cache(client, base_headers, base_payload):
+    payloads = []
+
+    async def fake_streamer(url, payload):
+        payloads.append(payload)
+        yield "ok"
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-use-snippet-model": "true",
+        "x-default-local-provider": "srvllama",
+    })
+
+    app.dependency_overrides[get_llama_streamer] = lambda: fake_streamer
+    try:
+        client.post("/analyze", headers=headers, json=base_payload)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert payloads[0]["cache_prompt"] is True
+
+def test_concurrent_llama_requests_are_not_pinned_to_one_slot(base_headers):
+    payloads = []
+    started = 0
+    allStarted = None
+
+    async def fake_streamer(url, payload):
+        nonlocal started
+        payloads.append(payload)
+        started += 1
+        if started == 4:
+            allStarted.set()
+        # Every request holds its stream open until all four are running at once
+        await asyncio.wait_for(allStarted.wait(), timeout=1)
+        yield "ok"
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-use-snippet-model": "true",
+        "x-default-local-provider": "srvllama",
+    })
+
+    async def run_test():
+        nonlocal allStarted
+        allStarted = asyncio.Event()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*[
+                async_client.post("/analyze", headers=headers, json={"code": f"print({i})"})
+                for i in range(4)
+            ])
+
+    app.dependency_overrides[get_llama_streamer] = lambda: fake_streamer
+    try:
+        responses = asyncio.run(run_test())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [r.text for r in responses] == ["ok"] * 4
+    # Slot choice is left to llama-server, which spreads concurrent requests over --parallel slots
+    assert len(payloads) == 4
+    assert all("id_slot" not in payload for payload in payloads)
+
+def test_anthropic_marks_system_prompt_cacheable():
+    class MockStream:
+        @property
+        async def text_stream(self):
+            yield "hi"
+
+        async def get_final_message(self):
+            usage = SimpleNamespace(input_tokens=20, cache_read_input_tokens=1200, cache_creation_input_tokens=0)
+            return SimpleNamespace(usage=usage)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+    client = mock.Mock()
+    client.messages.stream.return_value = MockStream()
+
+    async def run_test():
+        return [c async for c in anthtropic_stream(client, "SYSTEM", "code", "model")]
+
+    assert asyncio.run(run_test()) == ["hi"]
+    system = client.messages.stream.call_args.kwargs["system"]
+    assert system == [{"type": "text", "text": "SYSTEM", "cache_control": {"type": "ephemeral"}}]
+    assert stats.snapshot()["claude"]["hits"] == 1
+
+def test_cache_stats_endpoint(client):
+    stats.record("ollama", 0, 100)
+    response = client.get("/cache/stats")
+    assert response.status_code == 200
+    assert response.json()["prompt_cache"]["ollama"]["misses"] == 1
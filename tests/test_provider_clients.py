@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from unittest import mock
+from backend.provider_clients import ProviderClientCache, client_fingerprint
+
+class FakeClient:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+def test_fingerprint_separates_provider_key_and_base_url():
+    base = client_fingerprint("openai", "k1")
+    assert base == client_fingerprint("openai", "k1")
+    assert base != client_fingerprint("grok", "k1")
+    assert base != client_fingerprint("openai", "k2")
+    assert base != client_fingerprint("openai", "k1", "https://api.x.ai/v1")
+    assert "k1" not in base
+
+def test_same_credentials_reuse_client():
+    cache = ProviderClientCache()
+    factory = mock.Mock(side_effect=lambda: FakeClient("a"))
+
+    first = cache.acquire("openai", "key", factory)
+    first.release()
+    second = cache.acquire("openai", "key", factory)
+
+    assert first.client is second.client
+    assert factory.call_count == 1
+
+def test_lru_overflow_closes_idle_clients():
+    async def run_test():
+        cache = ProviderClientCache(max_clients=2)
+        a = cache.acquire("openai", "a", lambda: FakeClient("a"))
+        a.release()
+        b = cache.acquire("openai", "b", lambda: FakeClient("b"))
+        b.release()
+        c = cache.acquire("openai", "c", lambda: FakeClient("c"))
+        c.release()
+        await asyncio.sleep(0)
+
+        assert len(cache) == 2
+        assert a.client.closed
+        assert not b.client.closed and not c.client.closed
+
+    asyncio.run(run_test())
+
+def test_clients_in_use_are_not_evicted():
+    async def run_test():
+        cache = ProviderClientCache(max_clients=1)
+        busy = cache.acquire("openai", "a", lambda: FakeClient("a"))
+        other = cache.acquire("openai", "b", lambda: FakeClient("b"))
+        await asyncio.sleep(0)
+
+        assert not busy.client.closed
+        assert len(cache) == 2
+
+        other.release()
+        await asyncio.sleep(0)
+        assert other.client.closed
+        busy.release()
+        assert len(cache) == 1
+
+    asyncio.run(run_test())
+
+def test_idle_clients_expire():
+    async def run_test():
+        cache = ProviderClientCache(idle_ttl=30)
+        with mock.patch("backend.provider_clients.time.monotonic", return_value=0):
+            old = cache.acquire("claude", "a", lambda: FakeClient("a"))
+            old.release()
+        with mock.patch("backend.provider_clients.time.monotonic", return_value=31):
+            cache.acquire("claude", "b", lambda: FakeClient("b")).release()
+        await asyncio.sleep(0)
+
+        assert old.client.closed
+        assert len(cache) == 1
+
+    asyncio.run(run_test())
+
+def test_aclose_closes_every_client():
+    async def run_test():
+        cache = ProviderClientCache()
+        lease = cache.acquire("openai", "a", lambda: FakeClient("a"))
+        await cache.aclose()
+        assert lease.client.closed
+        assert len(cache) == 0
+
+    asyncio.run(run_test())
+
+def test_demo_mode_reuses_one_warm_client(client, base_payload):
+    from backend.api import app
+    settings = app.state.settings
+
+    class MockStream:
+        async def __aiter__(self):
+            yield mock.Mock(text="demo")
+
+    headers = {
+        "x-use-local-provider": "false",
+        "x-default-cloud-provider": "gemini",
+    }
+
+    with mock.patch.object(settings, "DEMO_MODE", True), \
+         mock.patch.object(settings, "SERVER_SIDE_API_KEY", "server_secret"), \
+         mock.patch("google.genai.Client") as mock_genai:
+        mock_genai.return_value.aio.models.generate_content_stream = mock.AsyncMock(
+            side_effect=lambda **kwargs: MockStream()
+        )
+        for code in ["a = 1", "b = 2", "c = 3"]:
+            response = client.post("/analyze", json={"code": code}, headers=headers)
+            assert response.text == "demo"
+
+    mock_genai.assert_called_once_with(api_key="server_secret")
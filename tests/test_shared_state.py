@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import time
+import pytest
+from unittest import mock
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from backend.cache import ResponseCache
+from backend.shared_state import (
+    LIMITS_SCHEME,
+    MemoryStateStore,
+    RedisStateStore,
+    SQLiteStateStore,
+    state_store_from_url,
+)
+from backend.singleflight import SingleFlight
+from mocks import FakeRedis
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStateStore()
+    elif request.param == "sqlite":
+        store = SQLiteStateStore(str(tmp_path / "state.db"))
+    else:
+        store = RedisStateStore(FakeRedis())
+    yield store
+    store.close()
+
+# --- StateStore Unit Tests ---
+
+def test_get_set_add_delete(store):
+    assert store.get("k") is None
+    store.set("k", b"v", ttl=60)
+    assert store.get("k") == b"v"
+
+    assert not store.add("k", b"other", ttl=60)
+    assert store.add("fresh", b"mine", ttl=60)
+    assert store.get("fresh") == b"mine"
+
+    store.delete("k")
+    assert store.get("k") is None
+    assert store.add("k", b"again", ttl=60)
+
+def test_incr_keeps_window_of_first_increment(store):
+    assert store.incr("hits", ttl=60) == 1
+    assert store.incr("hits", ttl=600, amount=2) == 3
+    assert 0 < store.ttl("hits") <= 60
+    assert store.ttl("missing") == 0
+
+def test_expired_keys_disappear(store):
+    store.set("short", b"v", ttl=0.01)
+    store.incr("count", ttl=0.01)
+    assert store.add("claim", b"a", ttl=0.01)
+    time.sleep(0.03)
+    assert store.get("short") is None
+    assert store.incr("count", ttl=60) == 1
+    assert store.add("claim", b"b", ttl=60)
+
+def test_memory_store_purges_keys_that_are_never_read_again():
+    store = MemoryStateStore()
+    with mock.patch("backend.shared_state.time.time", return_value=0):
+        for i in range(300):
+            store.incr(f"limit:client-{i}", ttl=60)
+    assert len(store) == 300
+
+    # Once the old windows are over, writes for other keys drop them
+    with mock.patch("backend.shared_state.time.time", return_value=100):
+        for i in range(300):
+            store.incr(f"limit:other-{i}", ttl=60)
+    assert len(store) < 600
+
+def test_clear_by_prefix(store):
+    store.set("limit:a", b"1", ttl=60)
+    store.set("limit:b", b"1", ttl=60)
+    store.set("response:a", b"1", ttl=60)
+    store.clear("limit:")
+    assert store.get("limit:a") is None
+    assert store.get("response:a") == b"1"
+
+def test_sqlite_stores_share_state_across_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    workers = [SQLiteStateStore(path) for _ in range(4)]
+
+    def hit(store):
+        for _ in range(50):
+            store.incr("limit:ip", ttl=60)
+
+    threads = [threading.Thread(target=hit, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert workers[0].get("limit:ip") == b"200"
+    assert workers[1].add("inflight:k", b"w1", ttl=60)
+    assert not workers[2].add("inflight:k", b"w2", ttl=60)
+    for w in workers:
+        w.close()
+
+def test_state_store_from_url(tmp_path):
+    assert isinstance(state_store_from_url("memory://"), MemoryStateStore)
+    sqlite_store = state_store_from_url(f"sqlite:///{tmp_path}/nested/state.db")
+    assert isinstance(sqlite_store, SQLiteStateStore)
+    # Nothing touches the disk until the store is opened or used
+    assert not (tmp_path / "nested").exists()
+    sqlite_store.open()
+    assert (tmp_path / "nested" / "state.db").exists()
+    sqlite_store.close()
+    with pytest.raises(ValueError):
+        state_store_from_url("etcd://somewhere")
+
+# --- Shared Consumers ---
+
+def make_limited_app(store):
+    limiter = Limiter(key_func=lambda request: "client", storage_uri=f"{LIMITS_SCHEME}://", storage_options={"store": store})
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+    @app.get("/ping")
+    @limiter.limit("3/minute")
+    async def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+def test_rate_limit_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    workers = [TestClient(make_limited_app(SQLiteStateStore(path))) for _ in range(2)]
+
+    statuses = [workers[i % 2].get("/ping").status_code for i in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+def test_response_cache_reads_other_workers_entries(store):
+    async def run_test():
+        first = ResponseCache(max_entries=8, max_bytes=1024, ttl=60, shared=store)
+        second = ResponseCache(max_entries=8, max_bytes=1024, ttl=60, shared=store)
+
+        first.put("key", ["héllo ", "world"])
+        assert second.get("key") is None
+        entry = await second.fetch("key")
+        assert entry is not None
+        assert list(entry.chunks()) == ["héllo ".encode(), b"world"]
+        assert len(second) == 1
+
+    asyncio.run(run_test())
+
+def test_shared_store_io_runs_off_the_event_loop(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    threads = []
+    get = store.get
+
+    def recording_get(key):
+        threads.append(threading.current_thread())
+        return get(key)
+
+    async def run_test():
+        cache = ResponseCache(max_entries=8, max_bytes=1024, ttl=60, shared=store)
+        flights = SingleFlight(claims=store)
+        with mock.patch.object(store, "get", side_effect=recording_get):
+            cache.put("key", ["a"])
+            cache.clear()
+            assert await cache.fetch("key") is not None
+            async with flights.opening("k"):
+                pass
+            assert await flights.join("k") is None
+
+    try:
+        asyncio.run(run_test())
+    finally:
+        store.close()
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+def test_flight_claim_makes_other_worker_wait():
+    async def run_test():
+        store = MemoryStateStore()
+        workers = [SingleFlight(claims=store, claim_wait=5) for _ in range(2)]
+        workers[1].owner = b"other-worker"
+        gate = asyncio.Event()
+
+        async def source():
+            await gate.wait()
+            yield "done"
+
+        async with workers[0].opening("k"):
+            flight = workers[0].start("k", source())
+
+        waiter = asyncio.create_task(workers[1].join("k"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        gate.set()
+        with mock.patch("backend.singleflight.CLAIM_POLL_INTERVAL", 0.01):
+            assert await waiter is None
+        assert flight.completed
+        assert store.get("inflight:k") is None
+
+    asyncio.run(run_test())
+
+def test_failed_opening_releases_claim():
+    async def run_test():
+        store = MemoryStateStore()
+        flights = SingleFlight(claims=store)
+        with pytest.raises(RuntimeError):
+            async with flights.opening("k"):
+                assert store.get("inflight:k") is not None
+                raise RuntimeError("no stream")
+        assert store.get("inflight:k") is None
+
+    asyncio.run(run_test())
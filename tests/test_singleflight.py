@@ -0,0 +1,196 @@
+import asyncio
+import httpx
+import pytest
+from unittest import mock
+from fastapi.responses import StreamingResponse
+from backend.api import app
+from backend.singleflight import SingleFlight
+from backend.streaming import PersistenceSink
+
+inflight = app.state.services.inflight
+
+# --- SingleFlight Unit Tests ---
+
+def make_source(tokens, started, gate):
+    async def source():
+        started.append(True)
+        for token in tokens:
+            await gate.wait()
+            yield token
+    return source()
+
+def test_subscribers_share_one_upstream():
+    async def run_test():
+        flights = SingleFlight()
+        started = []
+        gate = asyncio.Event()
+        flight = flights.start("k", make_source(["a", "b", "c"], started, gate))
+
+        async def consume():
+            return b"".join([c async for c in flights.get("k").subscribe()]).decode()
+
+        tasks = [asyncio.create_task(consume()) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == ["abc"] * 3
+        assert len(started) == 1
+        assert flight.completed
+        assert flights.get("k") is None
+
+    asyncio.run(run_test())
+
+def test_late_joiner_replays_produced_chunks():
+    async def run_test():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def source():
+            yield "first "
+            await release.wait()
+            yield "second"
+
+        flight = flights.start("k", source())
+        early = flight.subscribe()
+        assert await early.__anext__() == b"first "
+
+        assert flights.get("k") is flight
+        late_task = asyncio.create_task(_collect(flight.subscribe()))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await early.__anext__() == b"second"
+        assert await late_task == "first second"
+
+    asyncio.run(run_test())
+
+async def _collect(gen):
+    return b"".join([c async for c in gen]).decode()
+
+def test_sinks_complete_once():
+    async def run_test():
+        flights = SingleFlight()
+        seen = []
+
+        async def source():
+            yield "x"
+
+        flight = flights.start("k", source())
+        flight.add_sink(PersistenceSink("sig", lambda sig, text: seen.append(text)))
+        await _collect(flight.subscribe())
+        await _collect(flight.subscribe())
+
+        assert seen == ["x"]
+
+    asyncio.run(run_test())
+
+def test_flight_marks_error_streams_failed():
+    async def run_test():
+        flights = SingleFlight()
+
+        async def source():
+            yield "partial"
+            yield "\n[SERVER_ERROR] An unexpected error occurred: boom"
+
+        flight = flights.start("k", source())
+        await _collect(flight.subscribe())
+        assert flight.failed
+
+    asyncio.run(run_test())
+
+def test_flight_over_cap_keeps_streaming_but_stops_joins():
+    async def run_test():
+        flights = SingleFlight(max_bytes=4)
+        release = asyncio.Event()
+
+        async def source():
+            yield "abc"
+            yield "defg"
+            await release.wait()
+            yield "h"
+
+        flight = flights.start("k", source())
+        early = flight.subscribe()
+        assert await early.__anext__() == b"abc"
+        assert await early.__anext__() == b"defg"
+
+        assert flight.tee.truncated
+        assert flights.get("k") is None
+
+        release.set()
+        assert await _collect(early) == "h"
+
+    asyncio.run(run_test())
+
+def test_join_waits_for_flight_being_opened():
+    async def run_test():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def opener():
+            async with flights.opening("k"):
+                await asyncio.sleep(0.01)
+                return flights.start("k", make_source(["x"], [], gate))
+
+        leader = asyncio.create_task(opener())
+        await asyncio.sleep(0)
+        joined = await flights.join("k")
+        assert joined is await leader
+        gate.set()
+        assert b"".join([c async for c in joined.subscribe()]) == b"x"
+
+    asyncio.run(run_test())
+
+def test_join_hands_over_when_opener_fails():
+    async def run_test():
+        flights = SingleFlight()
+
+        async def failing_opener():
+            async with flights.opening("k"):
+                await asyncio.sleep(0.01)
+                raise RuntimeError("no stream")
+
+        leader = asyncio.create_task(failing_opener())
+        await asyncio.sleep(0)
+        assert await flights.join("k") is None
+        with pytest.raises(RuntimeError):
+            await leader
+
+    asyncio.run(run_test())
+
+# --- API Integration Tests ---
+
+def test_concurrent_identical_requests_coalesce(base_headers, base_payload):
+    calls = []
+
+    async def slow_endpoint(*args, **kwargs):
+        calls.append(args)
+
+        async def gen():
+            for token in ["one ", "shared ", "stream"]:
+                await asyncio.sleep(0.01)
+                yield token
+
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    headers = base_headers.copy()
+    headers.update({
+        "x-use-local-provider": "true",
+        "x-default-local-provider": "test",
+    })
+
+    async def run_test():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*[
+                ac.post("/analyze", headers=headers, json=base_payload) for _ in range(4)
+            ])
+
+    with mock.patch.dict("backend.api.REQUEST_MAP", {"analyze_codesnippet_test": slow_endpoint}):
+        responses = asyncio.run(run_test())
+
+    assert [r.text for r in responses] == ["one shared stream"] * 4
+    assert sorted(r.headers["x-cache"] for r in responses) == ["COALESCED"] * 3 + ["MISS"]
+    assert len(calls) == 1
+    assert len(inflight) == 0
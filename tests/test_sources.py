@@ -0,0 +1,144 @@
+import asyncio
+import json
+import httpx
+import pytest
+from unittest import mock
+from backend.api import app
+from backend.content import trim_lines
+from backend.sources import SourceCache, SourceFile
+
+source_cache = app.state.services.source_cache
+
+REPO = "https://raw.githubusercontent.com/example/repo/main"
+FILE = "line1\r\nline2\nline3\r\n\nline5"
+
+# --- SourceFile Unit Tests ---
+
+@pytest.mark.parametrize("start,end", [(1, 1), (1, 2), (2, 4), (3, 5), (5, 9), (4, 4), (None, None)])
+def test_line_index_matches_trim_lines(start, end):
+    assert SourceFile("u", FILE).lines(start, end) == trim_lines(FILE, start, end)
+
+# --- SourceCache Unit Tests ---
+
+def make_transport(calls, body=FILE, etag='"v1"'):
+    def handler(request):
+        calls.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, text=body, headers={"ETag": etag})
+    return httpx.MockTransport(handler)
+
+def test_source_cache_revalidates_with_etag():
+    calls = []
+    cache = SourceCache(revalidate_after=60, transport=make_transport(calls))
+
+    async def run_test():
+        first = await cache.get(f"{REPO}/a.py")
+        assert await cache.get(f"{REPO}/a.py") is first
+        assert calls == [None]
+
+        first.checked_at -= 120
+        assert await cache.get(f"{REPO}/a.py") is first
+        assert calls == [None, '"v1"']
+        await cache.aclose()
+
+    asyncio.run(run_test())
+
+def test_source_cache_shares_concurrent_fetches():
+    calls = []
+    cache = SourceCache(transport=make_transport(calls))
+
+    async def run_test():
+        results = await asyncio.gather(*[cache.get(f"{REPO}/a.py") for _ in range(5)])
+        assert all(r is results[0] for r in results)
+        await cache.aclose()
+
+    asyncio.run(run_test())
+    assert len(calls) == 1
+
+def test_source_cache_fetch_survives_cancelled_caller():
+    calls = []
+    release = None
+
+    async def handler(request):
+        calls.append(request.url)
+        await release.wait()
+        return httpx.Response(200, text=FILE)
+
+    cache = SourceCache(transport=httpx.MockTransport(handler))
+
+    async def run_test():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.create_task(cache.get(f"{REPO}/a.py"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(cache.get(f"{REPO}/a.py"))
+        await asyncio.sleep(0.01)
+
+        # The first caller disconnects while the fetch is still running
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        release.set()
+
+        entry = await asyncio.wait_for(second, timeout=1)
+        assert entry.text == FILE
+        await cache.aclose()
+
+    asyncio.run(run_test())
+    assert len(calls) == 1
+
+# --- API Integration Tests ---
+
+@pytest.fixture
+def content_file(tmp_path):
+    path = tmp_path / "content.json"
+    path.write_text(json.dumps({"collection": [{
+        "project": "demo",
+        "data": [{"snippets": [
+            {"repoUrl": f"{REPO}/a.py", "lineStart": 2, "lineEnd": 3},
+            {"repoUrl": f"{REPO}/missing.py"},
+        ]}],
+    }]}))
+    with mock.patch("backend.content.CONTENT_PATH", str(path)):
+        yield path
+
+@pytest.fixture
+def mock_origin():
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        if request.url.path.endswith("missing.py"):
+            return httpx.Response(404)
+        return httpx.Response(200, text=FILE, headers={"ETag": '"v1"'})
+
+    with mock.patch.object(source_cache, "_transport", httpx.MockTransport(handler)):
+        yield calls
+
+def test_snippet_source_endpoint(client, content_file, mock_origin):
+    response = client.get("/snippets/source", params={"signature": f"{REPO}/a.py|2|3"})
+    assert response.status_code == 200
+    assert response.text == "line2\nline3"
+
+    source_cache.clear()
+    revalidated = client.get(
+        "/snippets/source",
+        params={"signature": f"{REPO}/a.py|2|3"},
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert revalidated.status_code == 304
+
+def test_snippet_source_refuses_unknown_urls(client, content_file, mock_origin):
+    response = client.get("/snippets/source", params={"signature": "http://169.254.169.254/latest||"})
+    assert response.status_code == 404
+    assert client.get("/snippets/source", params={"signature": "nonsense"}).status_code == 400
+    assert mock_origin == []
+
+def test_project_prefetch(client, content_file, mock_origin):
+    response = client.get("/snippets/sources", params={"project": "demo"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sources"] == {f"{REPO}/a.py|2|3": "line2\nline3"}
+    assert list(body["errors"]) == [f"{REPO}/missing.py||"]
+
+    assert client.get("/snippets/sources", params={"project": "nope"}).status_code == 404
@@ -0,0 +1,90 @@
+from backend.cache import ResponseCache
+from backend.streaming import CacheSink, PersistenceSink, StreamTee, TeeSink
+
+# --- StreamTee Unit Tests ---
+
+class RecordingSink(TeeSink):
+    def __init__(self):
+        self.seen = []
+        self.completed = 0
+
+    def on_chunk(self, data):
+        self.seen.append(data)
+
+    def on_complete(self, tee):
+        self.completed += 1
+
+def test_tee_encodes_once_and_shares_objects():
+    sink = RecordingSink()
+    tee = StreamTee(max_bytes=1024, sinks=[sink])
+
+    returned = [tee.feed("héllo "), tee.feed(b"world")]
+    tee.close(completed=True)
+
+    assert tee.text() == "héllo world"
+    assert all(a is b for a, b in zip(returned, tee.chunks))
+    assert all(a is b for a, b in zip(returned, sink.seen))
+    assert sink.completed == 1
+
+def test_tee_over_cap_releases_chunks():
+    sink = RecordingSink()
+    tee = StreamTee(max_bytes=5, sinks=[sink])
+    tee.feed("abc")
+    tee.feed("def")
+    tee.feed("g")
+
+    assert tee.truncated
+    assert tee.chunks == []
+    assert tee.size == 7
+    assert sink.seen == [b"abc", b"def", b"g"]
+
+def test_tee_skips_sinks_when_stream_aborts():
+    sink = RecordingSink()
+    tee = StreamTee(max_bytes=1024, sinks=[sink])
+    tee.feed("partial")
+    tee.close(completed=False)
+    assert sink.completed == 0
+
+def test_tee_isolates_failing_sinks():
+    class Broken(TeeSink):
+        def on_complete(self, tee):
+            raise RuntimeError("boom")
+
+    sink = RecordingSink()
+    tee = StreamTee(max_bytes=1024, sinks=[Broken(), sink])
+    tee.feed("x")
+    tee.close(completed=True)
+    assert sink.completed == 1
+
+def test_persistence_sink_skips_errors_and_truncation():
+    saved = []
+    save = lambda sig, text: saved.append((sig, text))
+
+    ok = StreamTee(1024, [PersistenceSink("sig", save)])
+    ok.feed("audit")
+    ok.close(True)
+
+    errored = StreamTee(1024, [PersistenceSink("sig", save)])
+    errored.feed("\n[API_ERROR] Gemini API Error: boom")
+    errored.close(True)
+
+    truncated = StreamTee(2, [PersistenceSink("sig", save)])
+    truncated.feed("audit")
+    truncated.close(True)
+
+    assert saved == [("sig", "audit")]
+
+def test_cache_sink_stores_encoded_chunks():
+    cache = ResponseCache(max_entries=4, max_bytes=1024, ttl=60)
+    tee = StreamTee(1024, [CacheSink(cache, "k")])
+    tee.feed("a")
+    tee.feed("b")
+    tee.close(True)
+
+    assert list(cache.get("k").chunks()) == [b"a", b"b"]
+
+    failed = StreamTee(1024, [CacheSink(cache, "f")])
+    failed.feed("ok")
+    failed.feed("\n[SERVER_ERROR] boom")
+    failed.close(True)
+    assert cache.get("f") is None
@@ -1,10 +1,21 @@
 import pytest
+import asyncio
 import base64
 import os
+from unittest import mock
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from backend.utils import decrypt_envelope
+from backend import utils
+from backend.utils import decrypt_envelope, decrypt_envelope_async
+
+@pytest.fixture(autouse=True)
+def clear_crypto_caches():
+    utils.dek_cache.clear()
+    utils.load_private_key.cache_clear()
+    yield
+    utils.dek_cache.clear()
+    utils.load_private_key.cache_clear()
 
 @pytest.fixture
 def rsa_keys():
@@ -78,3 +89,54 @@ def test_decrypt_envelope_malformed_input(rsa_keys):
     _, _, private_pem = rsa_keys
     decrypted = decrypt_envelope("not_b64", "not_b64", "not_b64", private_pem)
     assert decrypted == "error"
+
+def test_private_key_is_parsed_once(rsa_keys):
+    _, public_key, private_pem = rsa_keys
+
+    with mock.patch(
+        "backend.utils.serialization.load_pem_private_key",
+        wraps=serialization.load_pem_private_key,
+    ) as load:
+        for text in ["one", "two", "three"]:
+            assert decrypt_envelope(*encrypt_envelope(text, public_key), private_pem) == text
+
+    assert load.call_count == 1
+
+def test_reused_envelope_skips_rsa_unwrap(rsa_keys):
+    _, public_key, private_pem = rsa_keys
+    encrypted_dek, iv, ciphertext = encrypt_envelope("secret_api_key", public_key)
+
+    assert decrypt_envelope(encrypted_dek, iv, ciphertext, private_pem) == "secret_api_key"
+    assert len(utils.dek_cache) == 1
+
+    with mock.patch("backend.utils.load_private_key", side_effect=AssertionError("unwrapped again")):
+        assert decrypt_envelope(encrypted_dek, iv, ciphertext, private_pem) == "secret_api_key"
+
+def test_failed_decryption_is_not_cached(rsa_keys):
+    _, public_key, private_pem = rsa_keys
+    encrypted_dek, iv, _ = encrypt_envelope("secret_api_key", public_key)
+    _, _, foreign_ciphertext = encrypt_envelope("other", public_key)
+
+    assert decrypt_envelope(encrypted_dek, iv, foreign_ciphertext, private_pem) == "error"
+    assert len(utils.dek_cache) == 0
+
+def test_dek_cache_is_bounded():
+    cache = utils.DEKCache(max_entries=2)
+    for i in range(3):
+        cache.put(bytes([i]), b"dek")
+    assert len(cache) == 2
+    assert cache.get(bytes([0])) is None
+
+def test_decrypt_envelope_async_offloads_cold_unwrap(rsa_keys):
+    _, public_key, private_pem = rsa_keys
+    envelope = encrypt_envelope("secret_api_key", public_key)
+
+    async def run_test():
+        with mock.patch.object(utils, "_get_crypto_executor", wraps=utils._get_crypto_executor) as executor:
+            assert await decrypt_envelope_async(*envelope, private_pem) == "secret_api_key"
+            assert executor.call_count == 1
+            # Warm envelope is decrypted inline
+            assert await decrypt_envelope_async(*envelope, private_pem) == "secret_api_key"
+            assert executor.call_count == 1
+
+    asyncio.run(run_test())